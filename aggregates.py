@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence
+
+from segment_stats import QUANTILES, deviation_table, grouped_statistics, quantile_name, segment_statistics
+
+''' SEGMENT x DATE x HOUR CUBE '''
+
+# duration histogram bin edges (seconds), log spaced, used as a mergeable quantile sketch
+DURATION_BIN_EDGES = np.concatenate([[0.0], np.geomspace(1, 7200, 47)])
+CUBE_KEYS = ["route", "segment", "date", "hour"]
+STAT_COLUMNS = ["count", "sum", "sum_sq"]
+
+
+def _bin_columns(bin_edges:np.ndarray = DURATION_BIN_EDGES)->list:
+    return [f"bin_{i}" for i in range(len(bin_edges))]
+
+
+def _local_times(times:pd.Series)->pd.Series:
+    times = pd.to_datetime(times)
+    if times.dt.tz is not None:
+        times = times.dt.tz_localize(None)
+    return times
+
+
+def build_segment_cube(df:pd.DataFrame,
+                       time_col:str = "utcTime",
+                       value_col:str = "duration",
+                       bin_edges:np.ndarray = DURATION_BIN_EDGES)->pd.DataFrame:
+    # count / sum / sum of squares and a duration histogram per (route, segment, date, hour) cell.
+    # Segment names repeat across routes, so route is part of the key. All columns are additive,
+    # so cubes of different days can be merged by summing
+    times = _local_times(df[time_col])
+    values = df[value_col].to_numpy(dtype=np.float64)
+    bins = np.clip(np.searchsorted(bin_edges, values, side="right") - 1, 0, len(bin_edges) - 1)
+    cells = pd.DataFrame({"route": df["route"].astype(str).to_numpy(),
+                          "segment": df["segment"].to_numpy(),
+                          "date": times.dt.normalize().to_numpy(),
+                          "hour": times.dt.hour.to_numpy(dtype=np.int8),
+                          "bin": bins,
+                          "count": 1,
+                          "sum": values,
+                          "sum_sq": values ** 2})
+    cells = cells[~np.isnan(values)]
+
+    stats = cells.groupby(CUBE_KEYS, observed=True)[STAT_COLUMNS].sum()
+    hist = cells.groupby(CUBE_KEYS + ["bin"], observed=True).size().unstack("bin", fill_value=0)
+    hist = hist.reindex(columns=range(len(bin_edges)), fill_value=0)
+    hist.columns = _bin_columns(bin_edges)
+    return stats.join(hist.astype(np.int32))
+
+
+def merge_segment_cubes(*cubes:pd.DataFrame)->pd.DataFrame:
+    cubes = [cube for cube in cubes if cube is not None and len(cube) > 0]
+    if len(cubes) == 0:
+        return pd.DataFrame()
+    if len(cubes) == 1:
+        return cubes[0]
+    return pd.concat(cubes).groupby(level=CUBE_KEYS, observed=True).sum()
+
+
+def route_cube(cube:pd.DataFrame, route:str)->pd.DataFrame:
+    # cells of one route
+    if len(cube) == 0:
+        return cube
+    return cube[cube.index.get_level_values("route") == str(route)]
+
+
+def cube_filter_mask(index:pd.MultiIndex, segment_filter:tuple)->np.ndarray:
+    # segment_filter as built in the Visualisierung tab:
+    # (start_date, end_date, days_of_week, start_time, end_time), None entries do not filter.
+    # The time window is [start_time, end_time) at hour resolution
+    start_date, end_date, days_of_week, start_time, end_time = segment_filter
+    dates = index.get_level_values("date")
+    hours = index.get_level_values("hour")
+    mask = np.ones(len(index), dtype=bool)
+    if start_date is not None:
+        mask &= dates >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= dates <= pd.Timestamp(end_date)
+    if days_of_week:
+        mask &= dates.day_name().isin(list(days_of_week))
+    if start_time is not None:
+        mask &= hours >= start_time.hour
+    if end_time is not None:
+        mask &= hours < end_time.hour
+    return mask
+
+
+def filter_segment_data(df:pd.DataFrame,
+                        segment_filter:tuple,
+                        time_col:str = "utcTime")->pd.DataFrame:
+    # the same filter on raw segment-duration rows, reference for the cube results
+    times = _local_times(df[time_col])
+    index = pd.MultiIndex.from_arrays([times.dt.normalize(), times.dt.hour], names=["date", "hour"])
+    return df[cube_filter_mask(index, segment_filter)]
+
+
+def histogram_quantiles(hist:np.ndarray,
+                        quantiles:Sequence[float],
+                        bin_edges:np.ndarray = DURATION_BIN_EDGES)->np.ndarray:
+    # approximate quantiles per row of a (n, bins) histogram, linear inside a bin
+    hist = np.asarray(hist, dtype=np.float64)
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1:]
+    upper_edges = np.append(bin_edges[1:], bin_edges[-1])
+    out = np.full((len(hist), len(quantiles)), np.nan)
+    rows = np.arange(len(hist))
+    for j, q in enumerate(quantiles):
+        target = q * total[:, 0]
+        b = np.minimum((cum < target[:, None]).sum(axis=1), hist.shape[1] - 1)
+        below = np.where(b > 0, cum[rows, np.maximum(b - 1, 0)], 0.0)
+        in_bin = hist[rows, b]
+        frac = np.divide(target - below, in_bin, out=np.zeros_like(target), where=in_bin > 0)
+        out[:, j] = bin_edges[b] + frac * (upper_edges[b] - bin_edges[b])
+    out[total[:, 0] == 0] = np.nan
+    return out
+
+
+def summarize_cells(cells:pd.DataFrame,
+                    quantiles:Sequence[float] = QUANTILES,
+                    bin_edges:np.ndarray = DURATION_BIN_EDGES)->pd.DataFrame:
+    # count / mean / var / std / approximate quantiles from summed cube cells, the columns of
+    # segment_stats.segment_statistics
+    count = cells["count"].to_numpy(dtype=np.float64)
+    mean = cells["sum"].to_numpy() / count
+    var = np.clip((cells["sum_sq"].to_numpy() - count * mean ** 2) / np.where(count > 1, count - 1, np.nan), 0, None)
+    out = pd.DataFrame({"count": cells["count"].to_numpy(),
+                        "mean": mean,
+                        "var": var,
+                        "std": np.sqrt(var)}, index=cells.index)
+    q = histogram_quantiles(cells[_bin_columns(bin_edges)].to_numpy(), quantiles, bin_edges)
+    for j, quantile in enumerate(quantiles):
+        out[quantile_name(quantile)] = q[:, j]
+    return out
+
+
+def query_segment_cube(cube:pd.DataFrame,
+                       segment_filter:tuple,
+                       quantiles:Sequence[float] = QUANTILES,
+                       by:Optional[list] = None,
+                       route:Optional[str] = None)->pd.DataFrame:
+    # per-segment statistics for any filter tuple the UI can build, by summing cube cells of route
+    # (the cube must hold a single route when None, segment names repeat across routes).
+    # count / mean / var / std equal the pandas groupby on filter_segment_data, quantiles are approximate
+    by = by or ["segment"]
+    if route is not None:
+        cube = route_cube(cube, route)
+    cells = cube[cube_filter_mask(cube.index, segment_filter)]
+    cells = cells.groupby(level=by, observed=True).sum()
+    return summarize_cells(cells, quantiles)
+
+
+def compare_segment_cube(cube:pd.DataFrame,
+                         filter1:tuple,
+                         filter2:tuple,
+                         route:Optional[str] = None,
+                         metric:str = "mean")->tuple:
+    # compare_segment_stats answered from the cube cells of route instead of the raw rows
+    stats2 = query_segment_cube(cube, filter2, route=route)
+    stats1 = query_segment_cube(cube, filter1, route=route)
+    return deviation_table(stats1, stats2, metric), stats1, stats2
+
+
+''' DASHBOARD AGGREGATES '''
+
+SEGMENT_TYPES = ['bus_stop', 'stop_lines', 'road_path']
+
+
+def segment_type(segments:pd.Series)->np.ndarray:
+    # vectorized set_segment_type: haltestelle_* -> bus_stop, stop_lines_* -> stop_lines, rest road_path
+    segments = segments.astype(str)
+    return np.select([segments.str.startswith('haltestelle'), segments.str.startswith('stop_lines')],
+                     SEGMENT_TYPES[:2], default=SEGMENT_TYPES[2])
+
+
+def duration_labels(names:pd.Series, durations:pd.Series, unit:str = "seconds")->pd.Series:
+    # "<name><br><duration> seconds" bar labels
+    return names.astype(str) + "<br>" + durations.astype(str) + " " + unit
+
+
+def build_dashboard_aggregates(df:pd.DataFrame,
+                               quantiles:Sequence[float] = QUANTILES)->tuple:
+    # per segment and per segment type duration statistics (all segment_stats.METRICS) for the
+    # Armaturenbrett charts, computed once per dataset version straight from the dataset columns.
+    # 'duration' is the rounded mean; per type it is the mean of the segment means as before
+    durations = df['duration']
+    segments = df['segment'].astype('category')
+    codes = segments.cat.codes.to_numpy()
+    types = np.where(codes >= 0, segment_type(pd.Series(segments.cat.categories))[codes], None)
+
+    per_segment = grouped_statistics(durations, segments, quantiles)
+    per_segment = per_segment.rename_axis('segment').reset_index()
+    per_segment['segment'] = per_segment['segment'].astype(str)
+    per_segment['duration'] = per_segment['mean'].astype(np.float64).round(2)
+    per_segment['segment_type'] = segment_type(per_segment['segment'])
+    per_segment['text'] = duration_labels(per_segment['segment'], per_segment['duration'])
+
+    per_type = grouped_statistics(durations, types, quantiles)
+    per_type = per_type.rename_axis('segment_type').reset_index()
+    per_type['duration'] = per_segment.groupby('segment_type')['duration'].mean().reindex(per_type['segment_type']).round(2).to_numpy()
+    per_type['text'] = duration_labels(per_type['segment_type'], per_type['duration'])
+    return per_segment, per_type
+
+
+''' SEGMENT COMPARISON '''
+
+def compare_segment_stats(df:pd.DataFrame,
+                          filter1:tuple,
+                          filter2:tuple,
+                          metric:str = "mean")->tuple:
+    # deviation table of metric and the per-segment statistics of both filters, the pandas reference of
+    # the DuckDB backend. stats1 carries the deviation of every metric, so switching metric is a column lookup
+    stats2 = segment_statistics(filter_segment_data(df, filter2))
+    stats1 = segment_statistics(filter_segment_data(df, filter1), baseline=stats2)
+    return deviation_table(stats1, stats2, metric), stats1, stats2
@@ -0,0 +1,30 @@
+"""Scaling of utils.add_segment_col on synthetic route 101-like data.
+
+    python -m benchmarks.bench_add_segment_col --points 100000 1000000 10000000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_split_route, make_gps_points
+from utils import add_segment_col
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--road-paths", type=int, default=40)
+    args = parser.parse_args()
+
+    split_route = make_split_route(n_road_paths=args.road_paths)
+    for n_points in args.points:
+        gdf = make_gps_points(split_route, n_points)
+        start = time.perf_counter()
+        labelled = add_segment_col(gdf, split_route, distance_threshold=0.0005)
+        elapsed = time.perf_counter() - start
+        print(f"{n_points:>12,} points  {len(split_route):>4} segments  "
+              f"{elapsed:8.2f} s  {n_points / elapsed:>14,.0f} points/s  "
+              f"unassigned={labelled['segment'].isna().sum():,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Cost of one weekday / hour change in the Visualisierung tab: server rerun vs the client-side filter mode.
+
+The server path filters the rows, rebuilds the map and serializes it on every change. The client-side
+mode ships the map and a segment x weekday x hour aggregate once, aggregate_deviation stands in for the
+browser work of a change (the same computation as the JavaScript in client_filter.py).
+
+    python -m benchmarks.bench_client_filter --days 28 365
+"""
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from aggregates import build_segment_cube, compare_segment_stats
+from benchmarks.synthetic import make_split_route, make_segment_durations
+from client_filter import CLIENT_PALETTE, aggregate_deviation, client_filter_html, weekday_hour_aggregate
+from utils import build_NewMindFresh_figure
+
+START_DATE, END_DATE = datetime.date(2023, 10, 1), datetime.date(2024, 9, 30)
+SELECTIONS = [(["Wednesday"], 12, None), (["Monday", "Friday"], 6, 9), ([], 0, None)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 365])
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        df = make_segment_durations(split_route, days=days, runs_per_day=args.runs_per_day)
+        cube = build_segment_cube(df)
+        start = time.perf_counter()
+        aggregate = weekday_hour_aggregate(cube, START_DATE, END_DATE)
+        dt = aggregate_deviation(aggregate, *SELECTIONS[0])
+        fig = build_NewMindFresh_figure(dt.index.to_frame(index=False, name="segment"), dt, split_route, lw=13, palette=CLIENT_PALETTE)
+        html = client_filter_html(fig, aggregate, *SELECTIONS[0])
+        shipped = time.perf_counter() - start
+        print(f"{days:>4} days  {len(df):>10,} rows  client mode once={shipped * 1000:8.1f} ms  payload={len(html) / 2**10:8.1f} KiB")
+
+        for days_of_week, start_hour, end_hour in SELECTIONS:
+            filter1 = (START_DATE, END_DATE, days_of_week, datetime.time(start_hour), None if end_hour is None else datetime.time(end_hour))
+            filter2 = (START_DATE, END_DATE, days_of_week, None, None)
+            start = time.perf_counter()
+            expected, _, _ = compare_segment_stats(df, filter1, filter2)
+            fig = build_NewMindFresh_figure(expected.index.to_frame(index=False, name="segment"), expected, split_route, lw=13)
+            payload = len(fig.to_json())
+            server = time.perf_counter() - start
+            start = time.perf_counter()
+            result = aggregate_deviation(aggregate, days_of_week, start_hour, end_hour)
+            client = time.perf_counter() - start
+            result = result.reindex(expected.index)
+            difference = np.nanmax(np.abs(result["deviation"].to_numpy() - expected["deviation"].to_numpy()))
+            same_colour = np.mean([a == b for a, b in zip(result["rgba"], expected["rgba"])])
+            print(f"      {','.join(days_of_week) or 'all days':<16} {start_hour:02d}-{end_hour or 24:02d}  "
+                  f"server rerun={server * 1000:8.1f} ms ({payload / 2**10:8.1f} KiB)  client={client * 1000:6.2f} ms  "
+                  f"max deviation difference={difference:.1e}  same colour={same_colour:.1%}")
+
+
+if __name__ == "__main__":
+    main()
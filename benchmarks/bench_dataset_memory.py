@@ -0,0 +1,40 @@
+"""Memory of the segment dataset before and after utils.compact_segment_dataset.
+
+Shapely geometries are counted with their WKB size, GEOS keeps more than that,
+so the reported reduction is a lower bound.
+
+    python -m benchmarks.bench_dataset_memory --days 28 90
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.synthetic import make_split_route, make_segment_durations
+from utils import compact_segment_dataset, memory_report, segment_geometries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 90])
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        df = make_segment_durations(split_route, days=days)
+        # the shape fetch_filtered_segment_data produced before: object strings and shapely points
+        df["segment"] = df["segment"].astype(object)
+        df["speed"] = np.random.default_rng(0).uniform(0, 15, size=len(df))
+        df["geometry"] = split_route.geometry.centroid.reindex(df["segment"]).to_numpy()
+        compact = compact_segment_dataset(df, crs=split_route.crs)
+
+        before, after = memory_report(df), memory_report(compact)
+        print(f"{days:>4} days  {len(df):>10,} rows  {before.sum() / 2**20:9.1f} MB -> {after.sum() / 2**20:8.1f} MB  "
+              f"({before.sum() / after.sum():.1f}x)")
+        for col in before.index:
+            print(f"      {col:<10} {before[col] / 2**20:9.1f} MB -> {after[col] / 2**20:8.1f} MB")
+        assert compact.groupby("segment", observed=True)["duration"].mean().notna().all()
+        assert len(segment_geometries(compact.iloc[:10])) == 10
+
+
+if __name__ == "__main__":
+    main()
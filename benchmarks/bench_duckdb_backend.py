@@ -0,0 +1,68 @@
+"""Segment comparison on the pandas dataset vs the DuckDB backend at different thread counts.
+
+Reports the query time, the speedup over pandas, the traced Python peak and, for DuckDB,
+the memory held by its buffer manager (not visible to tracemalloc).
+
+    python -m benchmarks.bench_duckdb_backend --days 28 365 --threads 1 2 4 8
+"""
+import argparse
+import datetime
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from aggregates import compare_segment_stats
+from benchmarks.synthetic import make_dataset_files
+from duckdb_backend import SegmentQueryEngine
+from utils import fetch_filtered_segment_data
+
+FILTER_1 = (datetime.date(2023, 10, 1), datetime.date(2024, 9, 30), ["Wednesday"], datetime.time(12, 0), None)
+FILTER_2 = (datetime.date(2023, 10, 1), datetime.date(2024, 9, 30), ["Wednesday"], None, None)
+
+
+def measure(fn, repeat:int = 3)->tuple:
+    # best wall clock of repeat runs, traced peak (MB) of one more run and its result
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak / 2**20, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 365])
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for days in args.days:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = make_dataset_files(tmp, days=days, runs_per_day=args.runs_per_day)["paths"]
+            dataset = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+            pandas_seconds, pandas_peak, (expected, _, _) = measure(lambda: compare_segment_stats(dataset, FILTER_1, FILTER_2), args.repeat)
+            print(f"{days:>4} days  {len(dataset):>10,} rows")
+            print(f"      pandas          {pandas_seconds * 1000:8.1f} ms  peak={pandas_peak:7.1f} MB")
+            for threads in args.threads:
+                start = time.perf_counter()
+                engine = SegmentQueryEngine.from_parquet(paths["gps_labeled"], paths["segment_duration"], threads=threads)
+                load = time.perf_counter() - start
+                seconds, peak, (dt, _, _) = measure(lambda: engine.compare_segment_durations(FILTER_1, FILTER_2), args.repeat)
+                segments = expected.index.astype(str)
+                equal = (len(dt) == len(expected)
+                         and np.allclose(dt["deviation"].reindex(segments), expected["deviation"], equal_nan=True))
+                print(f"      duckdb x{threads:<2}       {seconds * 1000:8.1f} ms  peak={peak:7.1f} MB  "
+                      f"duckdb={engine.memory_usage() / 2**20:7.1f} MB  load={load:6.2f} s  "
+                      f"speedup={pandas_seconds / seconds:6.2f}x  equal={equal}")
+
+
+if __name__ == "__main__":
+    main()
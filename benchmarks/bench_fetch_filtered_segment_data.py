@@ -0,0 +1,68 @@
+"""Wall clock and peak RSS of utils.fetch_filtered_segment_data vs the former per-point merge.
+
+Each variant runs in a fresh process so that ru_maxrss is its own peak.
+
+    python -m benchmarks.bench_fetch_filtered_segment_data --days 7 28
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import geopandas as gpd
+import pandas as pd
+
+from benchmarks.synthetic import make_split_route, make_segment_durations, make_labelled_gps
+from utils import fetch_filtered_segment_data
+
+
+def legacy_fetch(gps_path, segment_path):
+    # the join before the traversal summary: one merged row per GPS point, copied back by position
+    gdf = gpd.read_parquet(gps_path).reset_index()
+    df_segment = pd.read_parquet(segment_path).reset_index()
+    merged_df = pd.merge(df_segment, gdf[['run', 'segment', 'route', 'geometry', 'utcTime', 'speed']], on=['run', 'segment', 'route'])
+    df_segment['geometry'] = merged_df['geometry']
+    df_segment['utcTime'] = merged_df['utcTime']
+    df_segment['speed'] = merged_df['speed']
+    return df_segment
+
+
+def _run(fetch, gps_path, segment_path, queue):
+    start = time.perf_counter()
+    df = fetch(gps_path, segment_path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(df)))
+
+
+def measure(fetch, gps_path, segment_path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(fetch, gps_path, segment_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 28])
+    parser.add_argument("--pings-per-segment", type=int, default=5)
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        with tempfile.TemporaryDirectory() as tmp:
+            segment_durations = make_segment_durations(split_route, days=days)
+            gps = make_labelled_gps(split_route, segment_durations, args.pings_per_segment)
+            gps_path, segment_path = os.path.join(tmp, "gps.parquet"), os.path.join(tmp, "segments.parquet")
+            gps.to_parquet(gps_path)
+            segment_durations.drop(columns="utcTime").to_parquet(segment_path)
+            for name, fetch in (("legacy", legacy_fetch), ("traversal", fetch_filtered_segment_data)):
+                elapsed, peak_mb, rows = measure(fetch, gps_path, segment_path)
+                print(f"{days:>4} days  {len(gps):>11,} pings  {name:<10} {elapsed:7.2f} s  peak RSS {peak_mb:8.1f} MB  rows={rows:,}")
+
+
+if __name__ == "__main__":
+    main()
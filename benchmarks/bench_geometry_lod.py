@@ -0,0 +1,37 @@
+"""Vertex count, figure size and render time of the split route map per level of detail.
+
+    python -m benchmarks.bench_geometry_lod --road-paths 200 --vertices 200
+"""
+import argparse
+import time
+
+import plotly.graph_objects as go
+
+from benchmarks.synthetic import make_split_route, make_deviation_table
+from utils import LOD_ZOOM_LEVELS, lod_tolerance, plot_add_split_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--road-paths", type=int, default=200)
+    parser.add_argument("--vertices", type=int, default=200)
+    args = parser.parse_args()
+
+    split_route = make_split_route(n_road_paths=args.road_paths, vertices_per_segment=args.vertices)
+    df_deviation = make_deviation_table(split_route)
+    gdf = split_route.reset_index()[["segment"]]
+    for zoom in (None,) + LOD_ZOOM_LEVELS:
+        tolerance = 0.0 if zoom is None else lod_tolerance(zoom)
+        start = time.perf_counter()
+        fig = go.Figure()
+        plot_add_split_path(fig, [gdf], df_deviation, split_route, lw=13, tolerance=tolerance)
+        payload = fig.to_json()
+        elapsed = time.perf_counter() - start
+        vertices = sum(len(trace.lon) for trace in fig.data)
+        label = "full" if zoom is None else f"z{zoom}"
+        print(f"{label:<5} tolerance={tolerance:.2e}  vertices={vertices:>9,}  "
+              f"json={len(payload) / 1024:>9.1f} KiB  build+serialize={elapsed:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
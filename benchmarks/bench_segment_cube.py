@@ -0,0 +1,47 @@
+"""Filter queries on the raw segment-duration rows vs the segment x date x hour cube.
+
+    python -m benchmarks.bench_segment_cube --days 28 365
+"""
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from aggregates import build_segment_cube, filter_segment_data, query_segment_cube
+from benchmarks.synthetic import make_split_route, make_segment_durations
+
+FILTERS = [
+    (datetime.date(2023, 10, 10), datetime.date(2023, 11, 20), ["Wednesday"], datetime.time(12, 0), None),
+    (datetime.date(2023, 10, 1), datetime.date(2024, 9, 30), ["Monday", "Friday"], datetime.time(6, 0), datetime.time(9, 0)),
+    (datetime.date(2023, 10, 1), datetime.date(2024, 9, 30), [], None, None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 365])
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        df = make_segment_durations(split_route, days=days, runs_per_day=args.runs_per_day)
+        start = time.perf_counter()
+        cube = build_segment_cube(df)
+        build = time.perf_counter() - start
+        print(f"{days:>4} days  {len(df):>10,} rows  cube={len(cube):>8,} cells  build={build:6.2f} s")
+        for segment_filter in FILTERS:
+            start = time.perf_counter()
+            expected = filter_segment_data(df, segment_filter).groupby("segment")["duration"].agg(["count", "mean"])
+            raw = time.perf_counter() - start
+            start = time.perf_counter()
+            result = query_segment_cube(cube, segment_filter)
+            cubed = time.perf_counter() - start
+            equal = (expected["count"].equals(result["count"].reindex(expected.index))
+                     and np.allclose(expected["mean"], result["mean"].reindex(expected.index)))
+            print(f"      raw={raw * 1000:8.1f} ms  cube={cubed * 1000:8.1f} ms  equal={equal}")
+
+
+if __name__ == "__main__":
+    main()
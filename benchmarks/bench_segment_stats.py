@@ -0,0 +1,54 @@
+"""Per-segment statistics of segment_statistics (one groupby, all quantiles in one call) vs a groupby per
+metric, and the deviation colouring.
+
+    python -m benchmarks.bench_segment_stats --days 28 365
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_split_route, make_segment_durations
+from segment_stats import deviation_colors, segment_statistics
+
+
+def pandas_statistics(df:pd.DataFrame)->pd.DataFrame:
+    grouped = df.groupby("segment", observed=True)["duration"]
+    stats = grouped.agg(["count", "mean", "var", "std", "median"])
+    for q in (0.85, 0.95):
+        stats[f"p{round(q * 100)}"] = grouped.quantile(q)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 365])
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        df = make_segment_durations(split_route, days=days, runs_per_day=args.runs_per_day)
+        df["segment"] = df["segment"].astype("category")
+        start = time.perf_counter()
+        expected = pandas_statistics(df)
+        grouped = time.perf_counter() - start
+        start = time.perf_counter()
+        result = segment_statistics(df)
+        statistics = time.perf_counter() - start
+        equal = all(np.allclose(expected[c], result[c].reindex(expected.index), equal_nan=True) for c in expected.columns)
+        print(f"{days:>4} days  {len(df):>10,} rows  groupby={grouped * 1000:8.1f} ms  segment_statistics={statistics * 1000:8.1f} ms  equal={equal}")
+
+    deviation = np.random.default_rng(0).normal(0, 0.2, size=100_000)
+    start = time.perf_counter()
+    [(0, 153, 0, 1) if d < 0.1 else (255, 165, 0, 1) if d < 0.25 else (204, 0, 0, 1) for d in deviation]
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    deviation_colors(deviation)
+    vectorized = time.perf_counter() - start
+    print(f"colours of {len(deviation):,} segments  loop={loop * 1000:8.1f} ms  lookup={vectorized * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
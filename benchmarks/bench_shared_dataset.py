@@ -0,0 +1,82 @@
+"""Private memory per process: each process loading its own segment dataset vs mapping the shared Arrow file.
+
+Starts the processes with spawn (nothing inherited from the parent) and reads their private and
+proportional set size from /proc/self/smaps_rollup, so Linux only.
+
+    python -m benchmarks.bench_shared_dataset --days 90 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from benchmarks.synthetic import make_dataset_files
+
+
+def memory_kb()->dict:
+    # Rss / Pss / Private_Clean + Private_Dirty of the calling process in kB
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return dict(rss=values.get("Rss", 0), pss=values.get("Pss", 0),
+                private=values.get("Private_Clean", 0) + values.get("Private_Dirty", 0))
+
+
+def load_in_process(mode:str, paths:dict, shared_path:str, barrier, results)->None:
+    from shared_dataset import open_shared_dataset
+    from utils import fetch_filtered_segment_data
+    before = memory_kb()
+    if mode == "shared":
+        df = open_shared_dataset(shared_path)
+    else:
+        df = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+    # touch every row, like a full-range query of the dashboard
+    df.groupby("segment", observed=True)["duration"].mean()
+    # measure while all processes hold the dataset, so the shared pages are split between them
+    barrier.wait()
+    after = memory_kb()
+    barrier.wait()
+    results.put({key: (after[key] - before[key]) / 1024 for key in after})
+
+
+def run(mode:str, paths:dict, shared_path:str, processes:int)->list:
+    context = multiprocessing.get_context("spawn")
+    barrier, results = context.Barrier(processes), context.Queue()
+    workers = [context.Process(target=load_in_process, args=(mode, paths, shared_path, barrier, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    out = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    from shared_dataset import write_shared_dataset
+    from utils import fetch_filtered_segment_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_dataset_files(tmp, days=args.days, runs_per_day=args.runs_per_day)["paths"]
+        dataset = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+        shared_path = os.path.join(tmp, "segments.arrow")
+        write_shared_dataset(dataset, shared_path)
+        print(f"{args.days:>4} days  {len(dataset):>10,} rows  shared file {os.path.getsize(shared_path) / 2**20:.1f} MB")
+        for mode in ("private", "shared"):
+            results = run(mode, paths, shared_path, args.processes)
+            private = sum(r["private"] for r in results)
+            pss = sum(r["pss"] for r in results)
+            print(f"      {mode:<8} x{args.processes}  private={private:8.1f} MB  pss={pss:8.1f} MB  "
+                  f"per process private={private / args.processes:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
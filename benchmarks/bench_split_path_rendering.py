@@ -0,0 +1,39 @@
+"""Per-segment vs batched traces in utils.plot_add_split_path.
+
+Reports trace count, figure JSON size (what st.plotly_chart ships to the browser)
+and the time to build and serialize the figure.
+
+    python -m benchmarks.bench_split_path_rendering --road-paths 40 200
+"""
+import argparse
+import time
+
+import plotly.graph_objects as go
+
+from benchmarks.synthetic import make_split_route, make_deviation_table
+from utils import plot_add_split_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--road-paths", type=int, nargs="+", default=[40, 200])
+    args = parser.parse_args()
+
+    for n_road_paths in args.road_paths:
+        split_route = make_split_route(n_road_paths=n_road_paths)
+        df_deviation = make_deviation_table(split_route)
+        gdf = split_route.reset_index()[["segment"]]
+        for batched in (False, True):
+            start = time.perf_counter()
+            fig = go.Figure()
+            plot_add_split_path(fig, [gdf], df_deviation, split_route, lw=13, batched=batched)
+            built = time.perf_counter()
+            payload = fig.to_json()
+            serialized = time.perf_counter()
+            print(f"{len(split_route):>5} segments  batched={str(batched):<5}  "
+                  f"traces={len(fig.data):>5}  json={len(payload) / 1024:>9.1f} KiB  "
+                  f"build={built - start:7.3f} s  to_json={serialized - built:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Throughput of the streaming trip reconstruction in pings per second, checked against the batch path.
+
+Replays synthetic labelled pings in time order through streaming.LiveSegmentDelays and compares
+the reconstructed traversals with utils.segment_durations_from_traversals on the same pings.
+
+    python -m benchmarks.bench_streaming --days 7 --batch-size 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_labelled_gps, make_segment_durations, make_split_route
+from streaming import LiveSegmentDelays, replay_pings, traversals_frame
+from utils import GPS_COLUMNS, add_segment_col, segment_durations_from_traversals, summarize_segment_traversals
+
+DISTANCE_THRESHOLD = 0.0005
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    parser.add_argument("--pings-per-segment", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    durations = make_segment_durations(split_route, days=args.days, runs_per_day=args.runs_per_day)
+    gps = make_labelled_gps(split_route, durations, args.pings_per_segment)
+    batches = {batch_size: list(replay_pings(gps, batch_size)) for batch_size in args.batch_size}
+
+    # batch reference on the same pings
+    labelled = add_segment_col(gps.drop(columns="segment"), split_route, distance_threshold=DISTANCE_THRESHOLD)
+    labelled = labelled[labelled["segment"].notna()]
+    expected = segment_durations_from_traversals(summarize_segment_traversals(labelled[GPS_COLUMNS]))
+    expected = expected.groupby("segment", observed=True)["duration"].mean()
+    print(f"{len(gps):>10,} pings  {len(expected)} segments")
+
+    for batch_size, pings in batches.items():
+        live = LiveSegmentDelays(routes=("101",), distance_threshold=DISTANCE_THRESHOLD, split_routes={"101": split_route})
+        finished, max_active = [], 0
+        start = time.perf_counter()
+        for batch in pings:
+            finished += live.process(batch)
+            max_active = max(max_active, live.active_runs())
+        finished += live.trips.expire(np.iinfo(np.int64).max)
+        seconds = time.perf_counter() - start
+
+        result = traversals_frame(finished).groupby("segment")["duration"].mean().reindex(expected.index.astype(str))
+        error = np.nanmean(np.abs(result.to_numpy() - expected.to_numpy()) / expected.to_numpy())
+        print(f"      batch={batch_size:>6}  {len(gps) / seconds:>12,.0f} pings/s  traversals={len(finished):>9,}  "
+              f"max active runs={max_active:>5}  late pings={live.trips.late_pings:>6}  mean error={error:.2%}")
+
+
+if __name__ == "__main__":
+    main()
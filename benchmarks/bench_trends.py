@@ -0,0 +1,63 @@
+"""Rolling window trends from the daily rollups vs filtering the raw rows per day, and appending a day.
+
+    python -m benchmarks.bench_trends --days 28 365
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import SEGMENT_TYPES, build_segment_cube, segment_type
+from benchmarks.synthetic import make_split_route, make_segment_durations
+from trends import ROLLING_WINDOWS, SegmentTrends, daily_rollup
+
+
+def raw_trend(df:pd.DataFrame, window:int)->pd.DataFrame:
+    # rolling mean per segment type by filtering the rows of each window
+    dates = df["utcTime"].dt.normalize()
+    types = pd.Series(segment_type(df["segment"]), index=df.index)
+    out = {}
+    for day in pd.date_range(dates.min(), dates.max(), freq="D"):
+        rows = (dates > day - pd.Timedelta(days=window)) & (dates <= day)
+        out[day] = df.loc[rows, "duration"].groupby(types[rows]).mean()
+    return pd.DataFrame(out).T.reindex(columns=SEGMENT_TYPES)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[28, 365])
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    args = parser.parse_args()
+
+    split_route = make_split_route()
+    for days in args.days:
+        df = make_segment_durations(split_route, days=days + 1, runs_per_day=args.runs_per_day)
+        last_day = df["utcTime"].dt.normalize() == df["utcTime"].dt.normalize().max()
+        history, appended = df[~last_day], df[last_day]
+        cube = build_segment_cube(history)
+        start = time.perf_counter()
+        trends = SegmentTrends.from_cube(cube)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        trends.add(daily_rollup(build_segment_cube(appended)))
+        append = time.perf_counter() - start
+        print(f"{days:>4} days  {len(df):>10,} rows  rollups build={build * 1000:8.1f} ms  append one day={append * 1000:8.1f} ms")
+
+        for window in ROLLING_WINDOWS:
+            start = time.perf_counter()
+            expected = raw_trend(df, window)
+            raw = time.perf_counter() - start
+            start = time.perf_counter()
+            result = trends.trend(SEGMENT_TYPES, by="segment_type", window=window)
+            rolled = time.perf_counter() - start
+            start = time.perf_counter()
+            trends.trend(list(trends.segments.get_level_values("segment")), window=window)
+            segments = time.perf_counter() - start
+            equal = np.allclose(expected.to_numpy(), result.reindex(expected.index).to_numpy(), equal_nan=True)
+            print(f"      window={window:>3}  raw={raw * 1000:8.1f} ms  rollups={rolled * 1000:8.2f} ms  "
+                  f"all segments={segments * 1000:8.2f} ms  equal={equal}")
+
+
+if __name__ == "__main__":
+    main()
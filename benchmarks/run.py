@@ -0,0 +1,128 @@
+"""Benchmark suite of the dashboard hot paths on synthetic Ingolstadt-like data.
+
+Runs offline, without the INVG data, and writes the results as JSON so that runs of
+different commits can be compared:
+
+    python -m benchmarks.run --days 28 --output bench_results.json
+    python -m benchmarks.run --days 28 --compare bench_results.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import plotly.graph_objects as go
+
+from aggregates import build_dashboard_aggregates, build_segment_cube, filter_segment_data, query_segment_cube
+from benchmarks.synthetic import make_dataset_files, make_deviation_table
+from segment_stats import segment_statistics
+from utils import (add_segment_col, fetch_filtered_segment_data, list_of_geometries_to_single_list,
+                   plot_add_split_path, plot_NewMindFresh)
+
+# the default Visualisierung filter: Mittwoch from 12:00
+DASHBOARD_FILTER = (datetime.date(2023, 10, 1), datetime.date(2024, 9, 30), ["Wednesday"], datetime.time(12, 0), None)
+
+
+def measure(fn, repeat:int = 3)->dict:
+    # wall clock of each repetition and the peak of traced (Python + numpy) allocations of one extra run
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    del result
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(seconds=seconds, min=min(seconds), median=float(np.median(seconds)), peak_mb=peak / 2**20)
+
+
+def split_path_figure_json(dataset, df_deviation, split_route)->str:
+    fig = go.Figure()
+    plot_add_split_path(fig, [dataset], df_deviation, split_route, lw=13)
+    return fig.to_json()
+
+
+def benchmark_cases(data:dict)->list:
+    paths, split_route, gps = data["paths"], data["split_route"], data["gps"]
+    dataset = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+    cube = build_segment_cube(dataset)
+    df_deviation = make_deviation_table(split_route)
+    pings = gps.drop(columns="segment")
+    return [
+        ("fetch_filtered_segment_data", lambda: fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])),
+        ("add_segment_col", lambda: add_segment_col(pings, split_route, distance_threshold=0.0005)),
+        ("filter_segment_data", lambda: filter_segment_data(dataset, DASHBOARD_FILTER)
+            .groupby("segment", observed=True)["duration"].agg(["count", "mean"])),
+        ("build_segment_cube", lambda: build_segment_cube(dataset)),
+        ("query_segment_cube", lambda: query_segment_cube(cube, DASHBOARD_FILTER)),
+        ("build_dashboard_aggregates", lambda: build_dashboard_aggregates(dataset)),
+        ("segment_statistics", lambda: segment_statistics(dataset)),
+        ("list_of_geometries_to_single_list", lambda: list_of_geometries_to_single_list(split_route)),
+        ("plot_NewMindFresh", lambda: plot_NewMindFresh(dataset, df_deviation, split_route, lw=13)),
+        ("split_path_figure_json", lambda: split_path_figure_json(dataset, df_deviation, split_route)),
+    ]
+
+
+def git_commit()->str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results:dict, baseline:dict)->None:
+    baseline = {case["name"]: case for case in baseline["results"]}
+    for case in results["results"]:
+        if case["name"] in baseline:
+            old = baseline[case["name"]]
+            print(f"{case['name']:<36} {old['min'] / case['min']:6.2f}x time  "
+                  f"{old['peak_mb'] / max(case['peak_mb'], 1e-9):6.2f}x memory")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--runs-per-day", type=int, default=60)
+    parser.add_argument("--pings-per-segment", type=int, default=5)
+    parser.add_argument("--road-paths", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", default=None, help="names of the cases to run")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="results JSON of an earlier run")
+    args = parser.parse_args()
+
+    params = dict(days=args.days, runs_per_day=args.runs_per_day,
+                  pings_per_segment=args.pings_per_segment, road_paths=args.road_paths)
+    results = dict(meta=dict(commit=git_commit(), python=platform.python_version(), platform=platform.platform(),
+                             timestamp=datetime.datetime.now().isoformat(timespec="seconds"), params=params),
+                   results=[])
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset_files(tmp, days=args.days, runs_per_day=args.runs_per_day,
+                                  pings_per_segment=args.pings_per_segment, n_road_paths=args.road_paths)
+        for name, fn in benchmark_cases(data):
+            if args.only and name not in args.only:
+                continue
+            case = dict(name=name, **measure(fn, args.repeat))
+            results["results"].append(case)
+            print(f"{name:<36} min={case['min']:8.3f} s  median={case['median']:8.3f} s  peak={case['peak_mb']:8.1f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import LineString
+
+# Ingolstadt centre, same as the map center in plot_NewMindFresh
+CENTER_LON, CENTER_LAT = 11.441815, 48.772619
+
+
+def make_split_route(n_road_paths:int = 40,
+                     vertices_per_segment:int = 20,
+                     seed:int = 0,
+                     crs:str = "EPSG:4326")->gpd.GeoDataFrame:
+    # random walk through the city, cut into road_path / stop_lines / haltestelle segments
+    rng = np.random.default_rng(seed)
+    n_segments = n_road_paths * 2
+    steps = rng.normal(0, 0.0003, size=(n_segments * vertices_per_segment, 2)) + [0.0002, 0.00005]
+    coords = np.cumsum(steps, axis=0) + [CENTER_LON - 0.02, CENTER_LAT - 0.005]
+
+    names, geometries = [], []
+    for i in range(n_segments):
+        part = coords[i * vertices_per_segment:(i + 1) * vertices_per_segment + 1]
+        if i % 2 == 0:
+            names.append(f"road_path_{i // 2}")
+        elif i % 4 == 1:
+            names.append(f"stop_lines_{i // 4 + 1}")
+        else:
+            names.append(f"haltestelle_{i // 4}")
+        geometries.append(LineString(part))
+    return gpd.GeoDataFrame(geometry=geometries, index=pd.Index(names, name="segment"), crs=crs)
+
+
+def make_gps_points(split_route:gpd.GeoDataFrame,
+                    n_points:int,
+                    noise:float = 0.00005,
+                    seed:int = 0)->gpd.GeoDataFrame:
+    # GPS pings scattered along the route with some positional noise
+    rng = np.random.default_rng(seed)
+    route = LineString(shapely.get_coordinates(np.asarray(split_route.geometry)))
+    points = shapely.get_coordinates(shapely.line_interpolate_point(route, rng.uniform(0, route.length, size=n_points)))
+    x = points[:, 0] + rng.normal(0, noise, size=n_points)
+    y = points[:, 1] + rng.normal(0, noise, size=n_points)
+    return gpd.GeoDataFrame({"speed": rng.uniform(0, 15, size=n_points).astype("float32")},
+                            geometry=gpd.points_from_xy(x, y), crs=split_route.crs)
+
+
+def make_deviation_table(split_route:gpd.GeoDataFrame,
+                         n_colors:int = 5,
+                         seed:int = 0)->pd.DataFrame:
+    # stand-in for the dt table of compare_segment_durations: deviation and rgba per segment
+    rng = np.random.default_rng(seed)
+    palette = [(int(255 * t), int(255 * (1 - t)), 0, 1) for t in np.linspace(0, 1, n_colors)]
+    deviation = rng.normal(0, 1, size=len(split_route))
+    bins = np.clip(((deviation + 2) / 4 * n_colors).astype(int), 0, n_colors - 1)
+    return pd.DataFrame({"deviation": deviation,
+                         "rgba": [palette[b] for b in bins]},
+                        index=split_route.index)
+
+
+def make_segment_durations(split_route:gpd.GeoDataFrame,
+                           days:int = 28,
+                           runs_per_day:int = 60,
+                           start:str = "2023-10-01",
+                           route:str = "101",
+                           seed:int = 0)->pd.DataFrame:
+    # one row per (run, segment) traversal, like the SEGMENT_DURATION_PATH table joined with utcTime
+    rng = np.random.default_rng(seed)
+    segments = split_route.index.to_numpy()
+    n_runs = days * runs_per_day
+    run_start = (pd.Timestamp(start)
+                 + pd.to_timedelta(np.repeat(np.arange(days), runs_per_day), unit="D")
+                 + pd.to_timedelta(rng.uniform(5, 23, size=n_runs), unit="h"))
+    base = rng.gamma(4, 10, size=len(segments))
+    durations = rng.gamma(4, 1, size=(n_runs, len(segments))) * base / 4
+    offsets = np.cumsum(durations, axis=1) - durations
+    return pd.DataFrame({
+        "run": np.repeat(np.arange(n_runs), len(segments)).astype(str),
+        "segment": np.tile(segments, n_runs),
+        "route": route,
+        "duration": durations.ravel(),
+        "utcTime": np.repeat(run_start.to_numpy(), len(segments)) + pd.to_timedelta(offsets.ravel(), unit="s"),
+    })
+
+
+def make_labelled_gps(split_route:gpd.GeoDataFrame,
+                      segment_durations:pd.DataFrame,
+                      pings_per_segment:int = 5,
+                      seed:int = 0)->gpd.GeoDataFrame:
+    # GPS pings of every traversal in segment_durations, placed along its segment, like GPS_DATA_LABELED
+    rng = np.random.default_rng(seed)
+    n = len(segment_durations) * pings_per_segment
+    traversal = np.repeat(np.arange(len(segment_durations)), pings_per_segment)
+    fraction = rng.uniform(0, 1, size=n)
+    segment_position = split_route.index.get_indexer(segment_durations["segment"].to_numpy())[traversal]
+    lines = np.asarray(split_route.geometry)[segment_position]
+    points = shapely.line_interpolate_point(lines, fraction, normalized=True)
+    duration = segment_durations["duration"].to_numpy()[traversal]
+    return gpd.GeoDataFrame({
+        "run": segment_durations["run"].to_numpy()[traversal],
+        "segment": segment_durations["segment"].to_numpy()[traversal],
+        "route": segment_durations["route"].to_numpy()[traversal],
+        "utcTime": segment_durations["utcTime"].to_numpy()[traversal] + pd.to_timedelta(fraction * duration, unit="s"),
+        "speed": rng.uniform(0, 15, size=n).astype("float32"),
+    }, geometry=points, crs=split_route.crs)
+
+
+def make_dataset_files(directory:str,
+                       days:int = 28,
+                       runs_per_day:int = 60,
+                       pings_per_segment:int = 5,
+                       n_road_paths:int = 40,
+                       seed:int = 0)->dict:
+    # writes an offline stand-in for the INVG data (split route, labelled GPS, segment durations,
+    # raw GPS partitions) and returns the paths together with the in-memory frames
+    os.makedirs(directory, exist_ok=True)
+    split_route = make_split_route(n_road_paths=n_road_paths, seed=seed)
+    segment_durations = make_segment_durations(split_route, days=days, runs_per_day=runs_per_day, seed=seed)
+    gps = make_labelled_gps(split_route, segment_durations, pings_per_segment, seed=seed)
+
+    paths = dict(split_route=os.path.join(directory, "split_route.parquet"),
+                 gps_labeled=os.path.join(directory, "gps_labeled.parquet"),
+                 segment_duration=os.path.join(directory, "segment_duration.parquet"),
+                 gps_raw=os.path.join(directory, "gps_raw") + os.sep)
+    split_route.to_parquet(paths["split_route"])
+    gps.to_parquet(paths["gps_labeled"])
+    segment_durations.drop(columns="utcTime").to_parquet(paths["segment_duration"])
+    os.makedirs(paths["gps_raw"], exist_ok=True)
+    days_of_ping = gps["utcTime"].dt.normalize()
+    for day, pings in gps.drop(columns="segment").groupby(days_of_ping):
+        pings.to_parquet(os.path.join(paths["gps_raw"], f"{day:%Y-%m-%d}.parquet"))
+    return dict(paths=paths, split_route=split_route, segment_durations=segment_durations, gps=gps)
@@ -0,0 +1,180 @@
+import json
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from aggregates import cube_filter_mask
+from segment_stats import DEVIATION_BINS, DEVIATION_COLORS, NO_DATA_COLOR, deviation_table
+
+# weekday order of pandas dayofweek, with the labels of the Visualisierung multiselect
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKDAY_LABELS = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
+# decimals of the duration sums sent to the browser: the mean of any selection is then off by at most
+# 0.005 s, far below what moves a deviation (shown with two decimals) across the DEVIATION_BINS
+SUM_DECIMALS = 2
+
+
+def weekday_hour_aggregate(cube:pd.DataFrame,
+                           start_date=None,
+                           end_date=None,
+                           segments:Optional[Sequence[str]] = None)->dict:
+    # count and duration sum per segment x weekday x hour over the cube dates in [start_date, end_date]:
+    # everything the browser needs to evaluate any weekday / hour filter of that date range
+    cells = cube[cube_filter_mask(cube.index, (start_date, end_date, None, None, None))]
+    names = cells.index.get_level_values("segment").astype(str)
+    segments = pd.Index(sorted(names.unique()) if segments is None else segments)
+    position = segments.get_indexer(names)
+    keep = position >= 0
+    index = (position[keep],
+             cells.index.get_level_values("date").dayofweek.to_numpy()[keep],
+             cells.index.get_level_values("hour").to_numpy(dtype=np.int64)[keep])
+    count = np.zeros((len(segments), 7, 24), dtype=np.int64)
+    total = np.zeros((len(segments), 7, 24))
+    np.add.at(count, index, cells["count"].to_numpy(dtype=np.int64)[keep])
+    np.add.at(total, index, cells["sum"].to_numpy(dtype=np.float64)[keep])
+    return {"segments": list(segments),
+            "start_date": None if start_date is None else str(start_date),
+            "end_date": None if end_date is None else str(end_date),
+            "count": count.ravel().tolist(),
+            "sum": np.round(total, SUM_DECIMALS).ravel().tolist()}
+
+
+def aggregate_deviation(aggregate:dict,
+                        days_of_week:Sequence[str] = (),
+                        start_hour:Optional[int] = None,
+                        end_hour:Optional[int] = None)->pd.DataFrame:
+    # deviation table of the mean duration in [start_hour, end_hour) against all hours of the same
+    # weekdays (the Visualisierung filter pair), the same computation as the browser side in _SCRIPT
+    count = np.asarray(aggregate["count"], dtype=np.float64).reshape(-1, 7, 24)
+    total = np.asarray(aggregate["sum"], dtype=np.float64).reshape(-1, 7, 24)
+    days = [WEEKDAYS.index(day) for day in days_of_week] or list(range(7))
+    hours = np.arange(24)
+    in_window = (hours >= (start_hour or 0)) & (hours < (end_hour or 24))
+    count, total = count[:, days], total[:, days]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats1 = pd.DataFrame({"mean": total[..., in_window].sum(axis=(1, 2)) / count[..., in_window].sum(axis=(1, 2))},
+                              index=pd.Index(aggregate["segments"], name="segment"))
+        stats2 = pd.DataFrame({"mean": total.sum(axis=(1, 2)) / count.sum(axis=(1, 2))}, index=stats1.index)
+        return deviation_table(stats1, stats2)
+
+
+def _rgb(rgba:tuple)->str:
+    return f"rgb{tuple(rgba)[:-1]}"
+
+# line colors of the client map, build it with build_NewMindFresh_figure(..., palette=CLIENT_PALETTE)
+CLIENT_PALETTE = [_rgb(color) for color in DEVIATION_COLORS + [NO_DATA_COLOR]]
+
+
+def _controls(days_of_week:Sequence[str], start_hour:Optional[int], end_hour:Optional[int])->str:
+    days = "".join(f'<label><input type="checkbox" name="vgi-day" value="{i}"{" checked" if day in days_of_week else ""}> {label}</label> '
+                   for i, (day, label) in enumerate(zip(WEEKDAYS, WEEKDAY_LABELS)))
+    start = "".join(f'<option value="{h}"{" selected" if h == (start_hour or 0) else ""}>{h:02d}:00</option>' for h in range(24))
+    end = "".join(f'<option value="{h}"{" selected" if h == (end_hour or 24) else ""}>{h:02d}:00</option>' for h in range(1, 25))
+    return (f'<div style="font-family:sans-serif;font-size:14px;margin-bottom:8px">{days}'
+            f' &nbsp; Startzeit <select id="vgi-start">{start}</select>'
+            f' Endzeit <select id="vgi-end">{end}</select></div>')
+
+
+# recolours the batched map with Plotly.restyle on every control change: the segments of the line
+# traces move to the trace of their new color, the markers get a color and text per point
+_SCRIPT = """
+const agg = __AGGREGATE__, bins = __BINS__, colors = __COLORS__, noData = __NO_DATA__;
+const plot = document.getElementById('{plot_id}');
+const start = document.getElementById('vgi-start'), end = document.getElementById('vgi-end');
+const dayBoxes = [...document.querySelectorAll('input[name=vgi-day]')];
+const segments = plot.layout.meta.segments;
+function colour(d) {
+    if (Number.isNaN(d)) return noData;
+    let i = 0;
+    while (i < bins.length && d >= bins[i]) i++;
+    return colors[i];
+}
+// the vertices of every segment per line kind, and the trace of each color
+const lines = {};
+plot.data.forEach((trace, i) => {
+    if (trace.mode !== 'lines' || !trace.customdata) return;
+    const kind = lines[trace.name] = lines[trace.name] || {traces: {}, parts: {}};
+    kind.traces[trace.line.color] = i;
+    let lon = [], lat = [];
+    for (let j = 0; j < trace.lon.length; j++) {
+        const x = trace.lon[j];
+        if (x === null || Number.isNaN(x)) {
+            kind.parts[trace.customdata[j]] = [lon, lat];
+            lon = []; lat = [];
+        } else {
+            lon.push(x); lat.push(trace.lat[j]);
+        }
+    }
+});
+function recolour() {
+    let days = dayBoxes.filter(e => e.checked).map(e => +e.value);
+    if (days.length === 0) days = [0, 1, 2, 3, 4, 5, 6];
+    const h0 = +start.value, h1 = +end.value, deviation = {};
+    agg.segments.forEach((segment, i) => {
+        let c1 = 0, s1 = 0, c2 = 0, s2 = 0;
+        for (const d of days) {
+            const base = (i * 7 + d) * 24;
+            for (let h = 0; h < 24; h++) {
+                const c = agg.count[base + h], s = agg.sum[base + h];
+                c2 += c; s2 += s;
+                if (h >= h0 && h < h1) { c1 += c; s1 += s; }
+            }
+        }
+        const m1 = s1 / c1, m2 = s2 / c2;
+        deviation[segment] = (m1 - m2) / m2;
+    });
+    const deviationAt = code => segments[code] in deviation ? deviation[segments[code]] : NaN;
+    Object.values(lines).forEach(kind => {
+        const traceColors = Object.keys(kind.traces), lon = {}, lat = {}, custom = {};
+        traceColors.forEach(c => { lon[c] = []; lat[c] = []; custom[c] = []; });
+        Object.entries(kind.parts).forEach(([code, [x, y]]) => {
+            const c = colour(deviationAt(code));
+            for (let j = 0; j <= x.length; j++) {
+                lon[c].push(j < x.length ? x[j] : null);
+                lat[c].push(j < x.length ? y[j] : null);
+                custom[c].push(+code);
+            }
+        });
+        Plotly.restyle(plot, {lon: traceColors.map(c => lon[c]), lat: traceColors.map(c => lat[c]),
+                              customdata: traceColors.map(c => custom[c])}, traceColors.map(c => kind.traces[c]));
+    });
+    plot.data.forEach((trace, i) => {
+        if (trace.mode !== 'markers' || !trace.customdata) return;
+        const d = Array.from(trace.customdata, deviationAt);
+        Plotly.restyle(plot, {'marker.color': [d.map(colour)],
+                              'text': [d.map(v => 'Deviation: ' + (Number.isNaN(v) ? 'nan' : v.toFixed(2)))]}, [i]);
+    });
+    try {
+        sessionStorage.setItem('vgi-client-filter', JSON.stringify({days: days.length === 7 ? [] : days, h0: h0, h1: h1}));
+    } catch (e) {}
+}
+dayBoxes.concat([start, end]).forEach(e => e.addEventListener('change', recolour));
+try {
+    // keep the selection when the server sends a new date range
+    const saved = JSON.parse(sessionStorage.getItem('vgi-client-filter'));
+    if (saved) {
+        dayBoxes.forEach(e => { e.checked = saved.days.includes(+e.value); });
+        start.value = saved.h0; end.value = saved.h1;
+        recolour();
+    }
+} catch (e) {}
+"""
+
+
+def client_filter_html(fig:go.Figure,
+                       aggregate:dict,
+                       days_of_week:Sequence[str] = (),
+                       start_hour:Optional[int] = None,
+                       end_hour:Optional[int] = None)->str:
+    # the map (batched, built with palette=CLIENT_PALETTE) plus weekday / hour controls that filter
+    # and recolour it in the browser, without a Streamlit rerun
+    script = (_SCRIPT.replace("__AGGREGATE__", json.dumps(aggregate, separators=(",", ":")))
+                     .replace("__BINS__", json.dumps(DEVIATION_BINS.tolist()))
+                     .replace("__COLORS__", json.dumps([_rgb(color) for color in DEVIATION_COLORS]))
+                     .replace("__NO_DATA__", json.dumps(_rgb(NO_DATA_COLOR))))
+    return _controls(days_of_week, start_hour, end_hour) + fig.to_html(full_html=False,
+                                                                         include_plotlyjs="cdn",
+                                                                         post_script=script,
+                                                                         default_height=fig.layout.height or 1200)
@@ -0,0 +1,233 @@
+import os
+from typing import Optional, Sequence, Union, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from segment_stats import METRICS, QUANTILES, deviation_table, quantile_name, relative_deviation
+from utils import _geo_crs, bus_stop_names, compact_segment_dataset
+
+# config
+from newmind_fresh.config import GPS_DATA_LABELED, SEGMENT_DURATION_PATH
+
+# optional, pip install -r requirements-duckdb.txt
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+ISODOW = {day: i + 1 for i, day in enumerate(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])}
+
+
+def _sql_string(value:str)->str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _parquet_source(path:Union[str,List[str]])->str:
+    # read_parquet argument for a file, a directory of parquet files or a list of files
+    if isinstance(path, (list, tuple)):
+        return "[" + ", ".join(_sql_string(p) for p in path) + "]"
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.parquet")
+    return _sql_string(path)
+
+
+def filter_condition(segment_filter:tuple, prefix:str = "f")->tuple:
+    # SQL condition and named parameters of a Visualisierung filter tuple
+    # (start_date, end_date, days_of_week, start_time, end_time), same semantics as aggregates.cube_filter_mask
+    start_date, end_date, days_of_week, start_time, end_time = segment_filter
+    conditions, params = [], {}
+    if start_date is not None:
+        conditions.append(f"date >= ${prefix}_start_date")
+        params[f"{prefix}_start_date"] = start_date
+    if end_date is not None:
+        conditions.append(f"date <= ${prefix}_end_date")
+        params[f"{prefix}_end_date"] = end_date
+    if days_of_week:
+        days = [f"${prefix}_day_{i}" for i in range(len(days_of_week))]
+        conditions.append(f"isodow IN ({', '.join(days)})")
+        params.update({day[1:]: ISODOW[name] for day, name in zip(days, days_of_week)})
+    if start_time is not None:
+        conditions.append(f"hour >= ${prefix}_start_hour")
+        params[f"{prefix}_start_hour"] = start_time.hour
+    if end_time is not None:
+        conditions.append(f"hour < ${prefix}_end_hour")
+        params[f"{prefix}_end_hour"] = end_time.hour
+    return " AND ".join(conditions) or "TRUE", params
+
+
+class SegmentQueryEngine:
+    # segment-duration rows in an in-process DuckDB database. A filter tuple of the Visualisierung tab becomes
+    # one vectorized SQL aggregation that DuckDB runs on all cores. Geometry is never touched by the
+    # aggregations, segment_rows fetches it only for the segments asked for.
+    # Build with from_parquet (the batch files) or from_dataframe (the in-memory segment dataset)
+    def __init__(self,
+                 threads:Optional[int] = None,
+                 memory_limit:Optional[str] = None):
+        if duckdb is None:
+            raise ImportError("the DuckDB backend needs the duckdb package: pip install -r requirements-duckdb.txt")
+        self.con = duckdb.connect(":memory:")
+        # times are bucketed into dates and hours as stored, like aggregates._local_times
+        self.con.execute("SET TimeZone = 'UTC'")
+        if threads is not None:
+            self.con.execute(f"SET threads = {int(threads)}")
+        if memory_limit is not None:
+            self.con.execute(f"SET memory_limit = {_sql_string(memory_limit)}")
+        self.source = None
+        self.crs = None
+        self.has_geometry = False
+
+    def _create_table(self, select_sql:str, params:Optional[dict] = None)->None:
+        # rows sorted by route and date, so the min/max zone maps of DuckDB skip row groups outside a date range
+        geometry = ", geometry" if self.has_geometry else ""
+        self.con.execute(f"""
+            CREATE OR REPLACE TABLE segment_durations AS
+            SELECT row_id, run, segment, route, duration, utcTime,
+                   CAST(utcTime AS DATE) AS date,
+                   CAST(hour(utcTime) AS TINYINT) AS hour,
+                   CAST(isodow(utcTime) AS TINYINT) AS isodow{geometry}
+            FROM ({select_sql})
+            ORDER BY route, date
+        """, params or {})
+
+    @classmethod
+    def from_parquet(cls,
+                     gps_path:Union[str,List[str]] = GPS_DATA_LABELED,
+                     segment_path:Union[str,List[str]] = SEGMENT_DURATION_PATH,
+                     route:Optional[str] = None,
+                     threads:Optional[int] = None,
+                     memory_limit:Optional[str] = None)->"SegmentQueryEngine":
+        # the join of fetch_filtered_segment_data in SQL: segment durations with the entry time and
+        # first GPS point of their traversal, stop names mapped like the pandas path
+        engine = cls(threads, memory_limit)
+        gps_schema = ds.dataset(gps_path, format="parquet").schema
+        engine.crs = _geo_crs(gps_schema, "geometry")
+        engine.has_geometry = "geometry" in gps_schema.names
+        engine.con.register("segment_names", bus_stop_names(route))
+        where_route = "WHERE CAST(route AS VARCHAR) = $route" if route is not None else ""
+        where_durations = "WHERE CAST(d.route AS VARCHAR) = $route" if route is not None else ""
+        first_point = ", arg_min(geometry, utcTime) AS geometry" if engine.has_geometry else ""
+        engine._create_table(f"""
+            WITH traversals AS (
+                SELECT CAST(run AS VARCHAR) AS run, CAST(segment AS VARCHAR) AS segment, CAST(route AS VARCHAR) AS route,
+                       CAST(min(utcTime) AS TIMESTAMP) AS utcTime{first_point}
+                FROM read_parquet({_parquet_source(gps_path)})
+                {where_route}
+                GROUP BY ALL
+            ), durations AS (
+                SELECT CAST(d.run AS VARCHAR) AS run,
+                       coalesce(n.segment, CAST(d.segment AS VARCHAR)) AS segment,
+                       CAST(d.route AS VARCHAR) AS route,
+                       CAST(d.duration AS DOUBLE) AS duration
+                FROM read_parquet({_parquet_source(segment_path)}) d
+                LEFT JOIN segment_names n ON CAST(d.segment AS VARCHAR) = n.name AND CAST(d.route AS VARCHAR) = n.route
+                {where_durations}
+            )
+            SELECT row_number() OVER () - 1 AS row_id, *
+            FROM durations LEFT JOIN traversals USING (run, segment, route)
+        """, {"route": route} if route is not None else {})
+        engine.con.unregister("segment_names")
+        return engine
+
+    @classmethod
+    def from_dataframe(cls,
+                       df:pd.DataFrame,
+                       threads:Optional[int] = None,
+                       memory_limit:Optional[str] = None)->"SegmentQueryEngine":
+        # the non-geometry columns of the (compact) segment dataset, segment_rows returns rows of df itself
+        engine = cls(threads, memory_limit)
+        engine.source = df
+        engine.crs = df.attrs.get('crs')
+        table = pa.Table.from_pandas(df[["run", "segment", "route", "duration", "utcTime"]], preserve_index=False)
+        table = table.append_column("row_id", pa.array(np.arange(len(df), dtype=np.int64)))
+        engine.con.register("source", table)
+        engine._create_table("""
+            SELECT row_id, CAST(run AS VARCHAR) AS run, CAST(segment AS VARCHAR) AS segment,
+                   CAST(route AS VARCHAR) AS route, CAST(duration AS DOUBLE) AS duration,
+                   CAST(utcTime AS TIMESTAMP) AS utcTime
+            FROM source
+        """)
+        engine.con.unregister("source")
+        return engine
+
+    def _query(self, sql:str, params:dict):
+        # a cursor per query, so that Streamlit sessions can query the engine from their own threads
+        return self.con.cursor().execute(sql, params)
+
+    @staticmethod
+    def _where(segment_filter:tuple, route:Optional[str], prefix:str = "f")->tuple:
+        condition, params = filter_condition(segment_filter, prefix)
+        if route is not None:
+            condition = f"route = $route AND {condition}"
+            params["route"] = str(route)
+        return condition, params
+
+    def segment_stats(self,
+                      segment_filter:tuple,
+                      route:Optional[str] = None,
+                      quantiles:Sequence[float] = QUANTILES)->pd.DataFrame:
+        # count / mean / var / std / exact quantiles per segment, the layout of segment_stats.segment_statistics
+        condition, params = self._where(segment_filter, route)
+        percentiles = "".join(f", quantile_cont(duration, {float(q)}) AS {quantile_name(q)}" for q in quantiles)
+        return self._query(f"""
+            SELECT segment, count(duration) AS count, avg(duration) AS mean,
+                   var_samp(duration) AS var, stddev_samp(duration) AS std{percentiles}
+            FROM segment_durations
+            WHERE {condition}
+            GROUP BY segment
+            ORDER BY segment
+        """, params).df().set_index("segment")
+
+    def compare_segment_durations(self,
+                                  filter1:tuple,
+                                  filter2:tuple,
+                                  route:Optional[str] = None,
+                                  metric:str = "mean",
+                                  quantiles:Sequence[float] = QUANTILES)->tuple:
+        # deviation table of metric and the per-segment statistics of both filters (all segment_stats.METRICS),
+        # in a single scan. As in aggregates.compare_segment_stats, stats1 carries the deviation of every metric
+        condition1, params1 = filter_condition(filter1, "f1")
+        condition2, params2 = filter_condition(filter2, "f2")
+        condition, params = self._where((None, None, None, None, None), route)
+        columns = dict(count="count(duration)", mean="avg(duration)", var="var_samp(duration)", std="stddev_samp(duration)")
+        columns.update({quantile_name(q): f"quantile_cont(duration, {float(q)})" for q in quantiles})
+        aggregates = [f"{expression} FILTER (WHERE {c}) AS {name}_{i}"
+                      for i, c in ((1, condition1), (2, condition2)) for name, expression in columns.items()]
+        df = self._query(f"""
+            SELECT segment, {", ".join(aggregates)}
+            FROM segment_durations
+            WHERE {condition} AND (({condition1}) OR ({condition2}))
+            GROUP BY segment
+            ORDER BY segment
+        """, {**params, **params1, **params2}).df().set_index("segment")
+        stats = []
+        for i in (1, 2):
+            s = df[[f"{name}_{i}" for name in columns]].rename(columns=lambda c: c[:-2])
+            stats.append(s[s["count"] > 0])
+        stats1, stats2 = stats
+        stats1 = stats1.assign(**{f"deviation_{name}": relative_deviation(stats1[name], stats2[name].reindex(stats1.index))
+                                  for name in METRICS})
+        return deviation_table(stats1, stats2, metric), stats1, stats2
+
+    def segment_rows(self,
+                     segment_filter:tuple,
+                     segments:Optional[Sequence[str]] = None,
+                     route:Optional[str] = None,
+                     geometry:bool = True)->pd.DataFrame:
+        # the filtered rows of the given segments in the compact dataset layout (geometry as WKB)
+        condition, params = self._where(segment_filter, route)
+        if segments is not None:
+            condition += " AND list_contains($segments, segment)"
+            params["segments"] = [str(s) for s in segments]
+        if self.source is not None:
+            row_ids = self._query(f"SELECT row_id FROM segment_durations WHERE {condition} ORDER BY row_id", params).fetchnumpy()["row_id"]
+            return self.source.iloc[row_ids]
+        columns = "row_id, run, segment, route, duration, utcTime" + (", geometry" if geometry and self.has_geometry else "")
+        table = self._query(f"SELECT {columns} FROM segment_durations WHERE {condition} ORDER BY row_id", params).fetch_arrow_table()
+        return compact_segment_dataset(table.to_pandas().set_index("row_id"), crs=self.crs)
+
+    def memory_usage(self)->int:
+        # bytes held by the DuckDB buffer manager (table data and query intermediates)
+        return int(self._query("SELECT sum(memory_usage_bytes) FROM duckdb_memory()", {}).fetchone()[0] or 0)
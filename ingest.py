@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from aggregates import build_segment_cube, merge_segment_cubes
+from instrumentation import span
+from shared_dataset import load_shared_dataset, remove_stale_shared_datasets, shared_dataset_key, shared_dataset_path
+from trends import SegmentTrends, daily_rollup
+from utils import (GPS_COLUMNS, add_segment_col, compact_segment_dataset, concat_segment_datasets,
+                   fetch_filtered_segment_data, file_version, read_parquet_dataset, route_bus_stop_reverse_mapping,
+                   segment_durations_from_traversals, split_route_path, summarize_segment_traversals)
+
+# config
+from newmind_fresh.config import GPS_DATA_PATH, GPS_DATA_LABELED, SEGMENT_DURATION_PATH
+
+# manifest and processed partitions of the incremental ingestion
+INGEST_DIR = os.environ.get("VGI_INGEST_DIR", ".vgi_ingest")
+MANIFEST_NAME = "manifest.json"
+# map the dataset from a memory-mapped Arrow file shared by all server processes on the host
+SHARED_DATASET = os.environ.get("VGI_SHARED_DATASET", "0") == "1"
+
+
+def file_checksum(path:str, chunk_size:int = 2**20)->str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def gps_partitions(path:str = GPS_DATA_PATH)->List[str]:
+    return sorted(path + s for s in os.listdir(path) if ".parquet" in s)
+
+
+def label_route_segments(gdf:pd.DataFrame, route:str)->Optional[pd.DataFrame]:
+    # GPS pings of one route -> segment traversal rows in the layout of fetch_filtered_segment_data
+    gdf = add_segment_col(gdf, split_route_path(route))
+    gdf = gdf[gdf['segment'].notna()]
+    if len(gdf) == 0:
+        return None
+    gdf = gdf.assign(segment=gdf['segment'].replace(route_bus_stop_reverse_mapping(route)))
+    traversals = summarize_segment_traversals(gdf[GPS_COLUMNS])
+    traversals = segment_durations_from_traversals(traversals)
+    return compact_segment_dataset(traversals, crs=gdf.crs)
+
+
+def ingest_partition(path:str,
+                     known_runs:set,
+                     routes:tuple = ("101",))->Optional[pd.DataFrame]:
+    # raw GPS pings of one partition -> segment traversal rows of the given routes.
+    # Only runs that are not in the dataset yet go through segment assignment
+    gdf = read_parquet_dataset(path, columns=[c for c in GPS_COLUMNS if c != 'segment'], arrow_backed=False)
+    gdf = gdf.reset_index()
+    gdf = gdf[~gdf['run'].astype(str).isin(known_runs)].dropna(subset=['run', 'route', 'utcTime', 'geometry'])
+    gdf_route = gdf['route'].astype(str)
+    frames = [label_route_segments(gdf[gdf_route == route], route) for route in routes if (gdf_route == route).any()]
+    frames = [df for df in frames if df is not None]
+    if len(frames) == 0:
+        return None
+    return concat_segment_datasets(frames)
+
+
+class IncrementalSegmentDataset:
+    # the segment dataset (batch output of fetch_filtered_segment_data) plus the runs of GPS partitions
+    # that arrived later, for the given routes (default: all routes with a split route file). New or changed partitions are picked up by refresh(); processed partitions and
+    # their checksums are kept in a manifest in state_dir, so a restart does not reprocess them.
+    # version changes whenever dataset changes and can be used as cache key for derived results.
+    # With shared=True the dataset is a read-only memory-mapped Arrow file (see shared_dataset) named after
+    # the base files and ingested partitions, built by the first process and mapped by all others
+    def __init__(self,
+                 load_base:Callable = fetch_filtered_segment_data,
+                 base_paths:tuple = (GPS_DATA_LABELED, SEGMENT_DURATION_PATH),
+                 gps_path:str = GPS_DATA_PATH,
+                 routes:Optional[tuple] = None,
+                 state_dir:str = INGEST_DIR,
+                 shared:bool = SHARED_DATASET):
+        self.load_base = load_base
+        self.base_paths = base_paths
+        self.gps_path = gps_path
+        self.routes = tuple(routes) if routes is not None else None
+        self.state_dir = state_dir
+        self.shared = shared
+        self.version = 0
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        self._load()
+        self.refresh()
+
+    @property
+    def manifest_path(self)->str:
+        return os.path.join(self.state_dir, MANIFEST_NAME)
+
+    def _base_version(self)->list:
+        return [list(file_version(path)) for path in self.base_paths]
+
+    def _output_path(self, partition:str)->str:
+        return os.path.join(self.state_dir, os.path.basename(partition))
+
+    def _write_manifest(self)->None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _shared_key(self, changed:List[tuple] = ())->str:
+        # key of the dataset state after ingesting the changed (path, checksum) partitions
+        checksums = {name: entry["sha256"] for name, entry in self.manifest["partitions"].items()}
+        checksums.update({os.path.basename(path): checksum for path, checksum in changed})
+        return shared_dataset_key(self._base_version(), sorted(checksums.items()))
+
+    def _build_dataset(self)->pd.DataFrame:
+        with span("load_dataset"):
+            base = self.load_base()
+        frames = [base]
+        for partition, entry in self.manifest["partitions"].items():
+            if entry["rows"] > 0 and os.path.exists(self._output_path(partition)):
+                frames.append(compact_segment_dataset(pd.read_parquet(self._output_path(partition)), crs=base.attrs.get('crs')))
+        return concat_segment_datasets(frames) if len(frames) > 1 else base
+
+    def _load(self)->None:
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        # a rebuilt batch output may already contain the ingested runs, start the partitions over
+        if manifest.get("base_version") != self._base_version():
+            manifest = {"base_version": self._base_version(), "partitions": {}}
+
+        self.manifest = manifest
+        if self.shared:
+            key = self._shared_key()
+            self.dataset = load_shared_dataset(key, self._build_dataset)
+            remove_stale_shared_datasets(key)
+        else:
+            self.dataset = self._build_dataset()
+        if self.routes is None:
+            # every route of the batch data that has a split route file
+            self.routes = tuple(route for route in self.dataset['route'].astype(str).unique() if os.path.exists(split_route_path(route)))
+        self.cube = build_segment_cube(self.dataset)
+        self.trends = SegmentTrends.from_cube(self.cube)
+        self.version += 1
+
+    def _changed_partitions(self)->List[tuple]:
+        # (path, checksum) of new or changed partitions, checksums only for files whose mtime/size changed
+        changed = []
+        for path in gps_partitions(self.gps_path):
+            name = os.path.basename(path)
+            entry = self.manifest["partitions"].get(name)
+            version = list(file_version(path))
+            if entry is not None and entry["version"] == version:
+                continue
+            checksum = file_checksum(path)
+            if entry is not None and entry["sha256"] == checksum:
+                # touched but unchanged
+                entry["version"] = version
+                continue
+            changed.append((path, checksum))
+        return changed
+
+    def refresh(self)->List[str]:
+        # ingest new or changed GPS partitions, returns their paths
+        with self._lock:
+            self.last_refresh = time.monotonic()
+            changed = self._changed_partitions()
+            if len(changed) == 0:
+                return []
+            if self.shared and os.path.exists(shared_dataset_path(self._shared_key(changed))):
+                # another server process already ingested these partitions, map its result
+                with span("map_shared_dataset"):
+                    self._load()
+                return [path for path, _ in changed]
+
+            with span("ingest_partitions", partitions=len(changed)):
+                self._ingest(changed)
+            return [path for path, _ in changed]
+
+    def _ingest(self, changed:List[tuple])->None:
+        # caller holds the lock
+        dataset, replaced = self.dataset, False
+        for path, checksum in changed:
+            name = os.path.basename(path)
+            if name in self.manifest["partitions"] and "partition" in dataset.columns:
+                dataset = dataset[dataset["partition"] != name]
+                replaced = True
+            known_runs = set(dataset["run"].astype(str).unique())
+            rows = ingest_partition(path, known_runs, self.routes)
+            n_rows = 0
+            if rows is not None:
+                rows = rows.assign(partition=pd.Categorical([name] * len(rows)))
+                rows.to_parquet(self._output_path(name))
+                n_rows = len(rows)
+                dataset = concat_segment_datasets([dataset, rows])
+                if not replaced:
+                    cube = build_segment_cube(rows)
+                    self.cube = merge_segment_cubes(self.cube, cube)
+                    # appended days only extend the rolling windows
+                    self.trends.add(daily_rollup(cube))
+            self.manifest["partitions"][name] = {"version": list(file_version(path)),
+                                                 "sha256": checksum,
+                                                 "rows": n_rows}
+        if replaced:
+            self.cube = build_segment_cube(dataset)
+            self.trends = SegmentTrends.from_cube(self.cube)
+        self.dataset = dataset
+        self.version += 1
+        self._write_manifest()
+        if self.shared:
+            # replace the private copy by the shared file of the new state
+            key = self._shared_key()
+            self.dataset = load_shared_dataset(key, lambda: dataset)
+            remove_stale_shared_datasets(key)
+
+    def maybe_refresh(self, min_interval:float = 10.0)->List[str]:
+        # refresh at most every min_interval seconds, cheap enough to call on every rerun
+        if time.monotonic() - self.last_refresh < min_interval:
+            return []
+        return self.refresh()
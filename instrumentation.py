@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+# rolling window of observations kept per metric
+METRICS_WINDOW = int(os.environ.get("VGI_METRICS_WINDOW", 1000))
+# share of st.plotly_chart calls whose figure JSON size is measured (serializing costs as much as the chart)
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("VGI_METRICS_PAYLOAD_SAMPLE", 0.1))
+# Prometheus textfile written by write_prometheus, e.g. for the node_exporter textfile collector
+METRICS_FILE = os.environ.get("VGI_METRICS_FILE")
+
+# one JSON line per finished span when the "vgi.metrics" logger is enabled for INFO
+logger = logging.getLogger("vgi.metrics")
+
+_lock = threading.Lock()
+_observations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=METRICS_WINDOW))
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], dict]] = {}
+_last_write = 0.0
+
+
+def observe(name:str, value:float)->None:
+    # add a value (seconds for spans, bytes for payloads) to the rolling window of name
+    with _lock:
+        _observations[name].append(value)
+
+
+def count(name:str, n:float = 1)->None:
+    with _lock:
+        _counters[name] += n
+
+
+def register_gauges(prefix:str, callback:Callable[[], dict])->None:
+    # numeric values read on export, e.g. the stats() of a cache
+    _gauges[prefix] = callback
+
+
+@contextmanager
+def span(name:str, **fields):
+    # times the block into the "<name>" window, failures are counted as "<name>_errors"
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count(f"{name}_errors")
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(dict(span=name, seconds=round(elapsed, 6), ts=time.time(), **fields), default=str))
+
+
+def timed(name:Optional[str] = None):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_cache_misses(name:str):
+    # for @st.cache_data / @st.cache_resource functions (decorate below the streamlit decorator):
+    # the body only runs on a miss, hits are calls - misses
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            count(f"{name}_misses")
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def plotly_chart(fig, **kwargs):
+    # st.plotly_chart with its time and a sampled figure JSON size
+    import streamlit as st
+    if random.random() < PAYLOAD_SAMPLE_RATE:
+        observe("plotly_payload_bytes", len(fig.to_json()))
+    with span("plotly_chart"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def snapshot(percentiles:tuple = (50, 90, 99))->dict:
+    import numpy as np
+    with _lock:
+        observations = {name: np.array(values) for name, values in _observations.items()}
+        counters = dict(_counters)
+    summary = {}
+    for name, values in observations.items():
+        if len(values) == 0:
+            continue
+        stats = dict(count=len(values), mean=float(values.mean()))
+        stats.update({f"p{p}": float(np.percentile(values, p)) for p in percentiles})
+        summary[name] = stats
+    gauges = {}
+    for prefix, callback in _gauges.items():
+        for key, value in callback().items():
+            if isinstance(value, (int, float)):
+                gauges[f"{prefix}_{key}"] = value
+    return dict(observations=summary, counters=counters, gauges=gauges)
+
+
+def to_prometheus(percentiles:tuple = (50, 90, 99))->str:
+    # Prometheus text exposition format, rolling windows as summaries
+    data = snapshot(percentiles)
+    lines = []
+    for name, stats in data["observations"].items():
+        metric = f"vgi_{name}"
+        lines.append(f"# TYPE {metric} summary")
+        for p in percentiles:
+            lines.append(f'{metric}{{quantile="{p / 100}"}} {stats[f"p{p}"]}')
+        lines.append(f"{metric}_count {stats['count']}")
+        lines.append(f"{metric}_sum {stats['mean'] * stats['count']}")
+    for name, value in data["counters"].items():
+        lines.append(f"# TYPE vgi_{name}_total counter")
+        lines.append(f"vgi_{name}_total {value}")
+    for name, value in data["gauges"].items():
+        lines.append(f"# TYPE vgi_{name} gauge")
+        lines.append(f"vgi_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path:Optional[str] = METRICS_FILE, min_interval:float = 15.0)->None:
+    # atomically rewrite the textfile, at most every min_interval seconds
+    global _last_write
+    if not path or time.monotonic() - _last_write < min_interval:
+        return
+    _last_write = time.monotonic()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(to_prometheus())
+    os.replace(tmp_path, path)
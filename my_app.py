@@ -1,44 +1,188 @@
 import os
 import sys
 import json
+import time
 import datetime
-import plotly.graph_objs as go
-from copy import deepcopy
+rerun_start = time.perf_counter()
 
-# Streamlit utils
+# Streamlit utils, the rest (geopandas, plotly, pandas, newmind_fresh preprocessing) is imported on first use
 import streamlit as st
-import altair as alt
 import hydralit_components as hc
 
 # App utils
-from newmind_fresh.preprocess.segment_agg import compare_segment_durations
-from utils import fetch_filtered_segment_data, plot_NewMindFresh
+import instrumentation
+from instrumentation import count, count_cache_misses, plotly_chart, span, timed
+from startup import BackgroundLoader
 from newmind_fresh.config import FRESHBOARD_BUS_IMG
 
+# segment filtering of the Visualisierung tab: "pandas" (compare_segment_durations) or "duckdb" (needs pip install duckdb)
+QUERY_BACKEND = os.environ.get("VGI_QUERY_BACKEND", "pandas")
+# live GPS ping feed (file path or tcp://host:port) for the live map, see streaming.py
+LIVE_SOURCE = os.environ.get("VGI_LIVE_SOURCE")
+LIVE_REFRESH_S = float(os.environ.get("VGI_LIVE_REFRESH_S", 5))
+
 st.set_page_config(
         page_title="GPS Dashboard",
         page_icon="🚌",
         layout="wide",
     )
-# Dark Theme
-alt.themes.enable("dark")
 
-@st.cache_data
-def fetch_filtered_segment_data_cached():
-    return fetch_filtered_segment_data()
+def _load_segment_dataset(loader):
+    loader.set_phase("Bibliotheken werden geladen", 0.05)
+    from functools import partial
+    from ingest import IncrementalSegmentDataset
+    from routes import load_route_segments, preprocessed_routes
+    loader.set_phase("GPS-Daten werden geladen", 0.3)
+    with span("startup_dataset_load"):
+        # the outputs of routes.py when the routes were preprocessed, the batch output otherwise
+        route_paths = preprocessed_routes()
+        if len(route_paths) > 0:
+            return IncrementalSegmentDataset(load_base=partial(load_route_segments, route_paths),
+                                             base_paths=tuple(route_paths.values()),
+                                             routes=tuple(route_paths))
+        return IncrementalSegmentDataset()
 
-initial_dataset = fetch_filtered_segment_data_cached()
+@st.cache_resource
+def segment_dataset_loader():
+    # batch segment data plus GPS partitions that arrived later, loaded in a background thread
+    # and shared by all sessions
+    return BackgroundLoader(_load_segment_dataset)
 
-@st.cache_data
-def load_segment_data(filter_1, filter_2):
-    segment_data = compare_segment_durations(df=initial_dataset, filter1=filter_1, filter2=filter_2)
+def wait_for_segment_dataset():
+    # pages that need the data wait here with a progress bar, the home page never does
+    loader = segment_dataset_loader()
+    if not loader.done:
+        progress_bar = st.progress(loader.progress, text=loader.phase)
+        while not loader.wait(0.2):
+            progress_bar.progress(loader.progress, text=loader.phase)
+        progress_bar.empty()
+    segment_dataset = loader.result()
+    segment_dataset.maybe_refresh()
+    return segment_dataset
+
+@st.cache_resource(max_entries=16)
+@count_cache_misses("route_dataset")
+def load_route_dataset(_segment_dataset, dataset_version, route):
+    # rows of one route, shared by all sessions (a slice without copy of a shared dataset)
+    from shared_dataset import route_rows
+    return route_rows(_segment_dataset.dataset, route)
+
+def load_segment_data(segment_dataset, filter_1, filter_2, route="101"):
+    # process wide LRU cache shared by all sessions, results are returned without copying
+    from newmind_fresh.preprocess.segment_agg import compare_segment_durations
+    from result_cache import cached_compare_segment_durations, segment_result_cache
+    instrumentation.register_gauges("segment_result_cache", segment_result_cache.stats)
+    count("route_dataset_calls")
+    segment_data = cached_compare_segment_durations(timed("compare_segment_durations")(compare_segment_durations),
+                                                    df=load_route_dataset(segment_dataset, segment_dataset.version, route),
+                                                    filter1=filter_1, filter2=filter_2,
+                                                    dataset_key=(segment_dataset.version, route), for_dashboard=True)
     return segment_data
 
+@st.cache_resource(max_entries=1)
+@count_cache_misses("duckdb_engine")
+def load_duckdb_engine(_segment_dataset, dataset_version):
+    # the segment rows in an in-process DuckDB database, rebuilt when the dataset version changes
+    from duckdb_backend import SegmentQueryEngine
+    with span("duckdb_engine_load"):
+        return SegmentQueryEngine.from_dataframe(_segment_dataset.dataset)
+
+def load_segment_deviation(segment_dataset, filter_1, filter_2, route="101", metric="mean"):
+    # deviation table of metric and the rows for the map from the configured backend. The mean keeps
+    # compare_segment_durations, so the map colours it like the batch reports do. The per-segment
+    # statistics of the other metrics are cached per filter, switching metric only picks other columns
+    from result_cache import cached_compare_segment_durations
+    from segment_stats import deviation_table
+    if QUERY_BACKEND == "duckdb":
+        engine = load_duckdb_engine(segment_dataset, segment_dataset.version)
+        compare = timed("duckdb_compare_segment_durations")(engine.compare_segment_durations)
+        dt, stats1, stats2 = cached_compare_segment_durations(lambda df, filter1, filter2, route: compare(filter1, filter2, route),
+                                                              df=None, filter1=filter_1, filter2=filter_2,
+                                                              dataset_key=("duckdb", segment_dataset.version, route), route=route)
+    elif metric != "mean":
+        # summed from the segment x date x hour cube, the raw rows only for metrics the cube has no column for
+        from aggregates import compare_segment_cube, compare_segment_stats
+        compare = timed("compare_segment_cube")(compare_segment_cube)
+        dt, stats1, stats2 = cached_compare_segment_durations(lambda df, filter1, filter2, route: compare(segment_dataset.cube, filter1, filter2, route),
+                                                              df=None, filter1=filter_1, filter2=filter_2,
+                                                              dataset_key=("segment_cube", segment_dataset.version, route), route=route)
+        if metric not in stats1.columns:
+            dt, stats1, stats2 = cached_compare_segment_durations(timed("compare_segment_stats")(compare_segment_stats),
+                                                                  df=load_route_dataset(segment_dataset, segment_dataset.version, route),
+                                                                  filter1=filter_1, filter2=filter_2,
+                                                                  dataset_key=("segment_stats", segment_dataset.version, route))
+    else:
+        dt, l1, l2, f1, f2 = load_segment_data(segment_dataset, filter_1, filter_2, route)
+        return dt, segment_dataset.dataset.loc[l1]
+    if metric != "mean":
+        dt = deviation_table(stats1, stats2, metric)
+    # the map only needs the segments of the result, no rows or geometry are fetched
+    return dt, dt.index.to_frame(index=False, name="segment")
+
+@st.cache_resource(max_entries=16)
+@count_cache_misses("route_cube")
+def load_route_cube(_segment_dataset, dataset_version, route):
+    # the cells of route in the cube of the dataset, kept up to date on ingestion
+    from aggregates import route_cube
+    return route_cube(_segment_dataset.cube, route)
+
+@st.cache_data(max_entries=32)
+@count_cache_misses("client_filter_map")
+@timed("client_filter_map")
+def load_client_filter_map(_segment_dataset, dataset_version, route, start_date, end_date):
+    # the map plus the segment x weekday x hour aggregate of the date range, weekdays and hours are then
+    # filtered in the browser. Starts with the defaults of the Visualisierung filters (Mittwoch from 12:00)
+    from client_filter import CLIENT_PALETTE, aggregate_deviation, client_filter_html, weekday_hour_aggregate
+    from utils import build_NewMindFresh_figure, split_route_path
+    aggregate = weekday_hour_aggregate(load_route_cube(_segment_dataset, dataset_version, route), start_date, end_date)
+    dt = aggregate_deviation(aggregate, ["Wednesday"], 12)
+    fig = build_NewMindFresh_figure(gdf_list=dt.index.to_frame(index=False, name="segment"), df_deviation=dt,
+                                    split_path=split_route_path(route), lw=13, route=route, palette=CLIENT_PALETTE)
+    html = client_filter_html(fig, aggregate, ["Wednesday"], 12)
+    instrumentation.observe("client_filter_payload_bytes", len(html))
+    return html
+
+@st.cache_resource
+def live_segment_delays(routes):
+    # consumes the live ping feed in a background thread, shared by all sessions
+    from streaming import LiveSegmentDelays, ping_source
+    live = LiveSegmentDelays(routes)
+    live.start(ping_source(LIVE_SOURCE))
+    return live
+
+@st.experimental_fragment(run_every=LIVE_REFRESH_S)
+def show_live_map(segment_dataset, route):
+    # reruns on its own every LIVE_REFRESH_S seconds: live durations of the last hour on route against
+    # the history of the same route, weekday and hour
+    from aggregates import query_segment_cube
+    from utils import plot_NewMindFresh, split_route_path
+    import pandas as pd
+    live = live_segment_delays(tuple(sorted(segment_dataset.routes)))
+    now = live.latest_time or pd.Timestamp.now()
+    hour_filter = (None, None, [now.day_name()], datetime.time(now.hour), datetime.time(now.hour + 1) if now.hour < 23 else None)
+    dt = live.deviation_table(query_segment_cube(segment_dataset.cube, hour_filter, route=route), route)
+    st.caption(f"Stand {now:%d.%m.%Y %H:%M:%S} · {live.active_runs()} aktive Fahrten · {live.pings:,} Pings"
+               + ("" if live.running else " · Live-Feed getrennt"))
+    # the map only needs the segments of the result
+    plot_NewMindFresh(gdf_list=dt.index.to_frame(index=False, name="segment"), df_deviation=dt, split_path=split_route_path(route), lw=13, route=route)
+
+@st.cache_data
+@count_cache_misses("dashboard_aggregates")
+@timed("dashboard_aggregates")
+def load_dashboard_aggregates(_segment_dataset, dataset_version, route):
+    # computed once per dataset version and route, the charts render from these small tables
+    from aggregates import build_dashboard_aggregates
+    return build_dashboard_aggregates(load_route_dataset(_segment_dataset, dataset_version, route))
+
 @st.cache_data
 def load_lottiefile(filepath: str):
     with open(filepath,"r") as f:
         return json.load(f)
 
+def mark_first_paint():
+    # time from the start of the rerun until the page shows its first content
+    instrumentation.observe("time_to_first_paint", time.perf_counter() - rerun_start)
+
 days_of_week_mapping = {
     "Montag": "Monday", 
     "Dienstag": "Tuesday", 
@@ -55,14 +199,6 @@ severity_mapping = {
     "Minimale Verzögerung": "Minimal Delay"
 }
 
-def set_segment_type(segment):
-    if segment.startswith('haltestelle'):
-        return 'bus_stop'
-    elif segment.startswith('stop_lines'):
-        return 'stop_lines'
-    else:
-        return 'road_path'
-
 def fetch_days_of_week_mapped(days_of_week):
     return_days_of_week = []
     for day_value in days_of_week:
@@ -87,7 +223,12 @@ def main():
     # we can override any part of the primary colors of the menu
     # over_theme = {'txc_inactive': '#FFFFFF','menu_background':'red','txc_active':'yellow','option_active':'blue'}
     over_theme = {'txc_inactive': '#FFFFFF'}
+    # hidden admin page, only in the nav bar when opened with ?admin=1
+    if st.query_params.get("admin") == "1":
+        menu_data.append({'icon': "fas fa-stopwatch", 'label':"Admin"})
     menu_id = hc.nav_bar(menu_definition=menu_data,home_name='Startseite',override_theme=over_theme)
+    # start loading the data in the background while the first page renders
+    segment_dataset_loader()
 
     if menu_id == "Startseite":
         st.title("Über das Projekt")
@@ -97,8 +238,20 @@ def main():
                     Werfen Sie einen Blick in:[INVG](https://www.invg.de/)
                     """)
         st.image(FRESHBOARD_BUS_IMG)
+        mark_first_paint()
     elif menu_id == "Visualisierung":
         st.title("Ingolstadt Bus GPS-Daten")
+        mark_first_paint()
+        from utils import plot_NewMindFresh, split_route_path
+        segment_dataset = wait_for_segment_dataset()
+
+        routes = sorted(segment_dataset.routes)
+        route = st.selectbox("Linie", routes, index=routes.index("101") if "101" in routes else 0)
+        if LIVE_SOURCE is not None and st.toggle("Live", help="Verspätungen der letzten Stunde aus dem GPS-Live-Feed"):
+            show_live_map(segment_dataset, route)
+            return
+
+        client_side = st.toggle("Im Browser filtern", help="Wochentage und Uhrzeiten ohne Neuladen filtern, nur ein neuer Datumsbereich wird vom Server geladen")
 
         # Calendar-like selection box
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -106,6 +259,13 @@ def main():
             filter_1_start_date = st.date_input("Startdatum", datetime.date(2023, 10, 10), format="DD.MM.YYYY")
         with col2:
             filter_1_end_date = st.date_input("Enddatum", datetime.date(2023, 11, 20), format="DD.MM.YYYY")
+        if client_side:
+            # weekday and hour controls are part of the map component, no rerun on their changes
+            import streamlit.components.v1 as components
+            with span("client_filter_map"):
+                html = load_client_filter_map(segment_dataset, segment_dataset.version, route, filter_1_start_date, filter_1_end_date)
+            components.html(html, height=1260)
+            return
         with col3:
             # start_time = st.number_input("Start Time", min_value=0, max_value=23, value=0)
             filter_1_start_time = st.time_input("Startzeit", datetime.time(12, 0), step=3600) # 300 sec = 5min)
@@ -115,81 +275,69 @@ def main():
         with col5:
             filter_1_days_of_week = st.multiselect("Wochentage", ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"], default=["Mittwoch"])
             filter_1_days_of_week = fetch_days_of_week_mapped(filter_1_days_of_week)
+        from segment_stats import METRICS
+        metric = st.selectbox("Kennzahl", list(METRICS), format_func=METRICS.get)
 
         # Segment data filter
-        dt, l1, l2, f1, f2 = compare_segment_durations(df=initial_dataset, filter1=(filter_1_start_date,filter_1_end_date,filter_1_days_of_week,filter_1_start_time,None), 
-                                                       filter2=(filter_1_start_date,filter_1_end_date,filter_1_days_of_week,None,None), for_dashboard=True)
+        with span("segment_filter"):
+            dt, segment_rows = load_segment_deviation(segment_dataset, filter_1=(filter_1_start_date,filter_1_end_date,filter_1_days_of_week,filter_1_start_time,None),
+                                                      filter_2=(filter_1_start_date,filter_1_end_date,filter_1_days_of_week,None,None),
+                                                      route=route, metric=metric)
         # Plot map
-        plot_NewMindFresh(gdf_list=initial_dataset.loc[l1], df_deviation=dt, lw=13)
+        plot_NewMindFresh(gdf_list=segment_rows, df_deviation=dt, split_path=split_route_path(route), lw=13, route=route)
     elif menu_id == "Armaturenbrett":
         st.title("Verkehrsanalyse")
+        mark_first_paint()
+        from utils import build_dashboard_figures
+        segment_dataset = wait_for_segment_dataset()
+
+        routes = sorted(segment_dataset.routes)
+        route = st.selectbox("Linie", routes, index=routes.index("101") if "101" in routes else 0)
+        count("dashboard_aggregates_calls")
+        avg_duration_per_segment, segment_type_avg_duration = load_dashboard_aggregates(segment_dataset, segment_dataset.version, route) # average duration for each segment and segment type
+        from segment_stats import METRICS
+        metric = st.selectbox("Kennzahl", list(METRICS), format_func=METRICS.get)
+        for fig in build_dashboard_figures(avg_duration_per_segment, segment_type_avg_duration, metric):
+            # Display the Plotly figure using Streamlit
+            plotly_chart(fig)
 
-        ''' Per Segment - Bar Plot '''
-        avg_duration_per_segment = deepcopy(initial_dataset).groupby('segment')['duration'].mean().reset_index() # average duration for each segment        
-        avg_duration_per_segment['duration'] = avg_duration_per_segment['duration'].round(2)
-        # Create a Plotly bar trace
-        bar_trace = go.Bar(
-            x=avg_duration_per_segment['duration'],
-            y=avg_duration_per_segment['segment'],
-            orientation='h',
-            marker=dict(color='skyblue'),  # Set bar color
-            text=avg_duration_per_segment.apply(lambda row: f"{row['segment']}<br>{row['duration']} seconds", axis=1),  # Customize hover text,       # Display the average duration as text on the bars
-            textposition='auto',           # Automatically position the text on the bars
-        )
-        # Create a Plotly layout
-        layout = go.Layout(
-            title='Average Duration By Segment',
-            xaxis=dict(title='Average Duration (seconds)'),
-            yaxis=dict(title='Segment', tickmode='array', dtick=1),  # Display every tick),
-            height=1500,  # Adjust the height of the chart
-            width=2000,  # Adjust the width of the chart
-        )
-        # Create a Plotly figure
-        fig = go.Figure(data=[bar_trace], layout=layout)
-        # Display the Plotly figure using Streamlit
-        st.plotly_chart(fig)
-
-        ''' Per Segment Type - Bar Plot''' 
-        avg_duration_per_segment['segment_type'] = avg_duration_per_segment['segment'].apply(set_segment_type)
-        segment_type_avg_duration = avg_duration_per_segment.groupby('segment_type')['duration'].mean().reset_index()
-        segment_type_avg_duration['duration'] = segment_type_avg_duration['duration'].round(2)
-        # Create a Plotly bar trace
-        bar_trace = go.Bar(
-            x=segment_type_avg_duration['duration'],
-            y=segment_type_avg_duration['segment_type'],
-            orientation='h',
-            marker=dict(color='skyblue'),  # Set bar color
-            text=segment_type_avg_duration.apply(lambda row: f"{row['segment_type']}<br>{row['duration']} seconds", axis=1),  # Customize hover text,       # Display the average duration as text on the bars
-            textposition='auto',           # Automatically position the text on the bars
-        )
-        # Create a Plotly layout
-        layout = go.Layout(
-            title='Average Duration By Segment Type',
-            xaxis=dict(title='Average Duration (seconds)'),
-            yaxis=dict(title='Segment', tickmode='array', dtick=1),  # Display every tick),
-            height=300,  # Adjust the height of the chart
-            width=1500,  # Adjust the width of the chart
-        )
-        # Create a Plotly figure
-        fig = go.Figure(data=[bar_trace], layout=layout)
-        # Display the Plotly figure using Streamlit
-        st.plotly_chart(fig)
-
-        ''' Per Segment Type - PI Chart'''
-        # Create a Plotly pie chart trace
-        pie_trace = go.Pie(
-            labels=segment_type_avg_duration['segment_type'],
-            values=segment_type_avg_duration['duration'],
-        )
-        # Create a Plotly layout
-        layout = go.Layout(
-            title='Average Duration By Segment Type',
-        )
-        # Create a Plotly figure
-        fig = go.Figure(data=[pie_trace], layout=layout)
-        # Display the Plotly figure using Streamlit
-        st.plotly_chart(fig)
+        # Trend over time, from the rolling window rollups of the dataset
+        from trends import ROLLING_WINDOWS, TREND_METRICS
+        from utils import build_trend_figure, TREND_TITLES
+        st.subheader("Entwicklung")
+        trends = segment_dataset.trends
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            by = st.radio("Gruppierung", ["segment_type", "segment"], format_func={"segment_type": "Segmenttyp", "segment": "Segment"}.get)
+        with col2:
+            window = st.selectbox("Fenster (Tage)", ROLLING_WINDOWS)
+        with col3:
+            trend_metric = st.selectbox("Kennzahl", TREND_METRICS, format_func=TREND_TITLES.get, key="trend_metric")
+        with col4:
+            marker_date = st.date_input("Markierung", value=None, format="DD.MM.YYYY", help="z. B. Beginn einer Baustelle")
+        from aggregates import SEGMENT_TYPES
+        options = SEGMENT_TYPES if by == "segment_type" else list(trends.route_segments(route))
+        keys = st.multiselect("Segmenttypen" if by == "segment_type" else "Segmente", options, default=options[:3])
+        if len(keys) > 0:
+            with span("trend_query"):
+                trend = trends.trend(keys, by=by, window=window, metric=trend_metric, route=route)
+            plotly_chart(build_trend_figure(trend, window, trend_metric, marker_date))
+    elif menu_id == "Admin":
+        st.title("Leistung")
+        mark_first_paint()
+        import pandas as pd
+        metrics = instrumentation.snapshot()
+        st.subheader("Zeiten (s) und Payload (Bytes)")
+        st.dataframe(pd.DataFrame(metrics["observations"]).T)
+        st.subheader("Zähler")
+        st.dataframe(pd.Series(metrics["counters"], name="value", dtype=float))
+        st.subheader("Caches")
+        st.dataframe(pd.Series(metrics["gauges"], name="value", dtype=float))
+        st.download_button("Prometheus", instrumentation.to_prometheus(), file_name="vgi_metrics.prom")
+        st.download_button("JSON", json.dumps(metrics, indent=2), file_name="vgi_metrics.json")
 
 
 if __name__ == "__main__":
-    main()
+    with span("rerun"):
+        main()
+    instrumentation.write_prometheus()
@@ -0,0 +1,145 @@
+"""Headless batch reports of the segment delay analysis.
+
+Each filter spec gives the map and the Armaturenbrett charts (HTML + JSON) and the
+aggregate tables (CSV) of one filter, as the dashboard would show them. Specs are
+evaluated in parallel worker processes that share the dataset loaded once in the parent.
+
+    python report.py --specs specs.json --output reports
+    python report.py --weekdays 2024-01-01 2024-03-31 --start-time 12:00 --output reports
+
+specs.json is a list of objects with name, route, start_date, end_date, days_of_week
+(English names), start_time and end_time (HH:MM or null).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+import pandas as pd
+
+from aggregates import build_dashboard_aggregates
+from shared_dataset import sort_by_route
+from utils import build_NewMindFresh_figure, build_dashboard_figures, fetch_filtered_segment_data, split_route_path
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# dataset of the worker processes sorted by route and its contiguous route slices (views, no copies),
+# inherited from the parent when forked
+_DATASET: Optional[pd.DataFrame] = None
+_ROUTE_DATASETS = {}
+
+
+def _parse_time(value:Optional[str])->Optional[datetime.time]:
+    return datetime.time.fromisoformat(value) if value else None
+
+
+def spec_filters(spec:dict)->tuple:
+    # filter1 / filter2 the way the Visualisierung tab builds them: the second one without the time window
+    start_date = datetime.date.fromisoformat(spec["start_date"])
+    end_date = datetime.date.fromisoformat(spec["end_date"])
+    days_of_week = spec.get("days_of_week") or []
+    filter1 = (start_date, end_date, days_of_week, _parse_time(spec.get("start_time")), _parse_time(spec.get("end_time")))
+    filter2 = (start_date, end_date, days_of_week, None, None)
+    return filter1, filter2
+
+
+def weekday_specs(start_date:str, end_date:str, route:str = "101",
+                  start_time:Optional[str] = None, end_time:Optional[str] = None)->List[dict]:
+    # one spec per weekday of the period
+    return [dict(name=f"{route}_{day.lower()}_{start_date}_{end_date}", route=route, start_date=start_date,
+                 end_date=end_date, days_of_week=[day], start_time=start_time, end_time=end_time)
+            for day in WEEKDAYS]
+
+
+def load_report_dataset()->None:
+    # split by route before any worker starts, so forked workers only read the pages of the parent
+    global _DATASET, _ROUTE_DATASETS
+    _DATASET, ranges = sort_by_route(fetch_filtered_segment_data())
+    _ROUTE_DATASETS = {route: _DATASET.iloc[start:stop] for route, (start, stop) in ranges.items()}
+
+
+def _init_worker()->None:
+    # without fork (spawn start method) every worker has to load the dataset itself
+    if _DATASET is None:
+        load_report_dataset()
+
+
+def _route_dataset(route:str)->pd.DataFrame:
+    return _ROUTE_DATASETS.get(str(route), _DATASET.iloc[:0])
+
+
+def run_report(spec:dict, output_dir:str)->dict:
+    from newmind_fresh.preprocess.segment_agg import compare_segment_durations
+
+    start = time.perf_counter()
+    route = spec.get("route", "101")
+    report_dir = os.path.join(output_dir, spec["name"])
+    os.makedirs(report_dir, exist_ok=True)
+
+    df = _route_dataset(route)
+    filter1, filter2 = spec_filters(spec)
+    dt, l1, l2, f1, f2 = compare_segment_durations(df=df, filter1=filter1, filter2=filter2, for_dashboard=True)
+    dt.to_csv(os.path.join(report_dir, "deviation.csv"))
+
+    figures = {"map": build_NewMindFresh_figure(gdf_list=df.loc[l1], df_deviation=dt, split_path=split_route_path(route), lw=13, route=route)}
+    avg_duration_per_segment, segment_type_avg_duration = build_dashboard_aggregates(df.loc[l1])
+    avg_duration_per_segment.to_csv(os.path.join(report_dir, "duration_per_segment.csv"), index=False)
+    segment_type_avg_duration.to_csv(os.path.join(report_dir, "duration_per_segment_type.csv"), index=False)
+    names = ["duration_per_segment", "duration_per_segment_type", "duration_per_segment_type_pie"]
+    figures.update(zip(names, build_dashboard_figures(avg_duration_per_segment, segment_type_avg_duration)))
+
+    for name, fig in figures.items():
+        fig.write_html(os.path.join(report_dir, f"{name}.html"), include_plotlyjs="cdn")
+        fig.write_json(os.path.join(report_dir, f"{name}.json"))
+    return dict(name=spec["name"], rows=len(l1), seconds=time.perf_counter() - start)
+
+
+def run_reports(specs:List[dict], output_dir:str, workers:Optional[int] = None)->pd.DataFrame:
+    # loaded once in the parent, forked workers share the pages copy-on-write
+    load_report_dataset()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    workers = workers or min(len(specs), os.cpu_count() or 1)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+        futures = [executor.submit(run_report, spec, output_dir) for spec in specs]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return pd.DataFrame(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--specs", help="JSON file with a list of filter specs")
+    parser.add_argument("--weekdays", nargs=2, metavar=("START_DATE", "END_DATE"), help="one report per weekday of the period")
+    parser.add_argument("--route", default="101")
+    parser.add_argument("--start-time", default=None)
+    parser.add_argument("--end-time", default=None)
+    parser.add_argument("--output", default="reports")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    specs = []
+    if args.specs:
+        with open(args.specs) as f:
+            specs.extend(json.load(f))
+    if args.weekdays:
+        specs.extend(weekday_specs(*args.weekdays, route=args.route, start_time=args.start_time, end_time=args.end_time))
+    if len(specs) == 0:
+        parser.error("no filter specs, use --specs and/or --weekdays")
+
+    start = time.perf_counter()
+    results = run_reports(specs, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+    results.to_csv(os.path.join(args.output, "reports.csv"), index=False)
+    print(results.to_string(index=False))
+    print(f"{len(results)} reports in {elapsed:.1f} s, {len(results) / elapsed * 60:.1f} reports per minute", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import numpy as np
+import pandas as pd
+
+# memory budget of the process wide segment comparison cache, in MB
+RESULT_CACHE_MB = int(os.environ.get("VGI_RESULT_CACHE_MB", 256))
+
+
+def normalize_segment_filter(segment_filter:tuple)->tuple:
+    # (start_date, end_date, days_of_week, start_time, end_time) with the weekdays sorted,
+    # so that the same selection in a different order hits the same cache entry
+    start_date, end_date, days_of_week, start_time, end_time = segment_filter
+    days_of_week = tuple(sorted(days_of_week)) if days_of_week else ()
+    return start_date, end_date, days_of_week, start_time, end_time
+
+
+def estimate_nbytes(obj)->int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(o) for o in obj)
+    return sys.getsizeof(obj)
+
+
+class ResultCache:
+    # thread safe LRU cache with a memory budget, shared by all Streamlit sessions of the process.
+    # Cached results are handed out as is (no copy), callers must treat them as read-only
+    def __init__(self, max_bytes:int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key:Hashable, compute:Callable):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # compute outside of the lock, concurrent misses on the same key just compute twice
+        result = compute()
+        nbytes = estimate_nbytes(result)
+        if nbytes > self.max_bytes:
+            return result
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (result, nbytes)
+                self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.evictions += 1
+        return result
+
+    def clear(self)->None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self)->dict:
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        entries=len(self._entries), nbytes=self.nbytes, max_bytes=self.max_bytes)
+
+
+segment_result_cache = ResultCache(RESULT_CACHE_MB * 2**20)
+
+
+def cached_compare_segment_durations(compare:Callable,
+                                     df:pd.DataFrame,
+                                     filter1:tuple,
+                                     filter2:tuple,
+                                     dataset_key:Hashable = None,
+                                     cache:ResultCache = segment_result_cache,
+                                     **kwargs):
+    # compare(df=df, filter1=filter1, filter2=filter2, **kwargs) through the process wide cache,
+    # dataset_key identifies the dataset version so that reloaded data does not hit stale entries
+    key = (dataset_key, normalize_segment_filter(filter1), normalize_segment_filter(filter2), tuple(sorted(kwargs.items())))
+    return cache.get_or_compute(key, lambda: compare(df=df, filter1=filter1, filter2=filter2, **kwargs))
@@ -0,0 +1,91 @@
+"""Per-route preprocessing, one worker process per route.
+
+    python routes.py --routes 101 102 103 --output-dir route_data
+"""
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Optional, Sequence
+
+import pandas as pd
+
+from ingest import label_route_segments
+from utils import (GPS_COLUMNS, ROUTE_DATA_DIR, ROUTE_GEOMETRY_PATHS, compact_segment_dataset, concat_segment_datasets,
+                   load_dataset, prepare_split_path_geometry, route_output_paths, split_route_path, write_route_geometry)
+
+SEGMENTS_SUFFIX = "_segments.parquet"
+
+
+def preprocessed_routes(output_dir:str = ROUTE_DATA_DIR)->Dict[str, str]:
+    # route -> segment rows file of the routes preprocessed into output_dir
+    if not os.path.isdir(output_dir):
+        return {}
+    return {name[:-len(SEGMENTS_SUFFIX)]: os.path.join(output_dir, name)
+            for name in sorted(os.listdir(output_dir)) if name.endswith(SEGMENTS_SUFFIX)}
+
+
+def load_route_segments(paths:Dict[str, str])->pd.DataFrame:
+    # the segment dataset from per-route outputs, the app's replacement of fetch_filtered_segment_data
+    # once routes are preprocessed (the map geometry is picked up by utils.prepare_split_path_geometry)
+    frames = []
+    for route, path in paths.items():
+        df = pd.read_parquet(path)
+        frames.append(compact_segment_dataset(df, crs=df.attrs.get('crs')))
+        # the map geometry written next to the segment rows by process_route
+        ROUTE_GEOMETRY_PATHS[route] = route_output_paths(route, os.path.dirname(path))[1]
+    return concat_segment_datasets(frames)
+
+
+def process_route(route:str,
+                  output_dir:str = ROUTE_DATA_DIR,
+                  start_date=None,
+                  end_date=None)->dict:
+    # loading, segment assignment, segment durations and map geometry of one route
+    start = time.perf_counter()
+    gdf = load_dataset(route=route, start_date=start_date, end_date=end_date,
+                       columns=[c for c in GPS_COLUMNS if c != 'segment'], arrow_backed=False)
+    segments_path, geometry_path = route_output_paths(route, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    df_segment = label_route_segments(gdf, route)
+    n_rows = 0
+    if df_segment is not None:
+        df_segment.to_parquet(segments_path)
+        split_path = split_route_path(route)
+        route_geometry = prepare_split_path_geometry(split_path, df_segment['segment'].unique(), route)
+        write_route_geometry(route_geometry, geometry_path, split_path)
+        n_rows = len(df_segment)
+    return dict(route=route, pings=len(gdf), rows=n_rows, seconds=time.perf_counter() - start)
+
+
+def preprocess_routes(routes:Sequence[str],
+                      output_dir:str = ROUTE_DATA_DIR,
+                      max_workers:Optional[int] = None,
+                      start_date=None,
+                      end_date=None)->pd.DataFrame:
+    # routes are independent, so they fan out over a process pool with one worker per route
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or min(len(routes), os.cpu_count() or 1)
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process_route, route, output_dir, start_date, end_date): route for route in routes}
+        for future in as_completed(futures):
+            results.append(future.result())
+    return pd.DataFrame(results).set_index("route").sort_index()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", nargs="+", default=["101"])
+    parser.add_argument("--output-dir", default=ROUTE_DATA_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = preprocess_routes(args.routes, args.output_dir, args.workers)
+    print(results.to_string())
+    print(f"{len(args.routes)} routes in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence
+
+# metrics the map and the charts can switch between, with their labels in the UI
+METRICS = {"mean": "Mittelwert", "median": "Median", "p85": "85. Perzentil", "p95": "95. Perzentil", "var": "Varianz"}
+QUANTILES = (0.5, 0.85, 0.95)
+
+# relative deviation from the baseline -> Minimal / Moderate / Intense Delay
+DEVIATION_BINS = np.array([0.1, 0.25])
+DEVIATION_COLORS = [(0, 153, 0, 1), (255, 165, 0, 1), (204, 0, 0, 1)]
+NO_DATA_COLOR = (128, 128, 128, 1)
+
+
+def _object_array(values:list)->np.ndarray:
+    out = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        out[i] = value
+    return out
+
+# palette lookup table, the last entry for segments without a baseline
+_PALETTE = _object_array(DEVIATION_COLORS + [NO_DATA_COLOR])
+
+
+def quantile_name(q:float)->str:
+    return "median" if q == 0.5 else f"p{round(q * 100)}"
+
+
+def grouped_statistics(values,
+                       groups,
+                       quantiles:Sequence[float] = QUANTILES)->pd.DataFrame:
+    # count / mean / var / std and quantiles per group with a single pandas groupby, the quantiles of all
+    # levels in one call (linear interpolation). NaN values and groups are ignored
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    keys = pd.Series(groups).reset_index(drop=True)[valid]
+    grouped = pd.Series(values[valid], index=keys.index).groupby(keys, observed=True, sort=True)
+    out = grouped.agg(["count", "mean", "var", "std"])
+    if len(quantiles):
+        levels = grouped.quantile(list(quantiles)).unstack()
+        for q in quantiles:
+            out[quantile_name(q)] = levels[q]
+    return out.rename_axis(getattr(groups, "name", None))
+
+
+def relative_deviation(values, baseline)->np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    baseline = np.asarray(baseline, dtype=np.float64)
+    return (values - baseline) / baseline
+
+
+def segment_statistics(df:pd.DataFrame,
+                       baseline:Optional[pd.DataFrame] = None,
+                       by:str = "segment",
+                       value_col:str = "duration",
+                       quantiles:Sequence[float] = QUANTILES)->pd.DataFrame:
+    # the per-segment statistics of all METRICS, plus deviation_<metric> columns relative to baseline
+    # (the statistics of the baseline rows) when given. Any metric is then a column lookup
+    stats = grouped_statistics(df[value_col], df[by], quantiles).rename_axis(by)
+    if baseline is not None:
+        for metric in METRICS:
+            if metric in stats.columns and metric in baseline.columns:
+                stats[f"deviation_{metric}"] = relative_deviation(stats[metric], baseline[metric].reindex(stats.index))
+    return stats
+
+
+def deviation_color_index(deviation)->np.ndarray:
+    # palette position per deviation, NaN (no baseline) -> the last entry
+    deviation = np.asarray(deviation, dtype=np.float64)
+    index = np.searchsorted(DEVIATION_BINS, deviation, side="right")
+    index[np.isnan(deviation)] = len(DEVIATION_COLORS)
+    return index
+
+
+def deviation_colors(deviation)->np.ndarray:
+    # rgba tuple per deviation as a single table lookup over all segments
+    return _PALETTE[deviation_color_index(deviation)]
+
+
+def deviation_table(stats1:pd.DataFrame,
+                    stats2:pd.DataFrame,
+                    metric:str = "mean")->pd.DataFrame:
+    # the deviation table the map consumes (deviation and rgba per segment): metric of the selected
+    # filter (stats1) relative to the same metric of its baseline (stats2)
+    deviation = relative_deviation(stats1[metric], stats2[metric].reindex(stats1.index))
+    dt = pd.DataFrame({"deviation": deviation}, index=stats1.index.rename("segment"))
+    dt["rgba"] = deviation_colors(deviation)
+    return dt
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+# memory-mapped Arrow IPC files of the segment dataset, shared by all server processes on the host
+SHARED_DATASET_DIR = os.environ.get("VGI_SHARED_DIR", ".vgi_shared")
+SHARED_DATASET_PREFIX = "segments-"
+
+try:
+    import fcntl
+except ImportError:  # Windows, building the file twice is harmless
+    fcntl = None
+
+
+def shared_dataset_key(*parts)->str:
+    # file name key of a dataset state, e.g. the base file versions plus the ingested partition checksums
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def shared_dataset_path(key:str, directory:str = SHARED_DATASET_DIR)->str:
+    return os.path.join(directory, f"{SHARED_DATASET_PREFIX}{key}.arrow")
+
+
+def _point_coordinates(df:pd.DataFrame)->tuple:
+    # x / y of the representative GPS point, from the WKB geometry column and/or earlier x / y columns
+    x = df['x'].to_numpy(dtype=np.float64, copy=True) if 'x' in df.columns else np.full(len(df), np.nan)
+    y = df['y'].to_numpy(dtype=np.float64, copy=True) if 'y' in df.columns else np.full(len(df), np.nan)
+    if 'geometry' in df.columns:
+        wkb = df['geometry'].to_numpy(dtype=object, na_value=None)
+        has_geometry = pd.notna(wkb)
+        points = shapely.from_wkb(wkb[has_geometry])
+        x[has_geometry] = shapely.get_x(points)
+        y[has_geometry] = shapely.get_y(points)
+    return x, y
+
+
+def to_shared_table(df:pd.DataFrame)->pa.Table:
+    # compact segment dataset -> one record batch of fixed width columns: categoricals as dictionary
+    # arrays, geometry as x / y coordinates, rows grouped by route so a route is a contiguous slice
+    df = df.drop(columns=[c for c in ['geometry', 'x', 'y'] if c in df.columns]).assign(**dict(zip("xy", _point_coordinates(df))))
+    if 'route' in df.columns:
+        df, ranges = sort_by_route(df)
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    metadata = {b"crs": json.dumps(df.attrs.get('crs')).encode()}
+    if 'route' in df.columns:
+        metadata[b"route_ranges"] = json.dumps(ranges).encode()
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+
+def sort_by_route(df:pd.DataFrame)->tuple:
+    # rows grouped by route (stable) and the [start, stop) row range of each route in the result
+    df = df.sort_values('route', kind='stable')
+    codes = df['route'].astype('category')
+    counts = codes.value_counts(sort=False).reindex(codes.cat.categories, fill_value=0)
+    stops = np.cumsum(counts.to_numpy())
+    ranges = {str(route): [int(stop - count), int(stop)] for route, count, stop in zip(counts.index, counts, stops) if count > 0}
+    return df, ranges
+
+
+def write_shared_dataset(df:pd.DataFrame, path:str)->None:
+    # uncompressed, so readers can map the column buffers directly; written atomically
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table = to_shared_table(df)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _column_to_pandas(column:pa.ChunkedArray):
+    # zero-copy numpy view of a single chunk column where the Arrow layout allows it
+    array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+    if pa.types.is_dictionary(array.type):
+        # null entries (e.g. the partition of the base rows) become code -1, without going through float
+        codes = array.indices.fill_null(-1) if array.null_count > 0 else array.indices
+        codes = codes.to_numpy(zero_copy_only=False).astype(np.int64, copy=False)
+        return pd.Categorical.from_codes(codes, categories=array.dictionary.to_pandas())
+    if array.null_count == 0 and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)
+                                  or (pa.types.is_timestamp(array.type) and array.type.tz is None)):
+        return array.to_numpy(zero_copy_only=True)
+    return array.to_pandas()
+
+
+def open_shared_dataset(path:str)->pd.DataFrame:
+    # maps the file read-only: numeric and time columns are numpy views on the page cache, so every
+    # process and session reads the same physical memory. The frame must be treated as read-only
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    df = pd.DataFrame({name: _column_to_pandas(table.column(name)) for name in table.column_names}, copy=False)
+    metadata = table.schema.metadata or {}
+    # crs string of utils.crs_string, files written before as PROJJSON are converted
+    crs = json.loads(metadata.get(b"crs", b"null"))
+    if isinstance(crs, dict):
+        import pyproj
+        crs = pyproj.CRS.from_json_dict(crs).to_string()
+    df.attrs['crs'] = crs
+    df.attrs['route_ranges'] = json.loads(metadata.get(b"route_ranges", b"{}"))
+    df.attrs['shared_path'] = path
+    df.attrs['shared_rows'] = len(df)
+    return df
+
+
+def load_shared_dataset(key:str,
+                        build:Callable[[], pd.DataFrame],
+                        directory:str = SHARED_DATASET_DIR)->pd.DataFrame:
+    # maps the shared file of key, the first process to get here builds and writes it while the others wait
+    path = shared_dataset_path(key, directory)
+    while True:
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            with open(path + ".lock", "w") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.exists(path):
+                    write_shared_dataset(build(), path)
+        try:
+            return open_shared_dataset(path)
+        except FileNotFoundError:
+            # removed as stale by a process that moved on meanwhile, build it again
+            continue
+
+
+def remove_stale_shared_datasets(keep:str, directory:str = SHARED_DATASET_DIR)->None:
+    # files of older dataset states; processes that still map them keep reading until they remap (POSIX)
+    for name in os.listdir(directory):
+        if name.startswith(SHARED_DATASET_PREFIX) and name.endswith((".arrow", ".lock")) and keep not in name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def route_rows(df:pd.DataFrame, route:str)->pd.DataFrame:
+    # rows of one route: a slice (no copy) of a shared dataset, a boolean selection otherwise
+    ranges = df.attrs.get('route_ranges')
+    if ranges and df.attrs.get('shared_rows') == len(df):
+        start, stop = ranges.get(str(route), (0, 0))
+        rows = df.iloc[start:stop]
+        rows.attrs = {key: value for key, value in df.attrs.items() if key not in ('route_ranges', 'shared_rows')}
+        return rows
+    return df[df['route'] == route]
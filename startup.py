@@ -0,0 +1,42 @@
+import threading
+from typing import Any, Callable, Optional
+
+
+class BackgroundLoader:
+    # runs load(loader) in a daemon thread. load reports its progress with set_phase, pages that need
+    # the result poll phase / progress for a progress bar and then call result()
+    def __init__(self, load:Callable[["BackgroundLoader"], Any]):
+        self.phase = "Start"
+        self.progress = 0.0
+        self._result = None
+        self._error: Optional[BaseException] = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(load,), name="vgi-background-loader", daemon=True)
+        self._thread.start()
+
+    def _run(self, load:Callable)->None:
+        try:
+            self._result = load(self)
+            self.set_phase("Bereit", 1.0)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def set_phase(self, phase:str, progress:float)->None:
+        self.phase = phase
+        self.progress = progress
+
+    @property
+    def done(self)->bool:
+        return self._done.is_set()
+
+    def wait(self, timeout:Optional[float] = None)->bool:
+        return self._done.wait(timeout)
+
+    def result(self):
+        # blocks until loaded, re-raises a failure of the load
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,345 @@
+"""Streaming mode: GPS pings in arrival order -> segment traversals -> live deviation table.
+
+Pings are newline-delimited JSON objects with run, route, utcTime, speed and the position as
+lon / lat (or x / y, or a WKT geometry), read from a growing file or a TCP socket. To try it
+without a live feed, replay the labelled GPS data as such a socket:
+
+    python streaming.py --serve gps_labeled.parquet --port 9000 --rate 2000
+    VGI_LIVE_SOURCE=tcp://localhost:9000 streamlit run my_app.py
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from instrumentation import count, span
+from segment_stats import deviation_table
+from utils import build_segment_tree, nearest_segments, route_bus_stop_reverse_mapping, split_route_path
+
+# file path or tcp://host:port of the live ping feed, the live mode is off when not set
+LIVE_SOURCE = os.environ.get("VGI_LIVE_SOURCE")
+# durations of the last LIVE_WINDOW_S seconds make up the live statistics
+LIVE_WINDOW_S = float(os.environ.get("VGI_LIVE_WINDOW_S", 3600))
+# a run without pings for RUN_TIMEOUT_S seconds has ended, its last segment is closed with its last ping
+RUN_TIMEOUT_S = float(os.environ.get("VGI_RUN_TIMEOUT_S", 600))
+
+TRAVERSAL_COLUMNS = ["run", "segment", "route", "utcTime", "duration"]
+NS = 1_000_000_000
+
+
+''' PING SOURCES '''
+
+def pings_from_records(records:list)->pd.DataFrame:
+    # JSON ping records -> run, route, utcTime, x, y, speed columns
+    df = pd.DataFrame.from_records(records)
+    if "geometry" in df.columns:
+        points = shapely.from_wkt(df.pop("geometry").to_numpy())
+        df["x"], df["y"] = shapely.get_x(points), shapely.get_y(points)
+    elif "lon" in df.columns:
+        df = df.rename(columns={"lon": "x", "lat": "y"})
+    df["run"] = df["run"].astype(str)
+    df["route"] = df["route"].astype(str)
+    df["utcTime"] = pd.to_datetime(df["utcTime"])
+    return df
+
+
+def tail_pings(path:str,
+               batch_size:int = 1000,
+               poll_interval:float = 0.5,
+               from_start:bool = False)->Iterator[pd.DataFrame]:
+    # batches of the lines appended to a JSON lines file, like tail -f
+    with open(path) as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        records, partial = [], ""
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                records.append(json.loads(partial + line))
+                partial = ""
+                if len(records) >= batch_size:
+                    yield pings_from_records(records)
+                    records = []
+            elif line:
+                # the writer has not finished the line yet
+                partial += line
+            else:
+                if records:
+                    yield pings_from_records(records)
+                    records = []
+                time.sleep(poll_interval)
+
+
+def socket_pings(host:str,
+                 port:int,
+                 batch_size:int = 1000,
+                 max_delay:float = 0.5)->Iterator[pd.DataFrame]:
+    # batches of the JSON lines sent over a TCP connection, flushed at least every max_delay seconds
+    with socket.create_connection((host, port)) as sock:
+        sock.settimeout(max_delay)
+        buffer, records = b"", []
+        while True:
+            try:
+                chunk = sock.recv(2**16)
+            except socket.timeout:
+                chunk = None
+            if chunk == b"":
+                break
+            if chunk:
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                records.extend(json.loads(line) for line in lines if line.strip())
+            if records and (chunk is None or len(records) >= batch_size):
+                yield pings_from_records(records)
+                records = []
+        if records:
+            yield pings_from_records(records)
+
+
+def ping_source(spec:str, **kwargs)->Iterator[pd.DataFrame]:
+    if spec.startswith("tcp://"):
+        host, port = spec[len("tcp://"):].rsplit(":", 1)
+        return socket_pings(host, int(port), **kwargs)
+    return tail_pings(spec, **kwargs)
+
+
+def replay_pings(gps:pd.DataFrame, batch_size:int = 1000)->Iterator[pd.DataFrame]:
+    # labelled GPS pings in time order, in the batch layout of the live sources
+    gps = gps.sort_values("utcTime", kind="stable")
+    points = np.asarray(gps.geometry)
+    pings = pd.DataFrame({"run": gps["run"].astype(str).to_numpy(),
+                          "route": gps["route"].astype(str).to_numpy(),
+                          "utcTime": gps["utcTime"].to_numpy(),
+                          "x": shapely.get_x(points),
+                          "y": shapely.get_y(points),
+                          "speed": gps["speed"].to_numpy()})
+    for start in range(0, len(pings), batch_size):
+        yield pings.iloc[start:start + batch_size]
+
+
+def serve_pings(path:str, port:int, rate:float = 1000.0)->None:
+    # socket stand-in for the live feed: replays a labelled GPS parquet as JSON lines, rate pings per second
+    import geopandas as gpd
+    gps = gpd.read_parquet(path)
+    with socket.create_server(("", port)) as server:
+        conn, _ = server.accept()
+        with conn:
+            for batch in replay_pings(gps, batch_size=max(int(rate / 10), 1)):
+                start = time.monotonic()
+                lines = batch.assign(utcTime=batch["utcTime"].astype(str)).to_json(orient="records", lines=True)
+                conn.sendall(lines.encode() + b"\n")
+                time.sleep(max(0.0, len(batch) / rate - (time.monotonic() - start)))
+
+
+''' TRIP RECONSTRUCTION '''
+
+class TripReconstructor:
+    # one state machine per active run: (segment, route, entry time, last ping time), nothing else is kept.
+    # A run enters a segment with its first ping there and leaves it with the first ping of the next segment,
+    # the traversal duration is entry to next entry as in utils.segment_durations_from_traversals.
+    # Runs without pings for run_timeout seconds are closed with their last ping, at most max_runs are tracked.
+    # Times are int64 nanoseconds
+    def __init__(self, run_timeout:float = RUN_TIMEOUT_S, max_runs:int = 10_000):
+        self.run_timeout_ns = int(run_timeout * NS)
+        self.max_runs = max_runs
+        self.states = OrderedDict()
+        self.late_pings = 0
+
+    def update(self,
+               run:np.ndarray,
+               route:np.ndarray,
+               segment:np.ndarray,
+               times:np.ndarray)->list:
+        # one batch of pings (segment None off the route), returns the finished traversals as
+        # (run, segment, route, entry_ns, duration_s) tuples
+        on_route = pd.notna(segment)
+        run, route, segment, times = run[on_route], route[on_route], segment[on_route], times[on_route]
+        codes, runs = pd.factorize(run)
+        # pings older than the last one of their run are dropped
+        last_times = np.array([self.states[r][3] if r in self.states else np.iinfo(np.int64).min for r in runs], dtype=np.int64)
+        in_order = times > last_times[codes]
+        self.late_pings += int((~in_order).sum())
+        codes, route, segment, times = codes[in_order], route[in_order], segment[in_order], times[in_order]
+        if len(codes) == 0:
+            return []
+
+        order = np.lexsort((times, codes))
+        codes, route, segment, times = codes[order], route[order], segment[order], times[order]
+        new_run = np.r_[True, codes[1:] != codes[:-1]]
+        entries = np.flatnonzero(new_run | np.r_[True, segment[1:] != segment[:-1]])
+        entry_codes = codes[entries]
+        entry_times = times[entries].copy()
+        first_entry = np.r_[True, entry_codes[1:] != entry_codes[:-1]]
+
+        finished = []
+        for k in np.flatnonzero(first_entry):
+            state = self.states.get(runs[entry_codes[k]])
+            if state is None:
+                continue
+            if state[0] == segment[entries[k]]:
+                # still in the segment of the previous batch
+                entry_times[k] = state[2]
+            else:
+                finished.append((runs[entry_codes[k]], state[0], state[1], state[2], (times[entries[k]] - state[2]) / NS))
+
+        # segment changes inside the batch
+        same_run = entry_codes[:-1] == entry_codes[1:]
+        left = entries[:-1][same_run]
+        durations = (times[entries[1:][same_run]] - entry_times[:-1][same_run]) / NS
+        finished.extend(zip(runs[codes[left]], segment[left], route[left], entry_times[:-1][same_run], durations))
+
+        # the open traversal of each run
+        last_entry = np.r_[~same_run, True]
+        last_ping = np.r_[new_run[1:], True]
+        for k, last_time in zip(np.flatnonzero(last_entry), times[last_ping]):
+            r = runs[entry_codes[k]]
+            self.states[r] = (segment[entries[k]], route[entries[k]], entry_times[k], last_time)
+            self.states.move_to_end(r)
+        return finished
+
+    def expire(self, now_ns:int)->list:
+        # closes runs that have been idle for run_timeout and the least recently active ones above max_runs
+        finished = []
+        while self.states:
+            r, (segment, route, entry, last_time) = next(iter(self.states.items()))
+            if last_time >= now_ns - self.run_timeout_ns and len(self.states) <= self.max_runs:
+                break
+            del self.states[r]
+            finished.append((r, segment, route, entry, (last_time - entry) / NS))
+        return finished
+
+
+def traversals_frame(finished:list)->pd.DataFrame:
+    # finished traversal tuples in the layout of the segment dataset
+    df = pd.DataFrame(finished, columns=TRAVERSAL_COLUMNS)
+    df["utcTime"] = pd.to_datetime(df["utcTime"].astype(np.int64))
+    return df
+
+
+class SegmentWindow:
+    # entry time and duration of the traversals of the last window seconds per (route, segment), at most
+    # max_per_segment each. Segment names repeat across routes, so the route is part of the key
+    def __init__(self, window:float = LIVE_WINDOW_S, max_per_segment:int = 10_000):
+        self.window_ns = int(window * NS)
+        self.max_per_segment = max_per_segment
+        self.segments = {}
+
+    def add(self, traversals:list)->None:
+        for _, segment, route, entry, duration in traversals:
+            key = (route, segment)
+            if key not in self.segments:
+                self.segments[key] = deque(maxlen=self.max_per_segment)
+            self.segments[key].append((entry, duration))
+
+    def stats(self, now_ns:int, route:str)->pd.DataFrame:
+        # count / mean / std per segment of route, the layout of aggregates.compare_segment_stats
+        cutoff = now_ns - self.window_ns
+        rows = {}
+        for (segment_route, segment), values in self.segments.items():
+            while values and values[0][0] < cutoff:
+                values.popleft()
+            if values and segment_route == route:
+                durations = np.fromiter((d for _, d in values), dtype=np.float64, count=len(values))
+                rows[segment] = (len(durations), durations.mean(), durations.std(ddof=1) if len(durations) > 1 else np.nan)
+        stats = pd.DataFrame.from_dict(rows, orient="index", columns=["count", "mean", "std"])
+        return stats.rename_axis("segment")
+
+
+class LiveSegmentDelays:
+    # consumes ping batches: segment assignment against the split route of each route, trip reconstruction
+    # and the live per-segment statistics that the deviation table of the map is computed from
+    def __init__(self,
+                 routes:tuple = ("101",),
+                 window:float = LIVE_WINDOW_S,
+                 run_timeout:float = RUN_TIMEOUT_S,
+                 distance_threshold:float = 0.01,
+                 split_routes:Optional[dict] = None):
+        # split_routes: split route (path or GeoDataFrame) per route, default the file of split_route_path
+        split_routes = split_routes or {}
+        self.trees = {}
+        for route in routes:
+            segment_index, tree = build_segment_tree(split_routes.get(route, split_route_path(route)))
+            # split route names -> dataset names, once for the index instead of per ping
+            mapping = route_bus_stop_reverse_mapping(route)
+            self.trees[route] = (np.array([mapping.get(s, s) for s in segment_index], dtype=object), tree)
+        self.distance_threshold = distance_threshold
+        self.trips = TripReconstructor(run_timeout)
+        self.window = SegmentWindow(window)
+        self.pings = 0
+        self.traversals = 0
+        self.now_ns = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def process(self, pings:pd.DataFrame)->list:
+        # one batch in the layout of pings_from_records, returns the traversals it finished
+        with span("live_batch", pings=len(pings)):
+            points = shapely.points(pings["x"].to_numpy(dtype=np.float64), pings["y"].to_numpy(dtype=np.float64))
+            routes = pings["route"].to_numpy(dtype=object)
+            segment = np.full(len(pings), None, dtype=object)
+            for route, (segment_index, tree) in self.trees.items():
+                on_route = routes == route
+                if on_route.any():
+                    segment[on_route] = nearest_segments(points[on_route], segment_index, tree, self.distance_threshold)
+            times = pings["utcTime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+            with self._lock:
+                finished = self.trips.update(pings["run"].to_numpy(dtype=object), routes, segment, times)
+                self.now_ns = max(self.now_ns, int(times.max()))
+                finished += self.trips.expire(self.now_ns)
+                self.window.add(finished)
+                self.pings += len(pings)
+                self.traversals += len(finished)
+        count("live_pings", len(pings))
+        count("live_traversals", len(finished))
+        return finished
+
+    def consume(self, batches:Iterable[pd.DataFrame])->None:
+        for batch in batches:
+            if len(batch) > 0:
+                self.process(batch)
+
+    def start(self, batches:Iterable[pd.DataFrame])->None:
+        # consume in a daemon thread, the dashboard reads deviation_table meanwhile
+        self._thread = threading.Thread(target=self.consume, args=(batches,), name="vgi-live-pings", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self)->bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def latest_time(self)->Optional[pd.Timestamp]:
+        return pd.Timestamp(self.now_ns) if self.now_ns else None
+
+    def live_stats(self, route:str)->pd.DataFrame:
+        with self._lock:
+            return self.window.stats(self.now_ns, route)
+
+    def deviation_table(self, baseline:pd.DataFrame, route:str)->pd.DataFrame:
+        # live mean durations of route against baseline (per-segment statistics of the same route with a
+        # mean column, e.g. its cube cells for the current weekday and hour) in the deviation table layout
+        # the map consumes
+        return deviation_table(self.live_stats(route), baseline)
+
+    def active_runs(self)->int:
+        return len(self.trips.states)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", required=True, help="labelled GPS parquet to replay")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="pings per second")
+    args = parser.parse_args()
+    serve_pings(args.serve, args.port, args.rate)
+
+
+if __name__ == "__main__":
+    main()
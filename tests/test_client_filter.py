@@ -0,0 +1,54 @@
+import datetime
+import json
+
+import numpy as np
+
+from aggregates import build_segment_cube, compare_segment_stats
+from benchmarks.synthetic import make_deviation_table, make_segment_durations, make_split_route
+from client_filter import CLIENT_PALETTE, SUM_DECIMALS, aggregate_deviation, client_filter_html, weekday_hour_aggregate
+from segment_stats import DEVIATION_BINS
+from utils import build_NewMindFresh_figure
+
+SELECTIONS = [(["Wednesday"], 12, None), (["Monday", "Friday"], 6, 9), ([], 0, None)]
+
+
+def test_client_matches_server():
+    df = make_segment_durations(make_split_route(n_road_paths=5), days=14, runs_per_day=6)
+    start_date, end_date = df["utcTime"].min().date(), df["utcTime"].max().date()
+    # the aggregate as the browser receives it
+    aggregate = json.loads(json.dumps(weekday_hour_aggregate(build_segment_cube(df), start_date, end_date)))
+    for days_of_week, start_hour, end_hour in SELECTIONS:
+        filter1 = (start_date, end_date, days_of_week, datetime.time(start_hour), None if end_hour is None else datetime.time(end_hour))
+        filter2 = (start_date, end_date, days_of_week, None, None)
+        expected, _, stats2 = compare_segment_stats(df, filter1, filter2)
+        result = aggregate_deviation(aggregate, days_of_week, start_hour, end_hour).reindex(expected.index)
+
+        # the rounded sums move each mean by at most half a unit of the last decimal
+        deviation = expected["deviation"].to_numpy()
+        bound = 0.5 * 10.0 ** -SUM_DECIMALS * (2 + np.abs(deviation)) / stats2["mean"].reindex(expected.index).to_numpy() + 1e-12
+        difference = np.abs(result["deviation"].to_numpy() - deviation)
+        assert np.all((difference <= bound) | (np.isnan(deviation) & result["deviation"].isna().to_numpy()))
+        near_bin = (np.abs(deviation[:, None] - DEVIATION_BINS) <= bound[:, None]).any(axis=1)
+        same_colour = np.array([a == b for a, b in zip(result["rgba"], expected["rgba"])])
+        assert np.all(same_colour | near_bin)
+
+
+def test_client_map_is_batched():
+    split_route = make_split_route(n_road_paths=40)
+    dt = make_deviation_table(split_route)
+    segments = dt.index.to_frame(index=False, name="segment")
+    fig = build_NewMindFresh_figure(segments, dt, split_route, lw=13, palette=CLIENT_PALETTE)
+    per_segment = build_NewMindFresh_figure(segments, dt, split_route, lw=13, batched=False)
+    assert len(fig.data) < 12 < len(per_segment.data)
+    assert len(fig.to_json()) < len(per_segment.to_json())
+
+    # every line and marker point knows its segment, the line traces cover the whole palette
+    names = fig.layout.meta["segments"]
+    assert sorted(names) == sorted(split_route.index)
+    lines = [trace for trace in fig.data if trace.mode == "lines"]
+    assert {trace.line.color for trace in lines} == set(CLIENT_PALETTE)
+    for trace in fig.data:
+        if trace.mode in ("lines", "markers"):
+            assert len(trace.customdata) == len(trace.lon)
+    aggregate = {"segments": list(split_route.index), "count": [], "sum": []}
+    assert "Plotly.restyle" in client_filter_html(fig, aggregate)
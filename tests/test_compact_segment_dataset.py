@@ -0,0 +1,33 @@
+import warnings
+
+import pandas as pd
+import pyproj
+
+from benchmarks.synthetic import make_labelled_gps, make_segment_durations, make_split_route
+from shared_dataset import to_shared_table
+from utils import compact_segment_dataset, segment_geometries
+
+
+def _dataset():
+    split_route = make_split_route(n_road_paths=5)
+    durations = make_segment_durations(split_route, days=1, runs_per_day=3)
+    gps = make_labelled_gps(split_route, durations, pings_per_segment=1)
+    df = durations.assign(geometry=gps.geometry.to_numpy())
+    return compact_segment_dataset(df, crs=pyproj.CRS.from_user_input(gps.crs))
+
+
+def test_crs_attrs_are_serialisable(tmp_path):
+    df = _dataset()
+    assert isinstance(df.attrs['crs'], str)
+    path = tmp_path / "segments.parquet"
+    df.to_parquet(path)
+    back = compact_segment_dataset(pd.read_parquet(path), crs=df.attrs['crs'])
+    assert pyproj.CRS(segment_geometries(back).crs) == pyproj.CRS("EPSG:4326")
+
+
+def test_shared_table_without_warnings():
+    df = _dataset()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        table = to_shared_table(df)
+    assert table.num_rows == len(df)
@@ -0,0 +1,33 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from aggregates import compare_segment_stats
+from benchmarks.synthetic import make_dataset_files
+from segment_stats import METRICS
+from utils import fetch_filtered_segment_data
+
+# the DuckDB backend is optional (requirements-duckdb.txt)
+pytest.importorskip("duckdb")
+from duckdb_backend import SegmentQueryEngine  # noqa: E402
+
+FILTER_1 = (datetime.date(2023, 10, 1), datetime.date(2023, 10, 14), ["Wednesday"], datetime.time(12, 0), None)
+FILTER_2 = (datetime.date(2023, 10, 1), datetime.date(2023, 10, 14), ["Wednesday"], None, None)
+
+
+@pytest.mark.parametrize("metric", METRICS)
+def test_matches_pandas(tmp_path, metric):
+    paths = make_dataset_files(str(tmp_path), days=14, runs_per_day=6, n_road_paths=5)["paths"]
+    dataset = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+    expected = compare_segment_stats(dataset, FILTER_1, FILTER_2, metric)
+    engines = (SegmentQueryEngine.from_dataframe(dataset),
+               SegmentQueryEngine.from_parquet(paths["gps_labeled"], paths["segment_duration"]))
+    for engine in engines:
+        result = engine.compare_segment_durations(FILTER_1, FILTER_2, route="101", metric=metric)
+        for r, e in zip(result, expected):
+            e = e.set_axis(e.index.astype(str))
+            assert sorted(r.index) == sorted(e.index)
+            for column in e.columns.intersection(r.columns).drop("rgba", errors="ignore"):
+                assert np.allclose(r[column].reindex(e.index).astype(float), e[column].astype(float), equal_nan=True), column
+        assert list(result[0]["rgba"].reindex(expected[0].index.astype(str))) == list(expected[0]["rgba"])
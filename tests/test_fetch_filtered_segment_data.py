@@ -0,0 +1,45 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from benchmarks.synthetic import make_dataset_files
+from utils import fetch_filtered_segment_data, segment_geometries
+
+
+def test_one_row_per_traversal_with_first_ping(tmp_path, monkeypatch):
+    data = make_dataset_files(str(tmp_path), days=2, runs_per_day=4, n_road_paths=5)
+    paths = data["paths"]
+
+    # the pings stay WKB, only the kept geometries are decoded later by segment_geometries
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("GPS geometries decoded")
+    monkeypatch.setattr(gpd.GeoSeries, "from_wkb", no_decoding)
+    df = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+    monkeypatch.undo()
+
+    assert len(df) == len(data["segment_durations"])
+    gps = data["gps"].sort_values("utcTime")
+    first = gps.groupby(["run", "segment"]).head(1).set_index(["run", "segment"])
+    keys = list(zip(df["run"].astype(str), df["segment"].astype(str)))
+    expected = first.geometry.loc[keys].to_numpy()
+    assert np.all(shapely.equals(np.asarray(segment_geometries(df)), expected))
+    assert (df["utcTime"].to_numpy() == first["utcTime"].loc[keys].to_numpy()).all()
+
+
+def test_stop_names_mapped_with_the_route_mapping(tmp_path):
+    # route 101 durations with raw stop names, the labelled GPS with the split route keys
+    data = make_dataset_files(str(tmp_path), days=1, runs_per_day=4, n_road_paths=5)
+    paths = data["paths"]
+    gps = data["gps"].assign(segment=data["gps"]["segment"].astype(str).replace({"haltestelle_0": "haltestelle_geibelstrase"}))
+    gps.to_parquet(paths["gps_labeled"])
+    durations = data["segment_durations"].drop(columns="utcTime")
+    durations["segment"] = durations["segment"].astype(str).replace({"haltestelle_0": "Geibelstraße,2"})
+    durations.to_parquet(paths["segment_duration"])
+
+    for route in (None, "101"):
+        df = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"], route=route)
+        segments = df["segment"].astype(str)
+        assert "Geibelstraße,2" not in set(segments)
+        stops = df[segments == "haltestelle_geibelstrase"]
+        assert len(stops) == (durations["segment"] == "Geibelstraße,2").sum() > 0
+        assert stops["utcTime"].notna().all()
@@ -0,0 +1,41 @@
+import pytest
+
+import utils
+from benchmarks.synthetic import make_deviation_table, make_split_route
+from utils import (LOD_ZOOM_LEVELS, MAP_HEIGHT_PX, build_NewMindFresh_figure, geometry_bounds, lod_tolerance,
+                   prepare_split_path_geometry, zoom_for_extent)
+
+
+@pytest.fixture
+def split_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    split_route = make_split_route(n_road_paths=40)
+    split_route.to_parquet(tmp_path / "split_route.parquet")
+    return split_route, str(tmp_path / "split_route.parquet")
+
+
+def _vertices(route_geometry):
+    return sum(len(lon) for lon in route_geometry["lon"])
+
+
+def test_levels_are_precomputed_once(split_path):
+    split_route, path = split_path
+    utils._load_split_path_geometry_levels.cache_clear()
+    levels = [prepare_split_path_geometry(path, split_route.index, "999", lod_tolerance(zoom)) for zoom in LOD_ZOOM_LEVELS + (18,)]
+    assert utils._load_split_path_geometry_levels.cache_info().misses == 1
+    assert prepare_split_path_geometry(path, split_route.index, "999", lod_tolerance(LOD_ZOOM_LEVELS[0])) is levels[0]
+    vertices = [_vertices(level) for level in levels]
+    assert vertices == sorted(vertices) and vertices[0] < vertices[-1]
+
+
+def test_zoom_and_level_from_the_extent(split_path):
+    split_route, path = split_path
+    segments = split_route.reset_index()[["segment"]]
+    zooms = []
+    for rows in (segments, segments.iloc[:3]):
+        fig = build_NewMindFresh_figure(rows, make_deviation_table(split_route), path, route="999")
+        full = prepare_split_path_geometry(path, rows["segment"], "999")
+        assert fig.layout.mapbox.zoom == pytest.approx(zoom_for_extent(geometry_bounds(full), MAP_HEIGHT_PX, MAP_HEIGHT_PX))
+        zooms.append(fig.layout.mapbox.zoom)
+    # a smaller extent zooms in and gets a finer level
+    assert zooms[1] > zooms[0] and lod_tolerance(zooms[1]) <= lod_tolerance(zooms[0])
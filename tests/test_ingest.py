@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+import ingest
+from benchmarks.synthetic import make_dataset_files
+from ingest import IncrementalSegmentDataset
+from utils import fetch_filtered_segment_data
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    # batch output of the first day, the raw GPS partitions of both days
+    data = make_dataset_files(str(tmp_path / "data"), days=2, runs_per_day=4, n_road_paths=5)
+    monkeypatch.setattr(ingest, "split_route_path", lambda route: data["paths"]["split_route"])
+    monkeypatch.chdir(tmp_path)
+    return data
+
+
+def _dataset(data, state_dir, **kwargs):
+    paths = data["paths"]
+    second_day = data["gps"]["utcTime"].dt.normalize().max()
+
+    def load_base():
+        df = fetch_filtered_segment_data(paths["gps_labeled"], paths["segment_duration"])
+        return df[df["utcTime"] < second_day]
+    return IncrementalSegmentDataset(load_base=load_base,
+                                     base_paths=(paths["gps_labeled"], paths["segment_duration"]),
+                                     gps_path=paths["gps_raw"],
+                                     routes=("101",),
+                                     state_dir=str(state_dir),
+                                     **kwargs)
+
+
+def test_ingests_new_partition(data, tmp_path):
+    state_dir = tmp_path / "state"
+    dataset = _dataset(data, state_dir)
+    runs = set(data["gps"]["run"].astype(str))
+    assert set(dataset.dataset["run"].astype(str)) == runs
+    assert isinstance(dataset.dataset.attrs["crs"], str)
+
+    with open(state_dir / "manifest.json") as f:
+        partitions = json.load(f)["partitions"]
+    ingested = [name for name, entry in partitions.items() if entry["rows"] > 0]
+    assert len(ingested) == 1
+    assert os.path.exists(state_dir / ingested[0])
+    assert dataset.cube["count"].sum() == dataset.dataset["duration"].notna().sum()
+
+    # a restart reads the ingested rows back instead of processing the partition again
+    restarted = _dataset(data, state_dir)
+    assert len(restarted.dataset) == len(dataset.dataset)
+    assert restarted.refresh() == []
+
+
+def test_shared_dataset_after_ingest(data, tmp_path):
+    # the base rows have no partition, the shared file then has a dictionary column with nulls
+    dataset = _dataset(data, tmp_path / "state", shared=True)
+    partition = dataset.dataset["partition"]
+    assert partition.isna().any() and partition.notna().any()
+    assert dataset.dataset.attrs["shared_path"].startswith(".vgi_shared")
+    assert set(dataset.dataset["run"].astype(str)) == set(data["gps"]["run"].astype(str))
+
+    # another process maps the same file
+    restarted = _dataset(data, tmp_path / "state", shared=True)
+    assert restarted.dataset.attrs["shared_path"] == dataset.dataset.attrs["shared_path"]
+    assert restarted.dataset["partition"].isna().sum() == partition.isna().sum()
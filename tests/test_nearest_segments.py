@@ -0,0 +1,23 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from utils import nearest_segments
+
+# two parallel segments 0.002 apart and a third far away
+LINES = shapely.linestrings([[[0, 0], [0.01, 0]], [[0, 0.002], [0.01, 0.002]], [[1, 1], [1.01, 1]]])
+NAMES = np.array(["road_path_0", "road_path_1", "haltestelle_0"], dtype=object)
+
+
+def test_closest_segment_wins():
+    points = shapely.points([[0.005, 0.0015], [0.005, 0.0005], [0.005, 0.001], [0.5, 0.5]])
+    segment = nearest_segments(points, NAMES, STRtree(LINES), distance_threshold=0.01)
+    # both candidates are within the threshold: the closer one, on a tie the one listed first,
+    # nothing for a point outside all segments
+    assert segment.tolist() == ["road_path_1", "road_path_0", "road_path_0", None]
+
+
+def test_tie_goes_to_the_segment_listed_first():
+    # the same tie with the split route order reversed
+    segment = nearest_segments(shapely.points([[0.005, 0.001]]), NAMES[[1, 0, 2]], STRtree(LINES[[1, 0, 2]]))
+    assert segment.tolist() == ["road_path_1"]
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+import report
+from benchmarks.synthetic import make_segment_durations, make_split_route
+
+
+def test_route_slices_share_the_parent_rows(monkeypatch):
+    split_route = make_split_route(n_road_paths=5)
+    first = make_segment_durations(split_route, days=2, runs_per_day=4, route="101", seed=0)
+    second = make_segment_durations(split_route, days=2, runs_per_day=4, route="102", seed=1)
+    df = pd.concat([first, second, first.assign(run="c" + first["run"])], ignore_index=True)
+    monkeypatch.setattr(report, "fetch_filtered_segment_data", lambda: df)
+    monkeypatch.setattr(report, "_DATASET", None)
+    monkeypatch.setattr(report, "_ROUTE_DATASETS", {})
+
+    report.load_report_dataset()
+    for route in ("101", "102"):
+        rows = report._route_dataset(route)
+        expected = df[df["route"] == route]
+        assert rows.index.equals(expected.index)
+        assert np.shares_memory(rows["duration"].to_numpy(), report._DATASET["duration"].to_numpy())
+    assert len(report._route_dataset("103")) == 0
@@ -0,0 +1,36 @@
+import numpy as np
+
+from result_cache import ResultCache, cached_compare_segment_durations
+
+FILTER = ("2024-01-01", "2024-01-31", ["Wednesday", "Monday"], None, None)
+
+
+def test_least_recently_used_entry_evicted():
+    cache = ResultCache(max_bytes=3 * 800)
+    for key in "abc":
+        cache.get_or_compute(key, lambda: np.zeros(100))
+    cache.get_or_compute("a", lambda: np.ones(100))
+    cache.get_or_compute("d", lambda: np.zeros(100))
+    assert cache.stats() == dict(hits=1, misses=4, evictions=1, entries=3, nbytes=2400, max_bytes=2400)
+    # "b" was the least recently used entry, "a" is still cached
+    assert cache.get_or_compute("a", lambda: np.ones(100)).sum() == 0
+    assert cache.get_or_compute("b", lambda: np.ones(100)).sum() == 100
+
+    # results over the budget are returned without being cached
+    assert len(cache.get_or_compute("big", lambda: np.zeros(1000))) == 1000
+    assert cache.stats()["entries"] == 3
+
+
+def test_key_depends_on_dataset_version():
+    cache, calls = ResultCache(max_bytes=2**20), []
+
+    def compare(df, filter1, filter2):
+        calls.append(df)
+        return np.zeros(10)
+
+    reordered = FILTER[:2] + (["Monday", "Wednesday"],) + FILTER[3:]
+    cached_compare_segment_durations(compare, "v1", FILTER, FILTER, dataset_key=("data", 1), cache=cache)
+    cached_compare_segment_durations(compare, "v1", reordered, FILTER, dataset_key=("data", 1), cache=cache)
+    cached_compare_segment_durations(compare, "v2", FILTER, FILTER, dataset_key=("data", 2), cache=cache)
+    assert calls == ["v1", "v2"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
@@ -0,0 +1,109 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import routes
+import utils
+from aggregates import build_segment_cube, filter_segment_data, query_segment_cube
+from benchmarks.synthetic import make_labelled_gps, make_segment_durations, make_split_route
+from trends import SegmentTrends
+
+FILTER = (datetime.date(2023, 10, 1), datetime.date(2023, 10, 7), ["Wednesday"], datetime.time(12, 0), None)
+
+
+def _two_routes():
+    # the same segment names on two routes with different durations
+    split_route = make_split_route(n_road_paths=5)
+    first = make_segment_durations(split_route, days=7, runs_per_day=4, route="101", seed=0)
+    second = make_segment_durations(split_route, days=7, runs_per_day=4, route="102", seed=1)
+    second = second.assign(run="b" + second["run"], duration=second["duration"] * 3)
+    return split_route, pd.concat([first, second], ignore_index=True)
+
+
+def test_split_route_path_only_renames_the_file(monkeypatch):
+    monkeypatch.setattr(utils, "SPLIT_ROUTE_101_PATH", "/data/101/split_route_101.parquet")
+    monkeypatch.setattr(utils, "SPLIT_ROUTE_PATHS", {})
+    assert utils.split_route_path("102") == "/data/101/split_route_102.parquet"
+
+
+def test_no_route_101_stops_for_other_routes():
+    assert utils.route_bus_stop_mapping("102") == {}
+    assert utils.route_bus_stop_reverse_mapping("102") == {}
+
+
+def test_cube_and_trends_keep_routes_apart():
+    _, df = _two_routes()
+    cube = build_segment_cube(df)
+    for route in ("101", "102"):
+        rows = filter_segment_data(df[df["route"] == route], FILTER)
+        expected = rows.groupby("segment")["duration"].mean()
+        result = query_segment_cube(cube, FILTER, route=route)["mean"].reindex(expected.index)
+        assert np.allclose(result, expected)
+
+    trends = SegmentTrends.from_cube(cube)
+    segment = df["segment"].iloc[0]
+    trend_101 = trends.trend([segment], window=7, route="101")[segment]
+    trend_102 = trends.trend([segment], window=7, route="102")[segment]
+    assert np.allclose(trend_102, 3 * trend_101)
+    assert list(trends.route_segments("102")) == list(trends.route_segments("101"))
+
+
+def test_process_route_outputs_are_loaded(tmp_path, monkeypatch):
+    split_route, df = _two_routes()
+    split_path = str(tmp_path / "split_route.parquet")
+    split_route.to_parquet(split_path)
+    gps = make_labelled_gps(split_route, df[df["route"] == "101"]).drop(columns="segment")
+    monkeypatch.setattr(routes, "load_dataset", lambda route, **kwargs: gps[gps["route"] == route])
+    monkeypatch.setattr(routes, "split_route_path", lambda route: split_path)
+    monkeypatch.setattr(ingest, "split_route_path", lambda route: split_path)
+
+    # load_route_segments registers the prepared geometry, removed again after the test
+    monkeypatch.setitem(utils.ROUTE_GEOMETRY_PATHS, "101", None)
+    output_dir = str(tmp_path / "route_data")
+    result = routes.process_route("101", output_dir)
+    assert result["rows"] > 0
+
+    paths = routes.preprocessed_routes(output_dir)
+    assert list(paths) == ["101"]
+    dataset = routes.load_route_segments(paths)
+    assert len(dataset) == result["rows"]
+    assert isinstance(dataset.attrs["crs"], str)
+
+    # the map takes the prepared geometry of the same segment set from the same output directory
+    geometry_path = routes.route_output_paths("101", output_dir)[1]
+    assert utils.ROUTE_GEOMETRY_PATHS["101"] == geometry_path
+    segments = dataset["segment"].astype(str).unique()
+    prepared = utils._load_route_geometry_levels(geometry_path, utils.file_version(geometry_path))[0][0.0]
+    assert utils.prepare_split_path_geometry(split_path, segments, "101") is prepared
+
+    # an edited split route file is used instead of the geometry prepared from its old version
+    stat = os.stat(split_path)
+    os.utime(split_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    geometry = utils.prepare_split_path_geometry(split_path, segments, "101")
+    assert geometry is not prepared
+    assert geometry is utils._load_split_path_geometry_levels(split_path, utils.file_version(split_path),
+                                                              tuple(sorted(set(segments))), "101")[0.0]
+
+
+def test_split_route_edits_invalidate_the_cached_geometry(tmp_path, monkeypatch):
+    monkeypatch.setitem(utils.ROUTE_GEOMETRY_PATHS, "101", None)
+    split_path = str(tmp_path / "split_route.parquet")
+    split_route = make_split_route(n_road_paths=5)
+    split_route.to_parquet(split_path)
+    segments = list(split_route.index)
+    tree = utils.build_segment_tree(split_path)
+    geometry = utils.prepare_split_path_geometry(split_path, segments, "101")
+    assert utils.build_segment_tree(split_path) is tree
+    assert utils.prepare_split_path_geometry(split_path, segments, "101") is geometry
+
+    # the same segments on another path, written with a newer mtime
+    stat = os.stat(split_path)
+    make_split_route(n_road_paths=5, seed=1).to_parquet(split_path)
+    os.utime(split_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    edited_tree = utils.build_segment_tree(split_path)
+    edited = utils.prepare_split_path_geometry(split_path, segments, "101")
+    assert edited_tree is not tree and edited is not geometry
+    assert not np.allclose(edited["lon"].iloc[0], geometry["lon"].iloc[0])
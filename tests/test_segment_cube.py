@@ -0,0 +1,36 @@
+import datetime
+
+import numpy as np
+
+from aggregates import DURATION_BIN_EDGES, build_segment_cube, compare_segment_cube, compare_segment_stats
+from benchmarks.synthetic import make_segment_durations, make_split_route
+
+FILTER_1 = (None, None, ["Wednesday"], datetime.time(12, 0), None)
+FILTER_2 = (None, None, ["Wednesday"], None, None)
+
+
+def _bin(values):
+    return np.clip(np.searchsorted(DURATION_BIN_EDGES, values, side="right") - 1, 0, len(DURATION_BIN_EDGES) - 1)
+
+
+def test_cube_answers_the_filter_pair():
+    df = make_segment_durations(make_split_route(n_road_paths=5), days=14, runs_per_day=8)
+    _, stats1, stats2 = compare_segment_cube(build_segment_cube(df), FILTER_1, FILTER_2, route="101")
+    _, expected1, expected2 = compare_segment_stats(df, FILTER_1, FILTER_2)
+    for result, expected in ((stats1, expected1), (stats2, expected2)):
+        result = result.reindex(expected.index)
+        assert (result["count"] == expected["count"]).all()
+        for column in ("mean", "var", "std"):
+            assert np.allclose(result[column], expected[column], equal_nan=True)
+
+    # histogram quantiles: inside the bins of the order statistics around the exact quantile
+    upper_edges = np.append(DURATION_BIN_EDGES[1:], DURATION_BIN_EDGES[-1])
+    rows = df[df["utcTime"].dt.day_name() == "Wednesday"]
+    for segment, durations in rows.groupby("segment", observed=True)["duration"]:
+        durations = np.sort(durations.to_numpy())
+        for column, q in (("median", 0.5), ("p85", 0.85), ("p95", 0.95)):
+            position = q * (len(durations) - 1)
+            low = durations[max(int(np.floor(position)) - 1, 0)]
+            high = durations[min(int(np.ceil(position)) + 1, len(durations) - 1)]
+            value = stats2.loc[segment, column]
+            assert DURATION_BIN_EDGES[_bin(low)] <= value <= upper_edges[_bin(high)]
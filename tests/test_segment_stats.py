@@ -0,0 +1,31 @@
+import numpy as np
+
+from benchmarks.synthetic import make_segment_durations, make_split_route
+from segment_stats import grouped_statistics, segment_statistics
+
+
+def pandas_statistics(df):
+    # the plain pandas groupby the statistics have to match
+    grouped = df.groupby("segment", observed=True)["duration"]
+    stats = grouped.agg(["count", "mean", "var", "std", "median"])
+    for q in (0.85, 0.95):
+        stats[f"p{round(q * 100)}"] = grouped.quantile(q)
+    return stats
+
+
+def test_matches_pandas_groupby():
+    df = make_segment_durations(make_split_route(n_road_paths=5), days=3, runs_per_day=4)
+    df.loc[df.index[::7], "duration"] = np.nan
+    df["segment"] = df["segment"].astype("category").cat.add_categories(["unused"])
+    expected = pandas_statistics(df.dropna(subset=["duration"]))
+    result = segment_statistics(df)
+    assert list(result.index) == list(expected.index)
+    for column in expected.columns:
+        assert np.allclose(result[column], expected[column], equal_nan=True)
+
+
+def test_missing_groups_are_ignored():
+    stats = grouped_statistics([1.0, 2.0, 4.0, 8.0], np.array(["a", None, "a", "b"], dtype=object))
+    assert list(stats.index) == ["a", "b"]
+    assert stats.loc["a", "count"] == 2 and stats.loc["a", "mean"] == 2.5 and stats.loc["a", "median"] == 2.5
+    assert np.isnan(stats.loc["b", "var"])
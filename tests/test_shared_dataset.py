@@ -0,0 +1,15 @@
+import pandas as pd
+
+from shared_dataset import open_shared_dataset, write_shared_dataset
+
+
+def test_categorical_with_nulls_round_trip(tmp_path):
+    df = pd.DataFrame({"route": pd.Categorical(["101", "101", "102"]),
+                       "partition": pd.Categorical([None, "2024-01-02.parquet", None]),
+                       "duration": [1.0, 2.0, 3.0]})
+    path = str(tmp_path / "segments.arrow")
+    write_shared_dataset(df, path)
+    shared = open_shared_dataset(path)
+    assert shared["partition"].isna().tolist() == [True, False, True]
+    assert shared["partition"].iloc[1] == "2024-01-02.parquet"
+    assert shared.attrs["route_ranges"] == {"101": [0, 2], "102": [2, 3]}
@@ -0,0 +1,45 @@
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from benchmarks.synthetic import make_split_route, make_deviation_table
+from utils import HOVER_POINT_SPACING, _hover_points, plot_add_split_path
+
+
+def _figure(split_route, batched):
+    fig = go.Figure()
+    plot_add_split_path(fig, [split_route.reset_index()[["segment"]]], make_deviation_table(split_route), split_route,
+                        lw=13, batched=batched)
+    return fig
+
+
+@pytest.mark.parametrize("n_road_paths", [40, 200])
+def test_batched_payload_is_smaller(n_road_paths):
+    split_route = make_split_route(n_road_paths=n_road_paths)
+    per_segment = len(_figure(split_route, batched=False).to_json())
+    batched = len(_figure(split_route, batched=True).to_json())
+    assert batched < per_segment
+
+
+def test_batched_hover_points_along_each_segment():
+    split_route = make_split_route(n_road_paths=40)
+    fig = json.loads(_figure(split_route, batched=True).to_json())
+    markers = [trace for trace in fig["data"] if trace.get("hoverinfo") == "text" and trace["mode"] == "markers"]
+    # at least one hover point per segment, each with the text of its segment
+    assert sum(len(trace["text"]) for trace in markers) >= len(split_route)
+    assert all(len(trace["text"]) == len(trace["lon"]) for trace in markers)
+    lines = [trace for trace in fig["data"] if trace["mode"] == "lines"]
+    assert all(trace["hoverinfo"] == "skip" and "text" not in trace for trace in lines)
+
+
+def test_hover_points_spaced_along_the_line():
+    # a 0.0021 long line gets 5 points, 0.00042 apart; a short line and a single vertex one the middle point
+    lons = [np.array([0.0, 0.001, 0.001]), np.array([0.0, 0.0001]), np.array([0.5])]
+    lats = [np.array([0.0, 0.0, 0.0011]), np.array([0.0, 0.0]), np.array([0.5])]
+    lon, lat, owner = _hover_points(lons, lats)
+    assert owner.tolist() == [0] * 5 + [1, 2]
+    steps = np.hypot(np.diff(lon[:5]), np.diff(lat[:5]))
+    assert np.all(steps <= HOVER_POINT_SPACING)
+    assert np.allclose([lon[5], lat[5], lon[6], lat[6]], [0.00005, 0.0, 0.5, 0.5])
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from segment_stats import deviation_table
+from streaming import NS, SegmentWindow
+
+
+def test_window_keeps_routes_apart():
+    # the same segment on two routes, route 102 three times as slow
+    window = SegmentWindow(window=3600)
+    window.add([("a", "s1", "101", 10 * NS, 60.0), ("a", "s2", "101", 20 * NS, 30.0),
+                ("b", "s1", "102", 10 * NS, 180.0), ("c", "s1", "102", 30 * NS, 200.0)])
+    first = window.stats(60 * NS, "101")
+    second = window.stats(60 * NS, "102")
+    assert list(first.index) == ["s1", "s2"] and list(second.index) == ["s1"]
+    assert first.loc["s1", "count"] == 1 and first.loc["s1", "mean"] == 60.0
+    assert second.loc["s1", "count"] == 2 and second.loc["s1", "mean"] == 190.0
+
+    # each route against its own baseline: no deviation when the live mean equals the history
+    baselines = {"101": pd.DataFrame({"mean": [60.0, 30.0]}, index=pd.Index(["s1", "s2"], name="segment")),
+                 "102": pd.DataFrame({"mean": [190.0]}, index=pd.Index(["s1"], name="segment"))}
+    for route, baseline in baselines.items():
+        dt = deviation_table(window.stats(60 * NS, route), baseline)
+        assert np.allclose(dt["deviation"], 0)
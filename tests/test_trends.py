@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import build_segment_cube
+from benchmarks.synthetic import make_segment_durations, make_split_route
+from trends import SegmentTrends, daily_rollup
+
+
+def test_batch_that_prepends_and_overlaps():
+    df = make_segment_durations(make_split_route(n_road_paths=5), days=19, runs_per_day=4)
+    dates = df["utcTime"].dt.normalize()
+    first_day = dates.min()
+    later = df[dates >= first_day + pd.Timedelta(days=4)]
+    earlier = df[dates <= first_day + pd.Timedelta(days=9)]
+
+    trends = SegmentTrends.from_cube(build_segment_cube(later))
+    # days 0..9 on top of days 4..18: four days before the range, six already present
+    trends.add(daily_rollup(build_segment_cube(earlier)))
+    expected = SegmentTrends.from_cube(build_segment_cube(pd.concat([later, earlier], ignore_index=True)))
+
+    assert len(trends.dates) == 19
+    assert trends.dates[0] == first_day and trends.dates[-1] == dates.max()
+    segments = list(expected.route_segments("101"))
+    for window in (1, 7):
+        result = trends.trend(segments, window=window, route="101")
+        assert np.allclose(result.to_numpy(), expected.trend(segments, window=window, route="101").to_numpy(), equal_nan=True)
@@ -0,0 +1,122 @@
+import threading
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from aggregates import STAT_COLUMNS, segment_type
+
+# rolling windows of the trend chart, in days
+ROLLING_WINDOWS = (7, 28)
+TREND_METRICS = ("mean", "std", "count")
+
+
+def daily_rollup(cube:pd.DataFrame)->pd.DataFrame:
+    # count / sum / sum of squares per (route, segment, date) from a route x segment x date x hour cube
+    if len(cube) == 0:
+        return pd.DataFrame(columns=STAT_COLUMNS)
+    return cube[STAT_COLUMNS].groupby(level=["route", "segment", "date"], observed=True).sum()
+
+
+class SegmentTrends:
+    # daily per-segment rollups as a dense (date, (route, segment), stat) array plus its prefix sums over
+    # the dates, so the sums of any rolling window are one subtraction per cell. Appending days only
+    # extends the prefix sums; late rows for earlier days recompute them from that day on
+    def __init__(self):
+        self.start = None
+        self.segments = pd.MultiIndex.from_arrays([[], []], names=["route", "segment"])
+        self.daily = np.zeros((0, 0, len(STAT_COLUMNS)))
+        self.cumulative = np.zeros((1, 0, len(STAT_COLUMNS)))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cube(cls, cube:pd.DataFrame)->"SegmentTrends":
+        trends = cls()
+        trends.add(daily_rollup(cube))
+        return trends
+
+    @property
+    def dates(self)->pd.DatetimeIndex:
+        if self.start is None:
+            return pd.DatetimeIndex([])
+        return pd.date_range(self.start, periods=len(self.daily), freq="D")
+
+    def add(self, daily:pd.DataFrame)->None:
+        # rows of daily_rollup: new days, new segments or additions to days already present
+        if len(daily) == 0:
+            return
+        segments = pd.MultiIndex.from_arrays([daily.index.get_level_values("route").astype(str),
+                                              daily.index.get_level_values("segment").astype(str)],
+                                             names=["route", "segment"])
+        dates = pd.DatetimeIndex(daily.index.get_level_values("date")).normalize()
+        values = daily[STAT_COLUMNS].to_numpy(dtype=np.float64)
+        with self._lock:
+            new_segments = segments.unique().difference(self.segments)
+            if len(new_segments) > 0:
+                self.segments = self.segments.append(new_segments)
+                pad = ((0, 0), (0, len(new_segments)), (0, 0))
+                self.daily, self.cumulative = np.pad(self.daily, pad), np.pad(self.cumulative, pad)
+
+            first, last = dates.min(), dates.max()
+            n_days = len(self.daily)
+            if self.start is None:
+                self.start = first
+            # days missing before and after the current range, both relative to the current start
+            before = max((self.start - first).days, 0)
+            after = max((last - self.start).days + 1 - len(self.daily), 0)
+            if before or after:
+                self.daily = np.pad(self.daily, ((before, after), (0, 0), (0, 0)))
+                self.cumulative = np.pad(self.cumulative, ((before, after), (0, 0), (0, 0)))
+                self.start = min(self.start, first)
+
+            date_pos = (dates - self.start).days.to_numpy()
+            np.add.at(self.daily, (date_pos, self.segments.get_indexer(segments)), values)
+            # prefix sums from the first changed or padded day (everything when days were prepended)
+            changed = 0 if before else min(int(date_pos.min()), n_days)
+            self.cumulative[changed + 1:] = self.cumulative[changed] + np.cumsum(self.daily[changed:], axis=0)
+
+    def route_segments(self, route:str)->pd.Index:
+        segments = self.segments
+        return segments.get_level_values("segment")[segments.get_level_values("route") == str(route)]
+
+    def _groups(self, by:str, keys:Optional[Sequence[str]], route:Optional[str])->tuple:
+        # (group names, segments x groups indicator matrix), only segments of route when given
+        segments = pd.Series(self.segments.get_level_values("segment"))
+        labels = segment_type(segments) if by == "segment_type" else segments.to_numpy()
+        names = pd.Index(keys if keys is not None else pd.unique(labels))
+        indicator = labels[:, None] == names.to_numpy()[None, :]
+        if route is not None:
+            indicator &= (self.segments.get_level_values("route") == str(route))[:, None]
+        return names, indicator.astype(np.float64)
+
+    def trend(self,
+              keys:Optional[Sequence[str]] = None,
+              by:str = "segment",
+              window:int = 7,
+              metric:str = "mean",
+              route:Optional[str] = None,
+              start=None,
+              end=None)->pd.DataFrame:
+        # rolling window metric per day (rows) and segment or segment type (columns) of route (all routes
+        # summed when None), computed from the prefix sums only, so the cost depends on the days and
+        # groups asked for, not on the rows loaded
+        with self._lock:
+            dates = self.dates
+            positions = np.arange(len(dates))
+            if start is not None:
+                positions = positions[dates >= pd.Timestamp(start)]
+            if end is not None:
+                positions = positions[dates[positions] <= pd.Timestamp(end)]
+            names, indicator = self._groups(by, keys, route)
+            sums = self.cumulative[positions + 1] - self.cumulative[np.maximum(positions + 1 - window, 0)]
+        sums = np.einsum("tsk,sg->tgk", sums, indicator)
+        count, total, total_sq = sums[..., 0], sums[..., 1], sums[..., 2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            if metric == "mean":
+                values = mean
+            elif metric == "std":
+                values = np.sqrt(np.clip((total_sq - count * mean ** 2) / np.where(count > 1, count - 1, np.nan), 0, None))
+            else:
+                values = count
+        return pd.DataFrame(values, index=dates[positions].rename("date"), columns=names)
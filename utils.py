@@ -1,14 +1,25 @@
 import os
+import json
+import datetime
 import warnings
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import LineString
 import plotly.graph_objects as go
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Sequence
 from shapely import geometry
+import shapely
+from shapely import STRtree
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyproj
 import geopandas as gpd
-import streamlit as st
+
+from aggregates import duration_labels
+from instrumentation import count, plotly_chart, span
 
 # config
 from newmind_fresh.config import CRS_O, CRS,CRS, SAHPE_FILE_PATH, SPLIT_ROUTE_101_PATH, GPS_DATA_PATH, GPS_DATA_LABELED, SEGMENT_DURATION_PATH
@@ -54,34 +65,91 @@ bus_stop_reverse_mapping = {
     'Schellingstraße,1': 'haltestelle_schellingstrase'
     }
 
+# per route registries. Routes without a stop mapping have no stop labels and keep the stop
+# names of their data, their stops are not renamed to the route 101 segments
+BUS_STOP_MAPPINGS = {"101": bus_stop_mapping}
+BUS_STOP_REVERSE_MAPPINGS = {"101": bus_stop_reverse_mapping}
+SPLIT_ROUTE_PATHS = {"101": SPLIT_ROUTE_101_PATH}
+
+def route_bus_stop_mapping(route:str = "101")->dict:
+    return BUS_STOP_MAPPINGS.get(route, {})
+
+def route_bus_stop_reverse_mapping(route:str = "101")->dict:
+    if route in BUS_STOP_REVERSE_MAPPINGS:
+        return BUS_STOP_REVERSE_MAPPINGS[route]
+    return {value: key for key, values in route_bus_stop_mapping(route).items() for value in values}
+
+def bus_stop_routes()->list:
+    return sorted(set(BUS_STOP_MAPPINGS) | set(BUS_STOP_REVERSE_MAPPINGS))
+
+def bus_stop_names(route:Optional[str] = None)->pd.DataFrame:
+    # (route, name, segment) per stop name of route, of every route with a stop mapping when None
+    routes = bus_stop_routes() if route is None else [route]
+    rows = [(r, name, segment) for r in routes for name, segment in route_bus_stop_reverse_mapping(r).items()]
+    return pd.DataFrame(rows, columns=["route", "name", "segment"])
+
+def map_bus_stop_segments(df:pd.DataFrame)->pd.Series:
+    # stop names -> segment keys, each row with the mapping of its own route
+    segment = df['segment'].astype(object)
+    routes = df['route'].astype(str).to_numpy()
+    for route in bus_stop_routes():
+        rows = routes == route
+        if rows.any():
+            segment.loc[rows] = segment.loc[rows].replace(route_bus_stop_reverse_mapping(route))
+    return segment
+
+def split_route_path(route:str = "101")->str:
+    # split route file of a route: next to the route 101 file, with the route in the file name
+    # unless registered
+    if route in SPLIT_ROUTE_PATHS:
+        return SPLIT_ROUTE_PATHS[route]
+    directory, name = os.path.split(SPLIT_ROUTE_101_PATH)
+    return os.path.join(directory, name.replace("101", route))
+
+# outputs of routes.py: segment rows and map geometry per route
+ROUTE_DATA_DIR = os.environ.get("VGI_ROUTE_DATA_DIR", "route_data")
+
+def route_output_paths(route:str, output_dir:str = ROUTE_DATA_DIR)->tuple:
+    return (os.path.join(output_dir, f"{route}_segments.parquet"),
+            os.path.join(output_dir, f"{route}_geometry.parquet"))
+
+# map geometry prepared by routes.py per route, registered by routes.load_route_segments with the
+# directory the route was preprocessed into. Unregistered routes build it from the split route file
+ROUTE_GEOMETRY_PATHS = {}
+# parquet metadata key of the split route file version a prepared geometry was built from
+SPLIT_VERSION_KEY = b"vgi_split_version"
+
 def load_gdf_net(path:str=SAHPE_FILE_PATH)->gpd.GeoDataFrame:
     gdf_net = gpd.read_file(path)
     gdf_net = gdf_net.loc[:, (~gdf_net.agg(["nunique"]).isin([0,1])).values[0]]
     gdf_net = gdf_net.to_crs(CRS)
     return gdf_net
 
-def list_of_geometries_to_single_list(geo_df):
-    lats = []
-    lons = []
-    names = []
+def list_of_geometries_to_single_list(geo_df, tolerance:float = 0.0):
+    # flat lat/lon arrays of all (multi)linestrings with a NaN separator after each part,
+    # names come back as a Categorical (code -1 / NaN at the separators).
+    # tolerance > 0 simplifies the lines first (see lod_tolerance)
     if "name" not in geo_df.columns:
         geo_df = geo_df.assign(name = geo_df.index)
-    for feature, name in zip(geo_df.to_crs(CRS_O).geometry, geo_df.name):
-        if isinstance(feature, geometry.linestring.LineString):
-            linestrings = [feature]
-        elif isinstance(feature, geometry.multilinestring.MultiLineString):
-            linestrings = feature.geoms
-        else:
-            continue
-        for linestring in linestrings:
-            x, y = linestring.xy
-            lats = np.append(lats, y)
-            lons = np.append(lons, x)
-            names = np.append(names, [name]*len(y))
-            lats = np.append(lats, None)
-            lons = np.append(lons, None)
-            names = np.append(names, None)
-
+    geoms = np.asarray(geo_df.to_crs(CRS_O).geometry)
+    if tolerance > 0:
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    is_line = np.isin(shapely.get_type_id(geoms), [1, 5]) # LineString, MultiLineString
+    name_values = pd.Categorical(geo_df["name"].to_numpy()[is_line])
+
+    parts, part_owner = shapely.get_parts(geoms[is_line], return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+
+    # every part is followed by one separator, so coordinate i is shifted by its part number
+    n = len(coords) + len(parts)
+    position = np.arange(len(coords)) + coord_part
+    lats = np.full(n, np.nan, dtype=np.float64)
+    lons = np.full(n, np.nan, dtype=np.float64)
+    codes = np.full(n, -1, dtype=name_values.codes.dtype)
+    lats[position] = coords[:, 1]
+    lons[position] = coords[:, 0]
+    codes[position] = name_values.codes[part_owner[coord_part]]
+    names = pd.Categorical.from_codes(codes, categories=name_values.categories)
 
     return lats,lons,names
 
@@ -97,60 +165,239 @@ def get_unique_values(df_list: List[pd.DataFrame],
 
     return list(set(l))
 
-def load_dataset():
-    gdf = gpd.read_parquet([GPS_DATA_PATH + s for s in os.listdir(GPS_DATA_PATH) if ".parquet" in s])
+SEGMENT_KEYS = ['run', 'segment', 'route']
+GPS_COLUMNS = SEGMENT_KEYS + ['geometry', 'utcTime', 'speed']
+
+def _geo_crs(schema:pa.Schema, geometry:str):
+    # crs of a GeoParquet geometry column, OGC:CRS84 when the metadata does not say (GeoParquet default)
+    geo = json.loads((schema.metadata or {}).get(b"geo", b"{}"))
+    crs = geo.get("columns", {}).get(geometry, {}).get("crs", "OGC:CRS84")
+    return pyproj.CRS.from_json_dict(crs) if isinstance(crs, dict) else crs
+
+def crs_string(crs)->Optional[str]:
+    # crs as an authority string (or WKT) for df.attrs, which pandas writes as JSON into parquet and Arrow
+    # metadata. geopandas takes the string wherever a crs is expected
+    if crs is None:
+        return None
+    return pyproj.CRS.from_user_input(crs).to_string()
+
+def read_parquet_dataset(source:Union[str,List[str]],
+                         columns:Optional[List[str]] = None,
+                         route:Optional[str] = None,
+                         start_date:Optional[datetime.date] = None,
+                         end_date:Optional[datetime.date] = None,
+                         time_col:str = "utcTime",
+                         geometry:str = "geometry",
+                         arrow_backed:bool = True,
+                         decode_geometry:bool = True)->Union[pd.DataFrame,gpd.GeoDataFrame]:
+    # scan parquet files through a pyarrow Dataset, pushing the column selection and the
+    # route / date range filters into the scan, so row groups outside the filter are skipped.
+    # decode_geometry=False keeps the geometry as WKB in an Arrow column (crs in attrs), for callers
+    # that only pick a few rows of it
+    dataset = ds.dataset(source, format="parquet")
+    schema = dataset.schema
+    index_columns = [c for c in (schema.pandas_metadata or {}).get("index_columns", []) if isinstance(c, str)]
+    if columns is not None:
+        columns = [c for c in schema.names if c in columns or c in index_columns]
+
+    expression = None
+    def _and(condition):
+        return condition if expression is None else expression & condition
+    if route is not None and "route" in schema.names:
+        route_type = schema.field("route").type
+        route_type = route_type.value_type if pa.types.is_dictionary(route_type) else route_type
+        expression = _and(ds.field("route") == pa.scalar(route, type=route_type))
+    if time_col in schema.names:
+        time_type = schema.field(time_col).type
+        if start_date is not None:
+            expression = _and(ds.field(time_col) >= pa.scalar(pd.Timestamp(start_date), type=time_type))
+        if end_date is not None:
+            expression = _and(ds.field(time_col) < pa.scalar(pd.Timestamp(end_date) + pd.Timedelta(days=1), type=time_type))
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    to_pandas_kwargs = dict(types_mapper=pd.ArrowDtype) if arrow_backed else {}
+    if geometry not in table.column_names:
+        return table.to_pandas(**to_pandas_kwargs)
+    df = table.drop_columns([geometry]).to_pandas(**to_pandas_kwargs)
+    if not decode_geometry:
+        df[geometry] = pd.Series(pd.arrays.ArrowExtensionArray(table.column(geometry)), index=df.index)
+        df.attrs['crs'] = crs_string(_geo_crs(schema, geometry))
+        return df
+    geoms = gpd.GeoSeries.from_wkb(table.column(geometry).to_numpy(zero_copy_only=False), index=df.index, crs=_geo_crs(schema, geometry))
+    return gpd.GeoDataFrame(df, geometry=geoms)
+
+def load_dataset(route:str = "101",
+                 start_date:Optional[datetime.date] = None,
+                 end_date:Optional[datetime.date] = None,
+                 columns:Optional[List[str]] = None,
+                 arrow_backed:bool = True)->gpd.GeoDataFrame:
+    files = [GPS_DATA_PATH + s for s in os.listdir(GPS_DATA_PATH) if ".parquet" in s]
+    if columns is None:
+        columns = [c for c in ds.dataset(files, format="parquet").schema.names if c not in ["longitude","latitude"]]
+    # filter to the route and dates while scanning
+    gdf = read_parquet_dataset(files, columns=columns, route=route, start_date=start_date, end_date=end_date, arrow_backed=arrow_backed)
     gdf.drop_duplicates(inplace = True)
     drop_col = [s for s in ["longitude","latitude"] if s in gdf.columns]
     gdf.drop(drop_col,axis=1,inplace=True)
     gdf.dropna(inplace=True)
-    #filter to route 101
-    gdf = gdf[gdf["route"] == "101"]
     return gdf
 
+def file_version(path:str)->tuple:
+    # (mtime, size) of a file, used as cache key so edits on disk invalidate cached results
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+@lru_cache(maxsize=8)
+def _load_segment_tree(path:str, version:tuple):
+    split_route = gpd.read_parquet(path)
+    return split_route.index.to_numpy(), STRtree(np.asarray(split_route.geometry))
+
+def build_segment_tree(split_route_path:Union[str,gpd.GeoDataFrame]):
+    # spatial index over the split route, built once per split-route file version
+    if isinstance(split_route_path,str):
+        return _load_segment_tree(split_route_path, file_version(split_route_path))
+    return split_route_path.index.to_numpy(), STRtree(np.asarray(split_route_path.geometry))
+
+def nearest_segments(points:np.ndarray,
+                     segment_index:np.ndarray,
+                     tree:STRtree,
+                     distance_threshold:float = 0.01)->np.ndarray:
+    # name of the closest segment within distance_threshold of each point, None outside all segments
+    segment = np.full(len(points), None, dtype=object)
+    point_idx, tree_idx = tree.query(points, predicate="dwithin", distance=distance_threshold)
+    distances = shapely.distance(points[point_idx], tree.geometries[tree_idx])
+    within = distances < distance_threshold
+    point_idx, tree_idx, distances = point_idx[within], tree_idx[within], distances[within]
+
+    # closest segment wins, ties go to the segment listed first in the split route
+    order = np.lexsort((tree_idx, distances, point_idx))
+    point_idx, tree_idx = point_idx[order], tree_idx[order]
+    first = np.ones(len(point_idx), dtype=bool)
+    first[1:] = point_idx[1:] != point_idx[:-1]
+    segment[point_idx[first]] = segment_index[tree_idx[first]]
+    return segment
+
 def add_segment_col(gdf:gpd.GeoDataFrame,
-                    split_route_path:gpd.GeoDataFrame,
-                    distance_threshold:int= 0.01)->gpd.GeoDataFrame:
-    gdf = gdf.assign(segment = None)
-    for index,row in split_route_path.iterrows():
-        row.geometry 
-        gdf.loc[gdf[gdf.distance(row.geometry) < distance_threshold].index,"segment"] = index
+                    split_route_path:Union[str,gpd.GeoDataFrame],
+                    distance_threshold:int= 0.01,
+                    chunk_size:int = 1_000_000)->gpd.GeoDataFrame:
+    segment_index, tree = build_segment_tree(split_route_path)
+    points = np.asarray(gdf.geometry)
+    segment = np.full(len(points), None, dtype=object)
+
+    # chunked so that the candidate pairs of tens of millions of points stay bounded in memory
+    for start in range(0, len(points), chunk_size):
+        segment[start:start + chunk_size] = nearest_segments(points[start:start + chunk_size], segment_index, tree, distance_threshold)
+
+    gdf = gdf.assign(segment = segment)
     if gdf["segment"].isna().any():
         warnings.warn("At least one of the Points is outside of all segments")
     return gdf
 
-def fetch_filtered_segment_data():
-    # Gps dataset
-    gdf = gpd.read_parquet(GPS_DATA_LABELED)
+def summarize_segment_traversals(gdf:pd.DataFrame)->pd.DataFrame:
+    # one row per (run, segment, route) traversal: entry/exit time, mean/max speed
+    # and the first GPS point as representative geometry (shapely objects or WKB, as given)
+    gdf = gdf.astype({key: "category" for key in SEGMENT_KEYS})
+    grouped = gdf.groupby(SEGMENT_KEYS, observed=True, sort=False)
+    summary = grouped.agg(utcTime=('utcTime', 'min'),
+                          utcTime_end=('utcTime', 'max'),
+                          speed=('speed', 'mean'),
+                          speed_max=('speed', 'max'))
+    first_ping = grouped['utcTime'].idxmin()
+    summary['geometry'] = gdf['geometry'].loc[first_ping.to_numpy()].to_numpy()
+    return summary.reset_index()
+
+def segment_durations_from_traversals(traversals:pd.DataFrame)->pd.DataFrame:
+    # duration of each traversal from its entry time to the entry of the next segment of the same run,
+    # the last segment of a run ends with its last GPS point
+    traversals = traversals.sort_values(['run', 'utcTime'])
+    next_entry = traversals.groupby('run', observed=True, sort=False)['utcTime'].shift(-1)
+    exit_time = next_entry.fillna(traversals['utcTime_end'])
+    return traversals.assign(duration=(exit_time - traversals['utcTime']).dt.total_seconds())
+
+def concat_segment_datasets(frames:List[pd.DataFrame])->pd.DataFrame:
+    # pd.concat that keeps categorical columns categorical (union of the categories)
+    frames = [df for df in frames if df is not None]
+    categorical = {col for df in frames for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    for col in categorical:
+        categories = pd.Index([])
+        for df in frames:
+            if col in df.columns:
+                categories = categories.union(df[col].astype('category').cat.categories)
+        frames = [df.assign(**{col: pd.Categorical(df[col] if col in df.columns else [np.nan] * len(df), categories=categories)}) for df in frames]
+    out = pd.concat(frames, ignore_index=True)
+    out.attrs = dict(frames[0].attrs) if frames else {}
+    return out
+
+def compact_segment_dataset(df:pd.DataFrame, crs=None)->pd.DataFrame:
+    # long-lived in-memory form of the segment dataset: categorical segment/route, integer run ids,
+    # datetime64 times, float32 measurements and geometry as WKB in an Arrow column
+    # (shapely objects are built on demand with segment_geometries)
+    df = df.copy()
+    for col in ['segment', 'route']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if 'run' in df.columns:
+        run = pd.to_numeric(df['run'], errors='coerce')
+        if run.notna().all() and (run % 1 == 0).all():
+            df['run'] = pd.to_numeric(run.astype(np.int64), downcast='integer')
+        else:
+            df['run'] = df['run'].astype('category')
+    for col in ['utcTime', 'utcTime_end']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    for col in ['duration', 'speed', 'speed_max']:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    if 'geometry' in df.columns and not isinstance(df['geometry'].dtype, pd.ArrowDtype):
+        geoms = df['geometry'].to_numpy()
+        geoms = np.where(pd.isna(geoms), None, geoms)
+        # shapely objects, or WKB bytes when read back from parquet
+        if not any(isinstance(g, bytes) for g in geoms[:1000]):
+            geoms = shapely.to_wkb(geoms)
+        df['geometry'] = pd.Series(pd.arrays.ArrowExtensionArray(pa.array(geoms, type=pa.binary())), index=df.index)
+    df.attrs['crs'] = crs_string(crs)
+    return df
+
+def segment_geometries(df:pd.DataFrame)->gpd.GeoSeries:
+    # shapely geometries of (a subset of) the compact segment dataset, or of its shared form with x / y coordinates
+    if 'geometry' not in df.columns:
+        x, y = df['x'].to_numpy(dtype=np.float64), df['y'].to_numpy(dtype=np.float64)
+        points = np.where(np.isnan(x) | np.isnan(y), None, shapely.points(x, y))
+        return gpd.GeoSeries(points, index=df.index, crs=df.attrs.get('crs'))
+    wkb = df['geometry'].to_numpy(dtype=object, na_value=None)
+    return gpd.GeoSeries.from_wkb(wkb, index=df.index, crs=df.attrs.get('crs'))
+
+def memory_report(df:pd.DataFrame)->pd.Series:
+    # bytes per column, shapely geometries counted with their WKB size as GEOS memory is not visible to pandas
+    report = df.memory_usage(deep=True, index=True)
+    for col in df.columns:
+        if df[col].dtype == object and len(df) > 0 and isinstance(df[col].iloc[0], shapely.Geometry):
+            report[col] += sum(len(wkb) for wkb in shapely.to_wkb(df[col].dropna().to_numpy()))
+    return report
+
+def fetch_filtered_segment_data(gps_path:str = GPS_DATA_LABELED,
+                                segment_path:str = SEGMENT_DURATION_PATH,
+                                route:Optional[str] = None)->pd.DataFrame:
+    # Gps dataset, only the columns needed for the traversal summary (all routes when route is None).
+    # The geometry stays WKB, only the first ping of each traversal is kept and nothing is decoded
+    gdf = read_parquet_dataset(gps_path, columns=GPS_COLUMNS, route=route, arrow_backed=False, decode_geometry=False)
+    gdf_crs = gdf.attrs.get('crs')
     gdf = gdf.reset_index()
 
     # duration in each segment
-    df_segment = pd.read_parquet(SEGMENT_DURATION_PATH)
+    df_segment = read_parquet_dataset(segment_path, route=route, arrow_backed=False)
     df_segment = df_segment.reset_index()
-    bus_stop_mapping = {
-            'haltestelle_geibelstrase': ['Geibelstraße,2', 'Geibelstraße,1'],
-            'haltestelle_kurt-huber-strase': ['Kurt-Huber-Straße,1', 'Kurt-Huber-Straße,2', 'Kurt-Huber-Straße,4'],
-            'haltestelle_uhlandstrase': ['Uhlandstraße,1', 'Uhlandstraße,2'],
-            'haltestelle_stadtwerk-continental': ['Stadtwerke / Continental,1', 'Stadtwerke / Continental,2', 'Stadtwerke / Continental,3', 'Stadtwerke / Continental,4'],
-            'haltestelle_kornerstrase': ['Körnerstraße,2'],
-            'haltestelle_marienplatz-ersatz': ['Marienplatz,1', 'Marienplatz,2'],
-            'haltestelle_feldschlosl': ['Feldschlößl,1', 'Feldschlößl,2'],
-            'haltestelle_theodor-heuss-brucke': ['Theodor-Heuss-Brücke,1', 'Theodor-Heuss-Brücke,2'],
-            'haltestelle_theodor-heuss-strase': ['Theodor-Heuss-Straße,1', 'Theodor-Heuss-Straße,2'],
-            'haltestelle_gutenbergstrase': ['Gutenbergstraße,99'],
-            'haltestelle_marienplatz': [],
-            'haltestelle_schellingstrase': ['Schellingstraße,1', 'Schellingstraße,1']
-        }
-
-    # map segment values to the respective key in value_map_dict
-    segment_mapping_dict = {value: key for key, values in bus_stop_mapping.items() for value in values}
-    df_segment['segment'] = df_segment['segment'].replace(segment_mapping_dict)
-    merged_df = pd.merge(df_segment, gdf[['run', 'segment', 'route', 'geometry', 'utcTime', 'speed']], on=['run', 'segment', 'route'])
-
-    df_segment['geometry'] = merged_df['geometry']
-    df_segment['utcTime'] = merged_df['utcTime']
-    df_segment['speed'] = merged_df['speed']
-
-    return df_segment
+
+    # map segment values to the respective key in the bus stop mapping of their route
+    df_segment['segment'] = map_bus_stop_segments(df_segment)
+
+    # reduce the GPS points to one row per traversal before joining, so the merge stays per segment traversal
+    traversals = summarize_segment_traversals(gdf[GPS_COLUMNS])
+    del gdf
+    df_segment = df_segment.merge(traversals, on=SEGMENT_KEYS, how='left', validate='many_to_one')
+
+    return compact_segment_dataset(df_segment, crs=gdf_crs)
 
 
 def create_custom_stop_lines_angle(stop_line_name):
@@ -279,113 +526,466 @@ def create_angle_line(x, y, angle, line_length=0.001):
     return line_x, line_y
 
 
-''' PLOT FUNCTIONS '''
+# zoom levels with precomputed simplified road paths, simplified to half a pixel at that zoom
+LOD_ZOOM_LEVELS = (11, 13, 15, 17)
+
+def degrees_per_pixel(zoom:float, lat:float = 48.772619)->float:
+    # web mercator pixel size (256 px tiles) in degrees of latitude, the smaller side of a pixel
+    return 360 / (256 * 2 ** zoom) * np.cos(np.deg2rad(lat))
+
+def lod_tolerance(zoom:float)->float:
+    # simplification tolerance of the coarsest level that is still sub-pixel at the requested zoom,
+    # 0 (full resolution) beyond the finest level
+    levels = [level for level in LOD_ZOOM_LEVELS if level >= zoom]
+    if len(levels) == 0:
+        return 0.0
+    return 0.5 * degrees_per_pixel(min(levels))
+
+# simplification tolerance of each level of detail, 0 keeps the full geometry
+LOD_TOLERANCES = tuple(lod_tolerance(zoom) for zoom in LOD_ZOOM_LEVELS) + (0.0,)
+
+def zoom_for_extent(bounds:tuple, width_px:int = 1200, height_px:int = 1200)->float:
+    # map zoom at which (minx, miny, maxx, maxy) fills the given pixel size
+    minx, miny, maxx, maxy = bounds
+    lat = (miny + maxy) / 2
+    zoom_x = np.log2(360 * width_px / (256 * max(maxx - minx, 1e-9)))
+    zoom_y = np.log2(360 * np.cos(np.deg2rad(lat)) * height_px / (256 * max(maxy - miny, 1e-9)))
+    return float(min(zoom_x, zoom_y))
+
+def geometry_bounds(route_geometry:pd.DataFrame)->tuple:
+    # (minx, miny, maxx, maxy) of the render-ready coordinates
+    lon, lat = np.concatenate(route_geometry["lon"].to_list()), np.concatenate(route_geometry["lat"].to_list())
+    return float(np.nanmin(lon)), float(np.nanmin(lat)), float(np.nanmax(lon)), float(np.nanmax(lat))
+
+def segment_kind(segment:str)->str:
+    if segment.startswith('road_path'):
+        return 'road_path'
+    elif segment.startswith('stop_lines'):
+        return 'stop_lines'
+    elif segment.startswith('haltestelle'):
+        return 'haltestelle'
+    return ''
+
+
+def _prepare_split_path_geometry(gdf_route_path:gpd.GeoDataFrame,
+                                 segments:tuple,
+                                 route:str = "101")->pd.DataFrame:
+    gdf_route_path = gdf_route_path.rename(index=route_bus_stop_reverse_mapping(route))
+    gdf_route_path = gdf_route_path.drop([segment for segment in gdf_route_path.index if segment not in segments])
+    gdf_route_path = process_dataframe(gdf_route_path)
 
-def plot_NewMindFresh(gdf_list, 
-                      df_deviation:Optional[pd.DataFrame] = None,
-                      split_path:Union[str,gpd.GeoDataFrame] = SPLIT_ROUTE_101_PATH,
-                      lw:int = 20
-                      ):
-    fig = go.Figure()
+    # for proper display in map, we need in a sorted index
+    # indices starting with "road_path", "stop_lines", and "haltestelle"
+    kinds = {idx: segment_kind(idx) for idx in gdf_route_path.index}
+    sorted_indices = [idx for kind in ('road_path', 'stop_lines', 'haltestelle') for idx in gdf_route_path.index if kinds[idx] == kind]
+    gdf_route_path = gdf_route_path.reindex(sorted_indices).to_crs(CRS_O)
+
+    rows = []
+    for index, linestring in gdf_route_path.geometry.items():
+        x, y = linestring.xy
+        row = dict(segment=index, kind=kinds[index], label="", label_lon=np.nan, label_lat=np.nan)
+        if row["kind"] == 'road_path':
+            row["lon"], row["lat"] = np.asarray(x), np.asarray(y)
+        elif row["kind"] == 'stop_lines':
+            custom_angle, line_length = create_custom_stop_lines_angle(index)
+            line_x, line_y = create_angle_line(x, y, custom_angle, line_length)
+            row["lon"], row["lat"] = np.asarray(line_x), np.asarray(line_y)
+        else:
+            midpoint_x = (x[0] + x[-1]) / 2
+            midpoint_y = (y[0] + y[-1]) / 2
+            row["lon"], row["lat"] = np.array([midpoint_x]), np.array([midpoint_y])
+            row["label_lon"], row["label_lat"] = custom_haltestelle_text_location(index, midpoint_x, midpoint_y)
+            name = route_bus_stop_mapping(route).get(index.lower(), [])
+            row["label"] = name[0] if len(name) > 0 else ""
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["segment", "kind", "lon", "lat", "label", "label_lon", "label_lat"]).set_index("segment")
+
+
+def _simplify_road_paths(route_geometry:pd.DataFrame, tolerance:float)->pd.DataFrame:
+    # level of detail, only road paths are simplified (stop lines and stops are placed at the
+    # midpoint of the full geometry). Shared segment endpoints are kept, so no gaps open up
+    positions = np.flatnonzero((route_geometry["kind"] == "road_path").to_numpy())
+    if tolerance <= 0 or len(positions) == 0:
+        return route_geometry
+    lon, lat = route_geometry["lon"].to_numpy(copy=True), route_geometry["lat"].to_numpy(copy=True)
+    lines = shapely.linestrings([np.column_stack([lon[p], lat[p]]) for p in positions])
+    for p, line in zip(positions, shapely.simplify(lines, tolerance, preserve_topology=True)):
+        coords = shapely.get_coordinates(line)
+        lon[p], lat[p] = coords[:, 0], coords[:, 1]
+    return route_geometry.assign(lon=lon, lat=lat)
+
+
+def _geometry_levels(route_geometry:pd.DataFrame)->dict:
+    # the route geometry simplified once per level of detail, rendering only picks a level
+    return {tolerance: _simplify_road_paths(route_geometry, tolerance) for tolerance in LOD_TOLERANCES}
+
+
+def _select_level(levels:dict, tolerance:float)->pd.DataFrame:
+    if tolerance in levels:
+        return levels[tolerance]
+    return _simplify_road_paths(levels[0.0], tolerance)
+
+
+def write_route_geometry(route_geometry:pd.DataFrame, path:str, split_path:str)->None:
+    # the prepared geometry together with the version of the split route file it was built from
+    table = pa.Table.from_pandas(route_geometry)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SPLIT_VERSION_KEY] = json.dumps(file_version(split_path)).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+
+@lru_cache(maxsize=8)
+def _load_route_geometry_levels(path:str, version:tuple)->tuple:
+    # (levels of detail, version of the split route file the geometry was built from)
+    table = pq.read_table(path)
+    split_version = (table.schema.metadata or {}).get(SPLIT_VERSION_KEY)
+    return _geometry_levels(table.to_pandas()), None if split_version is None else tuple(json.loads(split_version))
+
+
+@lru_cache(maxsize=32)
+def _load_split_path_geometry_levels(path:str, version:tuple, segments:tuple, route:str)->dict:
+    count("split_path_geometry_misses")
+    with span("prepare_split_path_geometry"):
+        return _geometry_levels(_prepare_split_path_geometry(gpd.read_parquet(path), segments, route))
+
+
+def prepare_split_path_geometry(split_path:Union[str,gpd.GeoDataFrame],
+                                segments,
+                                route:str = "101",
+                                tolerance:float = 0.0)->pd.DataFrame:
+    # render-ready, projected coordinates per segment (kind, lon/lat arrays, stop label).
+    # Independent of the user filters, so for files every level of detail (LOD_TOLERANCES) is
+    # precomputed once per file version and segment set
+    segments = tuple(sorted(set(segments)))
+    if isinstance(split_path,str):
+        count("split_path_geometry_calls")
+        split_version = file_version(split_path)
+        geometry_path = ROUTE_GEOMETRY_PATHS.get(route)
+        if geometry_path is not None and os.path.exists(geometry_path):
+            # prepared by routes.py for the segments of the route data, used only while the split route
+            # file is unchanged. The stop splitting depends on the segment set, so also only for that set
+            levels, prepared_version = _load_route_geometry_levels(geometry_path, file_version(geometry_path))
+            if prepared_version == split_version and tuple(sorted(levels[0.0].index)) == segments:
+                return _select_level(levels, tolerance)
+        return _select_level(_load_split_path_geometry_levels(split_path, split_version, segments, route), tolerance)
+    return _simplify_road_paths(_prepare_split_path_geometry(split_path, segments, route), tolerance)
 
-    if not isinstance(gdf_list,list):
-        gdf_list = [gdf_list]
-    # print(gdf_list[0].head(10))
-    ##### Plot the split path
-    if split_path is not None:
-        plot_add_split_path(fig,gdf_list,df_deviation,split_path,lw)
+
+''' PLOT FUNCTIONS '''
+
+# initial map view when the figure has no route geometry to fit
+MAP_CENTER = {'lon': 11.441815, 'lat': 48.772619}
+MAP_ZOOM = 13.5
+MAP_HEIGHT_PX = 1200
+
+def build_NewMindFresh_figure(gdf_list,
+                              df_deviation:Optional[pd.DataFrame] = None,
+                              split_path:Union[str,gpd.GeoDataFrame] = SPLIT_ROUTE_101_PATH,
+                              lw:int = 20,
+                              batched:bool = True,
+                              route:str = "101",
+                              zoom:Optional[float] = None, # None fits the map to the route
+                              palette:Optional[Sequence[str]] = None # see add_split_path_batched
+                              )->go.Figure:
+    with span("figure_build"):
+        fig = go.Figure()
+
+        if not isinstance(gdf_list,list):
+            gdf_list = [gdf_list]
+        # print(gdf_list[0].head(10))
+        ##### Plot the split path
+        view = dict(center=MAP_CENTER, zoom=MAP_ZOOM if zoom is None else zoom)
+        if split_path is not None:
+            fitted = plot_add_split_path(fig,gdf_list,df_deviation,split_path,lw,batched,route,
+                                         None if zoom is None else lod_tolerance(zoom),palette)
+            if zoom is None:
+                view = fitted
 
     fig.update_layout(width=None,
                         # autosize=True,
-                        height=1200,
+                        height=MAP_HEIGHT_PX,
                         margin={'l': 0, 't': 0, 'b': 0, 'r': 0},
                         legend = dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
                         # annotations=annotations,
                         mapbox={
                             'style': "carto-positron", # "white-bg", # "open-street-map",
-                            'center': {'lon': 11.441815, 'lat': 48.772619},
-                            'zoom': 13.5}, showlegend=False)
+                            'center': view['center'],
+                            'zoom': view['zoom']}, showlegend=False)
+    return fig
+
+def plot_NewMindFresh(gdf_list, 
+                      df_deviation:Optional[pd.DataFrame] = None,
+                      split_path:Union[str,gpd.GeoDataFrame] = SPLIT_ROUTE_101_PATH,
+                      lw:int = 20,
+                      batched:bool = True,
+                      route:str = "101",
+                      zoom:Optional[float] = None
+                      ):
+    fig = build_NewMindFresh_figure(gdf_list, df_deviation, split_path, lw, batched, route, zoom)
 
     # Display the plot within Streamlit
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
+
+# chart titles of the segment_stats.METRICS
+METRIC_TITLES = {"mean": "Average Duration", "median": "Median Duration", "p85": "85th Percentile Duration",
+                 "p95": "95th Percentile Duration", "var": "Duration Variance"}
+
+def _metric_values(table:pd.DataFrame, metric:str, name_col:str)->tuple:
+    # chart values and bar labels of metric, the rounded mean and its labels as before for "mean"
+    if metric == "mean":
+        return table['duration'], table['text']
+    values = table[metric].astype(np.float64).round(2)
+    return values, duration_labels(table[name_col], values, _metric_unit(metric))
+
+def _metric_unit(metric:str)->str:
+    return "seconds²" if metric == "var" else "seconds"
+
+def build_dashboard_figures(avg_duration_per_segment:pd.DataFrame,
+                            segment_type_avg_duration:pd.DataFrame,
+                            metric:str = "mean")->List[go.Figure]:
+    # the Armaturenbrett charts from the tables of aggregates.build_dashboard_aggregates, any of their
+    # metric columns can be shown without recomputing them
+    title = METRIC_TITLES[metric]
+    segment_values, segment_text = _metric_values(avg_duration_per_segment, metric, 'segment')
+    type_values, type_text = _metric_values(segment_type_avg_duration, metric, 'segment_type')
+
+    ''' Per Segment - Bar Plot '''
+    # Create a Plotly bar trace
+    bar_trace = go.Bar(
+        x=segment_values,
+        y=avg_duration_per_segment['segment'],
+        orientation='h',
+        marker=dict(color='skyblue'),  # Set bar color
+        text=segment_text,  # Customize hover text,       # Display the average duration as text on the bars
+        textposition='auto',           # Automatically position the text on the bars
+    )
+    # Create a Plotly layout
+    layout = go.Layout(
+        title=f'{title} By Segment',
+        xaxis=dict(title=f'{title} ({_metric_unit(metric)})'),
+        yaxis=dict(title='Segment', tickmode='array', dtick=1),  # Display every tick),
+        height=1500,  # Adjust the height of the chart
+        width=2000,  # Adjust the width of the chart
+    )
+    # Create a Plotly figure
+    segment_fig = go.Figure(data=[bar_trace], layout=layout)
+
+    ''' Per Segment Type - Bar Plot'''
+    # Create a Plotly bar trace
+    bar_trace = go.Bar(
+        x=type_values,
+        y=segment_type_avg_duration['segment_type'],
+        orientation='h',
+        marker=dict(color='skyblue'),  # Set bar color
+        text=type_text,  # Customize hover text,       # Display the average duration as text on the bars
+        textposition='auto',           # Automatically position the text on the bars
+    )
+    # Create a Plotly layout
+    layout = go.Layout(
+        title=f'{title} By Segment Type',
+        xaxis=dict(title=f'{title} ({_metric_unit(metric)})'),
+        yaxis=dict(title='Segment', tickmode='array', dtick=1),  # Display every tick),
+        height=300,  # Adjust the height of the chart
+        width=1500,  # Adjust the width of the chart
+    )
+    # Create a Plotly figure
+    segment_type_fig = go.Figure(data=[bar_trace], layout=layout)
+
+    ''' Per Segment Type - PI Chart'''
+    # Create a Plotly pie chart trace
+    pie_trace = go.Pie(
+        labels=segment_type_avg_duration['segment_type'],
+        values=type_values,
+    )
+    # Create a Plotly layout
+    layout = go.Layout(
+        title=f'{title} By Segment Type',
+    )
+    # Create a Plotly figure
+    segment_type_pie = go.Figure(data=[pie_trace], layout=layout)
+    return [segment_fig, segment_type_fig, segment_type_pie]
+
+TREND_TITLES = {"mean": "Average Duration", "std": "Duration Standard Deviation", "count": "Traversals"}
+
+def build_trend_figure(trend:pd.DataFrame,
+                       window:int,
+                       metric:str = "mean",
+                       marker_date:Optional[datetime.date] = None)->go.Figure:
+    # one line per column of trends.SegmentTrends.trend, optionally with a vertical line at marker_date
+    # (e.g. the start of a construction site)
+    title = TREND_TITLES[metric]
+    fig = go.Figure(data=[go.Scatter(x=trend.index, y=trend[column], mode='lines', name=str(column)) for column in trend.columns],
+                    layout=go.Layout(
+                        title=f'{title}, Rolling {window} Days',
+                        xaxis=dict(title='Date'),
+                        yaxis=dict(title=title if metric == "count" else f'{title} (seconds)'),
+                        height=500,
+                    ))
+    if marker_date is not None:
+        fig.add_vline(x=pd.Timestamp(marker_date).timestamp() * 1000, line_dash='dash', line_color='gray')
+    return fig
+
+def rgb_strings(rgba:pd.Series)->np.ndarray:
+    # "rgb(r, g, b)" per rgba tuple, formatted once per distinct colour and gathered with the codes
+    codes, colors = pd.factorize(rgba.to_numpy(dtype=object))
+    return np.array([f"rgb{tuple(color)[:-1]}" for color in colors], dtype=object)[codes]
 
 def plot_add_split_path(fig:go.Figure,
                         gdf_list:gpd.GeoDataFrame,
                         df_deviation:Optional[pd.DataFrame],
                         split_path:Union[str,gpd.GeoDataFrame] = SPLIT_ROUTE_101_PATH,
                         lw:int=20,#line width
-                        )->None:
+                        batched:bool=True, # merge segments into a handful of traces
+                        route:str="101",
+                        tolerance:Optional[float]=None, # simplification of the road paths, see lod_tolerance
+                        palette:Optional[Sequence[str]]=None, # batched traces recoloured in the browser
+                        )->dict:
+    # returns the map view (center, zoom) that fits the route, when tolerance is None its level
+    # of detail is picked for that zoom
     ##### Plot the split path
-    if isinstance(split_path,str):
-        gdf_route101_path = gpd.read_parquet(split_path)
-    else:
-        gdf_route101_path = split_path
-
-    segments = list(set([segment for gdf in gdf_list for segment in gdf["segment"].unique()]))
-    gdf_route101_path = gdf_route101_path.rename(index=bus_stop_reverse_mapping)
-    gdf_route101_path.drop([segment for segment in gdf_route101_path.index if segment not in segments],inplace=True)
-    gdf_route101_path = process_dataframe(gdf_route101_path)
-
-    # for proper display in map, we need in a sorted index
-    # indices starting with "road_path", "stop_lines", and "haltestelle"
-    road_path_indices = [idx for idx in gdf_route101_path.index if idx.startswith('road_path')]
-    stop_lines_indices = [idx for idx in gdf_route101_path.index if idx.startswith('stop_lines')]
-    haltestelle_indices = [idx for idx in gdf_route101_path.index if idx.startswith('haltestelle')]
-    sorted_indices = road_path_indices + stop_lines_indices + haltestelle_indices
-    gdf_route101_path = gdf_route101_path.reindex(sorted_indices)
-
-    for index,row in gdf_route101_path.to_crs(CRS_O).iterrows():
-        x, y = row.geometry.xy
-        midpoint_x = (x[0] + x[-1]) / 2
-        midpoint_y = (y[0] + y[-1]) / 2
-
-        r = df_deviation.loc[index]
-        
-        if "road_path" in index.lower():
-            fig = fig.add_trace(go.Scattermapbox(
+    segments = set([segment for gdf in gdf_list for segment in gdf["segment"].unique()])
+    minx, miny, maxx, maxy = geometry_bounds(prepare_split_path_geometry(split_path, segments, route))
+    view = dict(center={'lon': (minx + maxx) / 2, 'lat': (miny + maxy) / 2},
+                zoom=zoom_for_extent((minx, miny, maxx, maxy), MAP_HEIGHT_PX, MAP_HEIGHT_PX))
+    if tolerance is None:
+        tolerance = lod_tolerance(view['zoom'])
+    route_geometry = prepare_split_path_geometry(split_path, segments, route, tolerance)
+
+    # only the colors depend on the filters, join them onto the cached geometry
+    r = df_deviation.loc[route_geometry.index]
+    route_geometry = route_geometry.assign(color=rgb_strings(r["rgba"]),
+                                           text=np.char.mod("Deviation: %.2f", r["deviation"].to_numpy(dtype=np.float64)))
+
+    if batched:
+        add_split_path_batched(fig, route_geometry, lw, palette)
+        return view
+
+    for index,row in route_geometry.iterrows():
+        if row.kind == "road_path" or row.kind == "stop_lines":
+            fig.add_trace(go.Scattermapbox(
                     name= index,
+                    meta = index, # segment of the trace, for recolouring in the browser (client_filter.py)
                     mode = "lines",
-                    lon = list(x),
-                    lat = list(y),
-                    text = f"Deviation: {r.deviation:.2f}",
-                    line=dict(width=lw,color = f"rgb{r.rgba[:-1]}"),
+                    lon = list(row.lon),
+                    lat = list(row.lat),
+                    text = row.text,
+                    line=dict(width=lw,color = row.color),
                     hoverinfo="text"))
-        elif 'stop_lines' in index.lower():
-            custom_angle, line_length = create_custom_stop_lines_angle(index)
-            line_x, line_y = create_angle_line(x, y, custom_angle, line_length)
-            fig.add_trace(go.Scattermapbox(
-                name=index,
-                mode="lines",
-                lon=line_x,
-                lat=line_y,
-                text=f"Deviation: {r.deviation:.2f}",
-                hoverinfo="text",
-                line=dict(width=lw, color=f"rgb{r.rgba[:-1]}"))
-            )
-        elif 'haltestelle' in index.lower():
-            updated_lat, updated_lon = custom_haltestelle_text_location(index, midpoint_x, midpoint_y)
-            name = bus_stop_mapping.get(index.lower(), [])
-            if len(name) > 0:
-                name = name[0]
-            else:
-                name = ""
+        elif row.kind == "haltestelle":
             # Add the bus stop marker with hover text
             fig.add_trace(go.Scattermapbox(
-                name=name,
+                name=row.label,
+                meta=index,
                 mode="markers",
-                lon=[midpoint_x],
-                lat=[midpoint_y],
-                marker=dict(size=30, color = f"rgb{r.rgba[:-1]}", symbol="circle"),
-                text=f"Deviation: {r.deviation:.2f}",
+                lon=list(row.lon),
+                lat=list(row.lat),
+                marker=dict(size=30, color = row.color, symbol="circle"),
+                text=row.text,
                 hoverinfo="text"
             ))
             fig.add_trace(go.Scattermapbox(
-                name=f"text_{name}",
+                name=f"text_{row.label}",
                 mode="text",
-                lon=[updated_lat],
-                lat=[updated_lon],  # Slightly offset to place text above the circle
-                text=[f"{name}\n\u200b"],  # Use Unicode for vertical orientation
+                lon=[row.label_lon],
+                lat=[row.label_lat],  # Slightly offset to place text above the circle
+                text=[f"{row.label}\n\u200b"],  # Use Unicode for vertical orientation
                 textfont=dict(size=12, color="black"),  # Customize the text font
                 showlegend=False  # Hide legend for text
             ))
-
+    return view
+
+
+def _join_parts(lons, lats):
+    # concatenate parts into one trace, NaN after each part breaks the line in the map
+    lon = np.concatenate([np.append(x, np.nan) for x in lons])
+    lat = np.concatenate([np.append(y, np.nan) for y in lats])
+    return lon, lat
+
+
+def _add_lines_by_color(fig, route_geometry, lw, name, palette=None):
+    # line color can not vary inside a Scattermapbox trace, so one trace per distinct color.
+    # The lines carry no hover text, see _add_hover_points. With a palette there is one trace per
+    # palette color, also when empty, and every vertex has the segment position in customdata, so the
+    # browser can move segments to the trace of their new color
+    colors = route_geometry["color"].unique() if palette is None else palette
+    for color in colors:
+        group = route_geometry[route_geometry["color"] == color]
+        lon, lat = _join_parts(group["lon"], group["lat"]) if len(group) > 0 else (np.array([]), np.array([]))
+        trace = dict(name=name, mode="lines", lon=lon, lat=lat, hoverinfo="skip", line=dict(width=lw, color=color))
+        if palette is not None:
+            trace["customdata"] = np.repeat(group["position"].to_numpy(), [len(x) + 1 for x in group["lon"]])
+        fig.add_trace(go.Scattermapbox(**trace))
+
+
+# distance between the hover points of a line (degrees), a few pixels at the default zoom, so the
+# pointer finds one within plotly's hover distance anywhere along the line
+HOVER_POINT_SPACING = 0.0005
+
+def _hover_points(lons, lats, spacing:float = HOVER_POINT_SPACING)->tuple:
+    # points evenly spaced along each line, at most spacing apart and at least one (the middle) per
+    # line, with the position of their line
+    lines = shapely.linestrings([np.column_stack([x, y]) if len(x) > 1 else np.column_stack([x, y]).repeat(2, axis=0)
+                                 for x, y in zip(lons, lats)])
+    lengths = shapely.length(lines)
+    counts = np.maximum(np.ceil(lengths / spacing), 1).astype(np.int64)
+    owner = np.repeat(np.arange(len(lines)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    coords = shapely.get_coordinates(shapely.line_interpolate_point(lines[owner], (offset + 0.5) * lengths[owner] / counts[owner]))
+    return coords[:, 0], coords[:, 1], owner
+
+
+def _add_hover_points(fig, route_geometry, lw, name, palette=None):
+    # invisible markers with the hover text spaced along each line segment, instead of repeating the
+    # text for every vertex of the batched lines
+    if len(route_geometry) == 0:
+        return
+    lon, lat, owner = _hover_points(route_geometry["lon"], route_geometry["lat"])
+    trace = dict(name=name,
+                 mode="markers",
+                 lon=lon,
+                 lat=lat,
+                 marker=dict(size=lw, opacity=0),
+                 text=route_geometry["text"].to_numpy()[owner].tolist(),
+                 hoverinfo="text",
+                 showlegend=False)
+    if palette is not None:
+        trace["customdata"] = route_geometry["position"].to_numpy()[owner]
+    fig.add_trace(go.Scattermapbox(**trace))
+
+
+def add_split_path_batched(fig:go.Figure,
+                           route_geometry:pd.DataFrame,
+                           lw:int=20,
+                           palette:Optional[Sequence[str]]=None)->None:
+    # same picture as the per-segment traces of plot_add_split_path, drawn with few traces:
+    # road paths and stop lines grouped by color, all bus stop markers and labels in one trace each.
+    # Keeps the drawing order of the per-segment version: roads, stop lines, stops, labels.
+    # palette: every color the browser may recolour to (client_filter.py). The segments are then listed
+    # in the layout meta and every point carries its segment position in customdata
+    if palette is not None:
+        route_geometry = route_geometry.assign(position=np.arange(len(route_geometry)))
+        fig.update_layout(meta={"segments": route_geometry.index.to_list()})
+    _add_lines_by_color(fig, route_geometry[route_geometry["kind"] == "road_path"], lw, "road_path", palette)
+    _add_lines_by_color(fig, route_geometry[route_geometry["kind"] == "stop_lines"], lw, "stop_lines", palette)
+    _add_hover_points(fig, route_geometry[route_geometry["kind"] != "haltestelle"], lw, "segment_hover", palette)
+    stops = route_geometry[route_geometry["kind"] == "haltestelle"]
+    if len(stops) > 0:
+        trace = dict(name="haltestelle",
+                     mode="markers",
+                     lon=np.concatenate(stops["lon"].to_list()),
+                     lat=np.concatenate(stops["lat"].to_list()),
+                     marker=dict(size=30, color=stops["color"].to_list(), symbol="circle"),
+                     text=stops["text"].to_list(),
+                     hoverinfo="text")
+        if palette is not None:
+            trace["customdata"] = stops["position"].to_numpy()
+        fig.add_trace(go.Scattermapbox(**trace))
+        fig.add_trace(go.Scattermapbox(
+            name="haltestelle_text",
+            mode="text",
+            lon=stops["label_lon"].to_numpy(),
+            lat=stops["label_lat"].to_numpy(),
+            text=[f"{label}\n\u200b" for label in stops["label"]],
+            textfont=dict(size=12, color="black"),
+            showlegend=False
+        ))